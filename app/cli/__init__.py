@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 18:05
+@Author : YangFei
+@File   : __init__.py
+@Desc   : 命令行工具
+"""
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 18:05
+@Author : YangFei
+@File   : embed.py
+@Desc   : 离线批量向量化：遍历图像目录或读取 JSONL/CSV 文本，输出内存映射的 .npy 向量矩阵与 id 文件，支持断点续跑
+
+用法:
+    python -m app.cli.embed ./images --output ./out/images --model-type base
+    python -m app.cli.embed ./corpus.jsonl --output ./out/corpus --text-field content
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from cn_clip.clip.utils import image_transform
+
+from core.cn_clip import ChineseCLIP
+from core.image_decode import load_image
+from core.log_config import setup_logging
+from app.services.clip_vector import ClipVectorService
+
+logger = logging.getLogger(__name__)
+
+# 目录模式下识别的图像扩展名
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+MODALITY_TEXT = "text"
+MODALITY_IMAGE = "image"
+
+# 解码进程内的预处理器与输入分辨率，由进程池的 initializer 创建
+_preprocess = None
+_resolution = 0
+
+
+def _init_decode_worker(resolution: int):
+    """ 解码进程初始化：创建预处理器，限制单进程的计算线程数，避免与推理争抢 CPU """
+    global _preprocess, _resolution
+    torch.set_num_threads(1)
+    _preprocess = image_transform(resolution)
+    _resolution = resolution
+
+
+def _decode_image(path: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """ 在解码进程中读取并预处理图像，返回 (预处理后的数组, 错误信息) """
+    try:
+        return load_image(path, _preprocess, _resolution).numpy(), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def read_items(source: str, modality: Optional[str], id_field: str, text_field: str, image_field: str
+               ) -> Tuple[str, List[str], List[str]]:
+    """ 读取待向量化的条目
+    :return: (模态, id 列表, 文本或图像路径列表)
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    paths.append(os.path.join(root, name))
+        return MODALITY_IMAGE, [os.path.relpath(path, source) for path in paths], paths
+
+    extension = os.path.splitext(source)[1].lower()
+    with open(source, "r", encoding="utf-8", newline="") as f:
+        if extension == ".csv":
+            records = list(csv.DictReader(f))
+        elif extension in (".jsonl", ".ndjson"):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            raise ValueError(f"不支持的输入文件 {source}，只支持目录、.jsonl 与 .csv")
+
+    if modality is None:
+        modality = MODALITY_TEXT if not records or text_field in records[0] else MODALITY_IMAGE
+    field = text_field if modality == MODALITY_TEXT else image_field
+
+    ids, payloads = [], []
+    base_dir = os.path.dirname(os.path.abspath(source))
+    for line, record in enumerate(records, start=1):
+        value = record.get(field)
+        if value is None:
+            raise ValueError(f"第 {line} 条记录缺少字段 {field}")
+        ids.append(str(record.get(id_field, line)))
+        # 图像路径相对于输入文件所在的目录
+        payloads.append(value if modality == MODALITY_TEXT else os.path.join(base_dir, value))
+    return modality, ids, payloads
+
+
+class EmbedJob:
+    """ 离线批量向量化任务
+
+    输出文件（以 --output 为前缀）:
+    - {output}.npy: 内存映射的 float32 向量矩阵，行与 id 文件一一对应，失败的行为 0
+    - {output}.ids.txt: 每行一个 id
+    - {output}.checkpoint.json: 已完成的行数与失败条目，中断后再次运行从这里继续
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self._args = args
+        self._matrix_path = f"{args.output}.npy"
+        self._ids_path = f"{args.output}.ids.txt"
+        self._checkpoint_path = f"{args.output}.checkpoint.json"
+
+    def _load_checkpoint(self, expected: dict) -> Optional[dict]:
+        """ 读取检查点，输入或模型与本次运行不一致时拒绝续跑 """
+        if self._args.restart or not os.path.exists(self._checkpoint_path):
+            return None
+        with open(self._checkpoint_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        for key, value in expected.items():
+            if checkpoint.get(key) != value:
+                raise SystemExit(f"检查点 {self._checkpoint_path} 的 {key}={checkpoint.get(key)} 与本次运行的 {value} "
+                                 f"不一致，请使用 --restart 重新开始")
+        return checkpoint
+
+    def _save_checkpoint(self, matrix: np.memmap, checkpoint: dict):
+        """ 先落盘向量矩阵，再原子地写入检查点，保证检查点记录的行都已写入 """
+        matrix.flush()
+        tmp_path = f"{self._checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self._checkpoint_path)
+
+    async def run(self):
+        args = self._args
+        modality, ids, payloads = read_items(args.input, args.modality, args.id_field, args.text_field,
+                                             args.image_field)
+        total = len(ids)
+        if not total:
+            logger.warning(f"输入 {args.input} 中没有可处理的条目")
+            return
+
+        clip = ChineseCLIP()
+        await clip.init(args.model_type, args.model_dir)
+        service = ClipVectorService(clip)
+        model_key = clip.model_type
+        dimension = (await service.run_batch(model_key, MODALITY_TEXT, ["维度"])).shape[1]
+
+        expected = {
+            "input": os.path.abspath(args.input),
+            "modality": modality,
+            "namespace": clip.cache_namespace(model_key),
+            "count": total,
+            "dimension": dimension,
+        }
+        checkpoint = self._load_checkpoint(expected)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        if checkpoint is None:
+            checkpoint = {**expected, "done": 0, "failed": {}}
+            matrix = np.lib.format.open_memmap(self._matrix_path, mode="w+", dtype=np.float32,
+                                               shape=(total, dimension))
+            with open(self._ids_path, "w", encoding="utf-8") as f:
+                f.writelines(f"{item_id}\n" for item_id in ids)
+            self._save_checkpoint(matrix, checkpoint)
+        else:
+            matrix = np.lib.format.open_memmap(self._matrix_path, mode="r+")
+            logger.info(f"从检查点继续：已完成 {checkpoint['done']}/{total}")
+
+        start_index = checkpoint["done"]
+        try:
+            if modality == MODALITY_TEXT:
+                await self._run_text(service, model_key, payloads, matrix, checkpoint)
+            else:
+                resolution = clip.get_input_resolution(model_key)
+                await self._run_images(service, model_key, payloads, resolution, matrix, checkpoint)
+        finally:
+            self._save_checkpoint(matrix, checkpoint)
+            await clip.shutdown()
+
+        processed = checkpoint["done"] - start_index
+        logger.info(f"✅ 完成 {checkpoint['done']}/{total}，本次处理 {processed} 条，失败 {len(checkpoint['failed'])} 条，"
+                    f"输出 {self._matrix_path}")
+
+    def _batches(self, checkpoint: dict, total: int):
+        """ 从检查点开始的批次区间 """
+        return [(start, min(start + self._args.batch_size, total))
+                for start in range(checkpoint["done"], total, self._args.batch_size)]
+
+    def _commit_batch(self, matrix: np.memmap, checkpoint: dict, start: int, vectors: np.ndarray,
+                      errors: List[Optional[str]], batches_done: int, progress: "_Progress"):
+        """ 写入一个批次的结果，并按间隔保存检查点 """
+        matrix[start:start + len(vectors)] = vectors
+        for offset, error in enumerate(errors):
+            if error is not None:
+                checkpoint["failed"][str(start + offset)] = error
+        checkpoint["done"] = start + len(vectors)
+        if batches_done % self._args.checkpoint_every == 0:
+            self._save_checkpoint(matrix, checkpoint)
+        progress.update(len(vectors), checkpoint["done"])
+
+    async def _run_text(self, service: ClipVectorService, model_key: str, texts: List[str], matrix: np.memmap,
+                        checkpoint: dict):
+        """ 文本：按批推理，批内按长度分桶 """
+        progress = _Progress("条文本", checkpoint["done"], len(texts), self._args.log_interval)
+        for batches_done, (start, end) in enumerate(self._batches(checkpoint, len(texts)), start=1):
+            vectors = await service.run_batch(model_key, MODALITY_TEXT, texts[start:end])
+            self._commit_batch(matrix, checkpoint, start, vectors, [None] * (end - start), batches_done, progress)
+        progress.finish()
+
+    async def _run_images(self, service: ClipVectorService, model_key: str, paths: List[str], resolution: int,
+                          matrix: np.memmap, checkpoint: dict):
+        """ 图像：多进程解码预处理，提前提交后续批次，解码与推理重叠执行 """
+        progress = _Progress("张图像", checkpoint["done"], len(paths), self._args.log_interval)
+        batches = self._batches(checkpoint, len(paths))
+
+        with ProcessPoolExecutor(max_workers=self._args.workers, initializer=_init_decode_worker,
+                                 initargs=(resolution,)) as pool:
+            prefetched = deque()
+
+            def prefetch():
+                while len(prefetched) <= self._args.prefetch and len(prefetched) + done < len(batches):
+                    start, end = batches[len(prefetched) + done]
+                    prefetched.append([pool.submit(_decode_image, path) for path in paths[start:end]])
+
+            for done, (start, end) in enumerate(batches):
+                prefetch()
+                decoded = await asyncio.gather(*[asyncio.wrap_future(f) for f in prefetched.popleft()])
+
+                vectors = np.zeros((end - start, matrix.shape[1]), dtype=np.float32)
+                errors = [error for _, error in decoded]
+                valid = [i for i, (array, _) in enumerate(decoded) if array is not None]
+                if valid:
+                    tensors = [torch.from_numpy(decoded[i][0]) for i in valid]
+                    vectors[valid] = await service.run_batch(model_key, MODALITY_IMAGE, tensors)
+                for i, error in enumerate(errors):
+                    if error is not None:
+                        logger.warning(f"图像 {paths[start + i]} 处理失败: {error}")
+
+                self._commit_batch(matrix, checkpoint, start, vectors, errors, done + 1, progress)
+        progress.finish()
+
+
+class _Progress:
+    """ 进度与吞吐量报告 """
+
+    def __init__(self, unit: str, done: int, total: int, interval: float):
+        self._unit = unit
+        self._total = total
+        self._interval = interval
+        self._start = self._last_report = time.perf_counter()
+        self._start_done = done
+        self._processed = 0
+
+    def update(self, count: int, done: int):
+        self._processed += count
+        now = time.perf_counter()
+        if now - self._last_report >= self._interval:
+            self._last_report = now
+            rate = self._processed / (now - self._start)
+            eta = (self._total - done) / rate if rate else 0
+            logger.info(f"进度 {done}/{self._total}（{done / self._total:.1%}），{rate:.1f} {self._unit}/秒，"
+                        f"预计剩余 {eta / 60:.1f} 分钟")
+
+    def finish(self):
+        elapsed = time.perf_counter() - self._start
+        if self._processed:
+            logger.info(f"本次处理 {self._processed} {self._unit}，耗时 {elapsed:.1f}s，"
+                        f"平均 {self._processed / elapsed:.1f} {self._unit}/秒")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="离线批量向量化，输出内存映射的 .npy 向量矩阵与 id 文件")
+    parser.add_argument("input", help="图像目录，或 .jsonl/.csv 文件")
+    parser.add_argument("--output", required=True, help="输出文件前缀，生成 {output}.npy、{output}.ids.txt 与检查点")
+    parser.add_argument("--model-type", default="mini", help="使用的模型类型")
+    parser.add_argument("--model-dir", default="models/pretrained_weights", help="模型目录")
+    parser.add_argument("--modality", choices=[MODALITY_TEXT, MODALITY_IMAGE], default=None,
+                        help="JSONL/CSV 的模态，默认按首条记录是否包含文本字段判断")
+    parser.add_argument("--id-field", default="id", help="JSONL/CSV 的 id 字段，缺失时使用行号")
+    parser.add_argument("--text-field", default="text", help="JSONL/CSV 的文本字段")
+    parser.add_argument("--image-field", default="image", help="JSONL/CSV 的图像路径字段，相对于输入文件所在目录")
+    parser.add_argument("--batch-size", type=int, default=64, help="每个批次的条目数")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="图像解码进程数")
+    parser.add_argument("--prefetch", type=int, default=2, help="推理当前批次时提前解码的后续批次数")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="每隔多少个批次保存一次检查点")
+    parser.add_argument("--log-interval", type=float, default=10.0, help="进度报告间隔（秒）")
+    parser.add_argument("--restart", action="store_true", help="忽略已有的检查点，重新开始")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1 or args.workers < 1 or args.prefetch < 1 or args.checkpoint_every < 1:
+        parser.error("--batch-size、--workers、--prefetch、--checkpoint-every 必须大于 0")
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    setup_logging(log_level=logging.INFO)
+    args = parse_args(argv)
+    try:
+        asyncio.run(EmbedJob(args).run())
+    except KeyboardInterrupt:
+        logger.warning("任务已中断，再次运行相同的命令即可从检查点继续")
+
+
+if __name__ == "__main__":
+    main()
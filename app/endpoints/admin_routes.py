@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 23:30
+@Author : YangFei
+@File   : admin_routes.py
+@Desc   : 管理路由：模型热切换
+"""
+import logging
+import os
+from fastapi import APIRouter, HTTPException, Depends
+
+from app.schemas.base import Response
+from app.schemas.admin import ModelSwapRequest
+from app.service_dependencies import get_vector_service, require_admin
+from core.config import SWAP_POLL_INTERVAL
+from core.exceptions import AppException
+from core.swap_requests import get_swap_requests
+
+logger = logging.getLogger(__name__)
+
+
+# 创建路由，需要在请求头 X-Admin-Token 中携带 CLIP_ADMIN_TOKEN；未配置令牌时管理接口不启用
+admin_router = APIRouter(prefix="/admin", tags=["管理模块"], dependencies=[Depends(require_admin)])
+
+
+@admin_router.post(
+    "/models/swap",
+    response_model=Response,
+    summary="模型热切换",
+    description="发布热切换请求，全部工作进程在轮询到请求后各自在后台加载并预热新的模型实例，就绪后原子替换，"
+                "旧实例在进行中的请求结束后释放；接口立即返回请求内容，可通过 GET /admin/models/swaps 查询各工作进程的进度。"
+)
+async def swap_model(
+    request: ModelSwapRequest,
+    vector_service = Depends(get_vector_service)
+):
+    """发布模型热切换请求"""
+    try:
+        swap_request = vector_service.request_hot_swap(request.model_type, request.precision,
+                                                       request.make_default, request.warmup)
+        return Response.success(data={"request": swap_request, "pid": os.getpid(),
+                                      "poll_interval": SWAP_POLL_INTERVAL})
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"启动模型热切换失败: {e}")
+        raise HTTPException(status_code=500, detail="启动模型热切换失败")
+
+
+@admin_router.get(
+    "/models/swaps",
+    response_model=Response,
+    summary="获取热切换记录",
+    description="获取最近的切换请求与各工作进程的执行状态，以及当前工作进程最近的热切换报告："
+                "加载、预热、切换时间点、旧实例排空耗时与内存重叠。"
+)
+async def get_swaps(
+    vector_service = Depends(get_vector_service)
+):
+    """获取热切换记录"""
+    requests = get_swap_requests()
+    return Response.success(data={"request": requests.latest(), "workers": requests.statuses(), "pid": os.getpid(),
+                                  "swaps": vector_service.get_swaps()})
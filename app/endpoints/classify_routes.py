@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 16:40
+@Author : YangFei
+@File   : classify_routes.py
+@Desc   : 零样本分类路由：标签集管理与图像、文本分类
+"""
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, File
+
+from app.schemas.base import Response
+from app.schemas.classify import LabelSetRequest, ClassifyTextRequest
+from app.endpoints.uploads import read_upload
+from core.exceptions import AppException, ValidationException
+from app.service_dependencies import get_classify_service
+
+logger = logging.getLogger(__name__)
+
+
+# 创建路由
+classify_router = APIRouter(prefix="/classify", tags=["零样本分类模块"])
+
+
+@classify_router.get(
+    "/label-sets",
+    response_model=Response,
+    summary="获取标签集列表",
+    description="获取当前工作进程中的全部标签集，以及已计算标签向量的模型。"
+)
+async def list_label_sets(
+    classify_service = Depends(get_classify_service)
+):
+    """获取标签集列表"""
+    return Response.success(data={"label_sets": classify_service.list_label_sets()})
+
+
+@classify_router.put(
+    "/label-sets/{name}",
+    response_model=Response,
+    summary="创建或替换标签集",
+    description="注册命名标签集，并为 model_types 中的模型预先计算标签向量；替换后已计算的向量失效。"
+)
+async def put_label_set(
+    name: str,
+    request: LabelSetRequest,
+    classify_service = Depends(get_classify_service)
+):
+    """创建或替换标签集"""
+    try:
+        label_set = await classify_service.put_label_set(name, request.labels, request.template, request.model_types)
+        return Response.success(data=label_set)
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"创建标签集失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="创建标签集失败")
+
+
+@classify_router.delete(
+    "/label-sets/{name}",
+    response_model=Response,
+    summary="删除标签集",
+    description="删除标签集及其已计算的标签向量。"
+)
+async def drop_label_set(
+    name: str,
+    classify_service = Depends(get_classify_service)
+):
+    """删除标签集"""
+    classify_service.drop_label_set(name)
+    return Response.success()
+
+
+@classify_router.post(
+    "/text",
+    response_model=Response,
+    summary="文本零样本分类",
+    description="将文本与标签集比较，按模型的温度系数计算 softmax 概率并排序；也可用于对候选文本重排序。"
+)
+async def classify_text(
+    request: ClassifyTextRequest,
+    classify_service = Depends(get_classify_service)
+):
+    """文本零样本分类"""
+    try:
+        result = await classify_service.classify(
+            request.model_type, label_set=request.label_set, labels=request.labels, template=request.template,
+            text=request.text, top_k=request.top_k)
+        return Response.success(data=result)
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"文本零样本分类失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="文本零样本分类失败")
+
+
+@classify_router.post(
+    "/image",
+    response_model=Response,
+    summary="图像零样本分类",
+    description="将图像与标签集比较，按模型的温度系数计算 softmax 概率并排序。"
+)
+async def classify_image(
+    file: UploadFile = File(..., description="上传的图像文件"),
+    label_set: Optional[str] = Form(None, description="已注册的标签集名称"),
+    labels: Optional[List[str]] = Form(None, description="内联标签列表，可重复传递"),
+    template: Optional[str] = Form(None, description="内联标签的提示词模板，{} 替换为标签"),
+    model_type: str = Form("mini", description="使用的模型类型"),
+    top_k: Optional[int] = Form(None, gt=0, description="只返回概率最高的前 k 个标签，默认全部返回"),
+    classify_service = Depends(get_classify_service)
+):
+    """图像零样本分类，注：全部参数通过 form-data 传递"""
+    try:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise ValidationException("请上传图像文件")
+
+        image_data = await read_upload(file)
+
+        result = await classify_service.classify(
+            model_type, label_set=label_set, labels=labels, template=template, image_data=image_data, top_k=top_k)
+        return Response.success(data={"filename": file.filename, **result})
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"图像零样本分类失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="图像零样本分类失败")
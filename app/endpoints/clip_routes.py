@@ -7,16 +7,39 @@
 @Desc   : Chinese-CLIP 多模态向量路由
 """
 import logging
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, File
+import numpy as np
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, File, Query, Request
+from fastapi.responses import StreamingResponse
 
 from app.schemas.base import Response
-from app.schemas.vector import TextVectorRequest
-from core.exceptions import ValidationException
-from app.service_dependencies import get_vector_service
+from app.schemas.vector import TextVectorRequest, ProjectionFitRequest
+from app.endpoints.uploads import read_upload, read_uploads
+from app.endpoints.embedding_formats import (
+    FORMAT_BASE64, FORMAT_JSON, FORMAT_MSGPACK, JSON_FORMATS, negotiate_format, encode_vector, embedding_response, json_response,
+    negotiate_stream_format, stream_media_type, stream_embeddings
+)
+from core.config import MAX_IMAGES_PER_REQUEST, DEDUP_THRESHOLD, DEDUP_MAX_HAMMING
+from core.exceptions import AppException, ValidationException
+from app.service_dependencies import (
+    get_vector_service, get_batch_scheduler, get_bulk_encode_service, get_projection_service, get_similarity_service,
+    get_dedup_service, bulk_priority
+)
+from core.embedding_cache import get_embedding_cache
+from core.image_decode import get_decode_budget, get_decode_stats
+from core.text_tokens import get_token_cache
 
 logger = logging.getLogger(__name__)
 
 
+# 响应格式参数说明
+FORMAT_DESCRIPTION = ("响应格式：json（默认）、base64（JSON 内为 base64 编码的小端 float32）、"
+                      "f32/f16（原始小端二进制）、npy、msgpack；未指定时按 Accept 请求头协商")
+
+# 输出维度参数说明
+OUTPUT_DIM_DESCRIPTION = "输出维度，使用模型的投影矩阵降维并重新归一化，默认原始维度"
+
+
 # 创建路由
 clip_router = APIRouter(prefix="/clip", tags=["多模态向量模块"])
 
@@ -39,6 +62,114 @@ async def get_available_models(
         raise HTTPException(status_code=500, detail="获取模型类型列表失败")
 
 
+@clip_router.get(
+    "/models/loaded",
+    response_model=Response,
+    summary="获取常驻模型",
+    description="获取当前常驻内存的模型、引用计数与内存预算。"
+)
+async def get_loaded_models(
+    vector_service = Depends(get_vector_service)
+):
+    """获取常驻模型信息"""
+    return Response.success(data=vector_service.get_loaded_models())
+
+
+@clip_router.get(
+    "/stats/batching",
+    response_model=Response,
+    summary="获取微批调度统计",
+    description="获取各模型队列的深度、批大小直方图与等待时间，用于调优攒批参数。"
+)
+async def get_batching_stats(
+    scheduler = Depends(get_batch_scheduler)
+):
+    """获取微批调度统计"""
+    return Response.success(data=scheduler.stats())
+
+
+@clip_router.get(
+    "/stats/cache",
+    response_model=Response,
+    summary="获取向量缓存统计",
+    description="获取向量缓存与 token id 缓存的条目数与命中、未命中次数。"
+)
+async def get_cache_stats(
+    cache = Depends(get_embedding_cache),
+    token_cache = Depends(get_token_cache)
+):
+    """获取向量缓存统计"""
+    return Response.success(data={**cache.stats(), "token_cache": token_cache.stats()})
+
+
+@clip_router.get(
+    "/stats/decode",
+    response_model=Response,
+    summary="获取图像解码统计",
+    description="获取图像解码与预处理的耗时、JPEG draft 缩小解码次数、解码耗时直方图与解码内存预算的使用情况。"
+)
+async def get_decode_stats(
+    decode_stats = Depends(get_decode_stats),
+    decode_budget = Depends(get_decode_budget)
+):
+    """获取图像解码统计"""
+    return Response.success(data={**decode_stats.to_dict(), "budget": decode_budget.stats()})
+
+
+@clip_router.get(
+    "/projections",
+    response_model=Response,
+    summary="获取降维投影矩阵",
+    description="获取各模型已拟合的投影矩阵、最大输出维度、方差占比与留出集上的召回率。"
+)
+async def list_projections(
+    projection_service = Depends(get_projection_service)
+):
+    """获取降维投影矩阵列表"""
+    return Response.success(data={"projections": projection_service.list()})
+
+
+@clip_router.put(
+    "/projections/{model_type}",
+    response_model=Response,
+    summary="拟合降维投影矩阵",
+    description="用校准语料（文本与向量集合）拟合模型的 PCA 或随机正交投影矩阵并保存，"
+                "返回留出集上各维度相对原始维度的 recall@k；之后向量化接口可以通过 output_dim 输出低维向量。"
+)
+async def fit_projection(
+    model_type: str,
+    request: ProjectionFitRequest,
+    projection_service = Depends(get_projection_service)
+):
+    """拟合降维投影矩阵"""
+    try:
+        projection = await projection_service.fit(
+            model_type, request.texts, request.collections, request.method, request.max_dim,
+            request.holdout_ratio, request.eval_dims, request.top_k, request.seed)
+        return Response.success(data=projection)
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"拟合投影矩阵失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="拟合投影矩阵失败")
+
+
+@clip_router.delete(
+    "/projections/{model_type}",
+    response_model=Response,
+    summary="删除降维投影矩阵",
+    description="删除模型的投影矩阵，之后该模型不再支持 output_dim。"
+)
+async def drop_projection(
+    model_type: str,
+    projection_service = Depends(get_projection_service)
+):
+    """删除降维投影矩阵"""
+    projection_service.drop(model_type)
+    return Response.success()
+
+
 @clip_router.post(
     "/encode/text",
     response_model=Response,
@@ -47,6 +178,8 @@ async def get_available_models(
 )
 async def encode_text(
         request: TextVectorRequest,
+        http_request: Request,
+        fmt: Optional[str] = Query(None, alias="format", description=FORMAT_DESCRIPTION),
         vector_service = Depends(get_vector_service)
 ):
     """文本编码接口"""
@@ -54,17 +187,16 @@ async def encode_text(
         if not request.texts:
             raise ValidationException("文本列表不能为空")
 
-        await vector_service.switch_model(request.model_type)
+        response_format = negotiate_format(http_request, fmt)
 
-        embeddings = await vector_service.encode_text(request.texts)
+        embeddings = await vector_service.encode_text(request.texts, request.model_type, request.output_dim)
 
-        return Response.success(data={
-            "embeddings": embeddings,
-            "count": len(embeddings),
-            "dimension": len(embeddings[0]) if embeddings else 0
+        return embedding_response(response_format, embeddings, data={
+            "count": embeddings.shape[0],
+            "dimension": embeddings.shape[1]
         })
 
-    except ValidationException:
+    except AppException:
         raise
     except ValueError as e:
         raise ValidationException(str(e))
@@ -80,8 +212,11 @@ async def encode_text(
     description="将图像转换为向量表示。"
 )
 async def encode_image(
+        http_request: Request,
         file: UploadFile = File(..., description="上传的图像文件"),
         model_type: str = Form("mini", description="使用的模型类型"),
+        output_dim: Optional[int] = Form(None, gt=0, description=OUTPUT_DIM_DESCRIPTION),
+        fmt: Optional[str] = Query(None, alias="format", description=FORMAT_DESCRIPTION),
         vector_service = Depends(get_vector_service)
 ):
     """图像编码接口，注：file 和 model_type，通过 form-data 传递"""
@@ -91,21 +226,18 @@ async def encode_image(
         if not file.content_type.startswith('image/'):
             raise ValidationException("请上传图像文件")
 
-        image_data = await file.read()
-        if len(image_data) == 0:
-            raise ValidationException("上传的文件为空")
+        response_format = negotiate_format(http_request, fmt)
 
-        await vector_service.switch_model(model_type)
+        image_data = await read_upload(file)
 
-        embedding = await vector_service.encode_image(image_data)
+        embedding = await vector_service.encode_image(image_data, model_type, output_dim)
 
-        return Response.success(data={
-            "embedding": embedding,
+        return embedding_response(response_format, embedding, field="embedding", data={
             "filename": file.filename,
-            "dimension": len(embedding)
+            "dimension": embedding.shape[0]
         })
 
-    except ValidationException:
+    except AppException:
         raise
     except ValueError as e:
         raise ValidationException(str(e))
@@ -113,3 +245,223 @@ async def encode_image(
         logger.error(f"图像编码失败: {e}")
         raise HTTPException(status_code=500, detail="图像编码失败")
 
+
+
+@clip_router.post(
+    "/encode/images",
+    dependencies=[Depends(bulk_priority)],
+    response_model=Response,
+    summary="批量图像向量化",
+    description="一次上传多张图像，并行解码后合并成批次推理；单张图像失败时只在对应条目中返回错误信息。"
+)
+async def encode_images(
+        http_request: Request,
+        files: List[UploadFile] = File(..., description="上传的图像文件列表"),
+        model_type: str = Form("mini", description="使用的模型类型"),
+        output_dim: Optional[int] = Form(None, gt=0, description=OUTPUT_DIM_DESCRIPTION),
+        fmt: Optional[str] = Query(None, alias="format", description=FORMAT_DESCRIPTION),
+        vector_service = Depends(get_vector_service)
+):
+    """批量图像编码接口，注：files 和 model_type，通过 form-data 传递
+
+    二进制格式下返回与上传顺序一致的完整矩阵，失败的行填充 NaN，失败的下标通过 X-Embedding-Failed 响应头返回。
+    """
+    try:
+        if len(files) > MAX_IMAGES_PER_REQUEST:
+            raise ValidationException(f"单次最多上传 {MAX_IMAGES_PER_REQUEST} 张图像")
+
+        response_format = negotiate_format(http_request, fmt)
+
+        items = [{"index": index, "filename": file.filename, "embedding": None, "error": None}
+                 for index, file in enumerate(files)]
+
+        # 逐个校验文件，不合法的文件只标记错误，不影响其他文件
+        valid_indexes, image_data_list = [], []
+        for index, file in enumerate(files):
+            if not file.content_type or not file.content_type.startswith('image/'):
+                items[index]["error"] = "请上传图像文件"
+                continue
+
+            try:
+                image_data = await read_upload(file)
+            except ValidationException as e:
+                items[index]["error"] = e.msg
+                continue
+
+            valid_indexes.append(index)
+            image_data_list.append(image_data)
+
+        if image_data_list:
+            embeddings, errors = await vector_service.encode_image_batch(image_data_list, model_type, output_dim)
+            for index, embedding, error in zip(valid_indexes, embeddings, errors):
+                items[index]["embedding"] = embedding
+                items[index]["error"] = error
+
+        succeeded = [item["embedding"] for item in items if item["embedding"] is not None]
+        dimension = succeeded[0].shape[0] if succeeded else 0
+
+        if response_format not in JSON_FORMATS:
+            matrix = np.full((len(items), dimension), np.nan, dtype=np.float32)
+            for index, item in enumerate(items):
+                if item["embedding"] is not None:
+                    matrix[index] = item["embedding"]
+            failed = [str(item["index"]) for item in items if item["embedding"] is None]
+            return embedding_response(response_format, matrix, data={}, headers={
+                "X-Embedding-Failed": ",".join(failed)
+            })
+
+        for item in items:
+            item["embedding"] = encode_vector(item["embedding"], response_format)
+
+        return json_response({
+            "items": items,
+            "count": len(items),
+            "success": len(succeeded),
+            "failed": len(items) - len(succeeded),
+            "dimension": dimension,
+            **({"dtype": "float32", "byteorder": "little"} if response_format == FORMAT_BASE64 else {})
+        })
+
+    except AppException:
+        raise
+    except ValueError as e:
+        raise ValidationException(str(e))
+    except Exception as e:
+        logger.error(f"批量图像编码失败: {e}")
+        raise HTTPException(status_code=500, detail="批量图像编码失败")
+
+
+@clip_router.post(
+    "/similarity",
+    dependencies=[Depends(bulk_priority)],
+    response_model=Response,
+    summary="文本-图像相似度矩阵",
+    description="N 条文本与 M 张图像（上传的图像，或向量集合中已写入的图像 id）两侧各批量编码一次，"
+                "一次矩阵乘法返回全部文本-图像对的余弦相似度或 logit，可只返回每行分数最高的 top_k 列；"
+                "大矩阵可以使用 format=f16 以二进制返回。"
+)
+async def similarity(
+        http_request: Request,
+        texts: List[str] = Form(..., description="文本列表，对应矩阵的行"),
+        files: Optional[List[UploadFile]] = File(None, description="上传的图像文件列表，对应矩阵的前若干列"),
+        collection: Optional[str] = Form(None, description="image_ids 所在的向量集合，模型必须与 model_type 一致"),
+        image_ids: Optional[List[str]] = Form(None, description="集合中已写入的图像 id，对应上传图像之后的列"),
+        model_type: str = Form("mini", description="使用的模型类型"),
+        score: str = Form("similarity", description="分数类型：similarity（余弦相似度）、logit（乘以 logit_scale）"),
+        top_k: Optional[int] = Form(None, gt=0, description="每行只返回分数最高的 top_k 列，默认返回完整矩阵"),
+        fmt: Optional[str] = Query(None, alias="format", description=FORMAT_DESCRIPTION),
+        similarity_service = Depends(get_similarity_service)
+):
+    """相似度矩阵接口，注：参数通过 form-data 传递，texts、files、image_ids 可以重复多次
+
+    二进制格式（f32/f16/npy）下响应体为行优先的分数矩阵，失败的列填充 NaN，失败的列下标通过 X-Similarity-Failed 响应头返回；
+    指定 top_k 时还需要返回列下标，只支持 json、base64、msgpack 格式。
+    """
+    try:
+        files = files or []
+        if len(files) > MAX_IMAGES_PER_REQUEST:
+            raise ValidationException(f"单次最多上传 {MAX_IMAGES_PER_REQUEST} 张图像")
+
+        response_format = negotiate_format(http_request, fmt)
+        if top_k is not None and response_format not in (*JSON_FORMATS, FORMAT_MSGPACK):
+            raise ValidationException("指定 top_k 时只支持 json、base64、msgpack 响应格式")
+
+        # 逐个校验文件，不合法的文件只标记为失败的列，不影响其他列
+        images, image_errors = await read_uploads(files)
+
+        result = await similarity_service.similarity(model_type, texts, images, image_errors, collection,
+                                                     image_ids, score, top_k)
+
+        scores, indices = result.pop("scores"), result.pop("indices")
+        columns = [{"column": i, "filename": file.filename} for i, file in enumerate(files)]
+        columns += [{"column": len(files) + i, "id": item_id} for i, item_id in enumerate(image_ids or [])]
+        data = {**result, "rows": len(texts), "columns": columns, "shape": list(scores.shape)}
+        if indices is not None:
+            data["indices"] = indices.tolist()
+
+        if response_format == FORMAT_JSON:
+            # JSON 不支持 NaN，失败的列返回 null
+            data["scores"] = [[None if np.isnan(value) else value for value in row] for row in scores.tolist()] \
+                if result["failed"] else scores.tolist()
+            return json_response(data)
+
+        return embedding_response(response_format, scores, field="scores", data=data, headers={
+            "X-Similarity-Failed": ",".join(str(item["column"]) for item in result["failed"]),
+            "X-Similarity-Score": result["score"],
+            "X-Logit-Scale": str(result["logit_scale"]),
+        })
+
+    except AppException:
+        raise
+    except ValueError as e:
+        raise ValidationException(str(e))
+    except Exception as e:
+        logger.error(f"计算相似度矩阵失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="计算相似度矩阵失败")
+
+
+@clip_router.post(
+    "/dedup",
+    dependencies=[Depends(bulk_priority)],
+    response_model=Response,
+    summary="近重复图像检测",
+    description="先用感知哈希分桶筛选候选对，只对候选图像推理并比较向量的余弦相似度，返回重复分组；"
+                "指定 collection 时（增量模式）再与集合中已有的图像比较，insert=true 时把不重复的图像写入集合。"
+)
+async def dedup(
+        files: List[UploadFile] = File(..., description="上传的图像文件列表"),
+        ids: Optional[List[str]] = Form(None, description="与图像一一对应的 id，写入集合时必填"),
+        model_type: str = Form("mini", description="使用的模型类型"),
+        threshold: float = Form(DEDUP_THRESHOLD, gt=0, le=1, description="判定为重复的最低余弦相似度"),
+        max_distance: int = Form(DEDUP_MAX_HAMMING, ge=0, le=32, description="候选对的感知哈希汉明距离上限"),
+        collection: Optional[str] = Form(None, description="增量模式：与该向量集合中已有的图像比较"),
+        insert: bool = Form(False, description="增量模式：把不重复的图像以 ids 写入集合"),
+        dedup_service = Depends(get_dedup_service)
+):
+    """近重复图像检测接口，注：参数通过 form-data 传递，files、ids 可以重复多次"""
+    try:
+        if len(files) > MAX_IMAGES_PER_REQUEST:
+            raise ValidationException(f"单次最多上传 {MAX_IMAGES_PER_REQUEST} 张图像")
+
+        # 逐个校验文件，不合法的文件只标记错误，不影响其他文件
+        images, image_errors = await read_uploads(files)
+
+        result = await dedup_service.dedup(model_type, images, image_errors, threshold, max_distance,
+                                           collection, ids, insert)
+        for item, file in zip(result["items"], files):
+            item["filename"] = file.filename
+        return json_response(result)
+
+    except AppException:
+        raise
+    except ValueError as e:
+        raise ValidationException(str(e))
+    except Exception as e:
+        logger.error(f"近重复图像检测失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="近重复图像检测失败")
+
+
+@clip_router.post(
+    "/encode/stream",
+    dependencies=[Depends(bulk_priority)],
+    summary="流式批量向量化",
+    description="请求体为 NDJSON，每行一条 {id, text} 或 {id, image}（base64）记录；记录分批流水线处理，"
+                "每批完成后立即以 NDJSON 行（format=json/base64）或二进制帧（format=f32/f16）返回。"
+)
+async def encode_stream(
+        http_request: Request,
+        model_type: str = Query("mini", description="使用的模型类型"),
+        output_dim: Optional[int] = Query(None, gt=0, description=OUTPUT_DIM_DESCRIPTION),
+        fmt: Optional[str] = Query(None, alias="format",
+                                   description="响应格式：json（默认）、base64 为 NDJSON，f32/f16 为二进制帧"),
+        bulk_service = Depends(get_bulk_encode_service)
+):
+    """流式批量向量化接口，请求体与响应体都不会整体驻留内存"""
+    response_format = negotiate_stream_format(fmt)
+    model_key = bulk_service.normalize_model_type(model_type)
+
+    bulk_service.check_output_dim(model_key, output_dim)
+
+    batches = bulk_service.encode_stream(http_request.stream(), model_key, output_dim)
+    return StreamingResponse(stream_embeddings(batches, response_format),
+                             media_type=stream_media_type(response_format))
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 15:48
+@Author : YangFei
+@File   : collection_routes.py
+@Desc   : 向量集合路由：写入、删除与服务端 top-k 检索
+"""
+import logging
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, Form, File, Query
+
+from app.schemas.base import Response
+from app.schemas.collection import CreateCollectionRequest, UpsertTextsRequest, UpsertVectorsRequest, SearchRequest
+from app.endpoints.uploads import read_upload
+from core.config import MAX_IMAGES_PER_REQUEST
+from core.exceptions import AppException, ValidationException
+from app.service_dependencies import get_collection_service, bulk_priority
+
+logger = logging.getLogger(__name__)
+
+
+# 创建路由
+collection_router = APIRouter(prefix="/collections", tags=["向量集合模块"])
+
+
+@collection_router.get(
+    "",
+    response_model=Response,
+    summary="获取向量集合列表",
+    description="获取当前工作进程中的全部向量集合。"
+)
+async def list_collections(
+    collection_service = Depends(get_collection_service)
+):
+    """获取向量集合列表"""
+    return Response.success(data={"collections": collection_service.list()})
+
+
+@collection_router.post(
+    "",
+    response_model=Response,
+    summary="创建向量集合",
+    description="创建命名向量集合，集合绑定一个模型类型，flat 为暴力检索，ivf 为近似检索。"
+)
+async def create_collection(
+    request: CreateCollectionRequest,
+    collection_service = Depends(get_collection_service)
+):
+    """创建向量集合"""
+    collection = collection_service.create(
+        request.name, request.model_type, request.index_type, request.nlist, request.nprobe)
+    return Response.success(data=collection)
+
+
+@collection_router.delete(
+    "/{name}",
+    response_model=Response,
+    summary="删除向量集合",
+    description="删除向量集合及其全部条目。"
+)
+async def drop_collection(
+    name: str,
+    collection_service = Depends(get_collection_service)
+):
+    """删除向量集合"""
+    collection_service.drop(name)
+    return Response.success()
+
+
+@collection_router.put(
+    "/{name}/items/text",
+    dependencies=[Depends(bulk_priority)],
+    response_model=Response,
+    summary="写入文本条目",
+    description="编码文本并写入集合，id 已存在时覆盖。"
+)
+async def upsert_texts(
+    name: str,
+    request: UpsertTextsRequest,
+    collection_service = Depends(get_collection_service)
+):
+    """写入文本条目"""
+    try:
+        if not request.items:
+            raise ValidationException("条目列表不能为空")
+
+        result = await collection_service.upsert_texts(
+            name, [item.id for item in request.items], [item.text for item in request.items], request.overwrite)
+        return Response.success(data=result)
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"写入文本条目失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="写入文本条目失败")
+
+
+@collection_router.put(
+    "/{name}/items/vector",
+    response_model=Response,
+    summary="写入向量条目",
+    description="直接写入已有的向量，向量会重新做 L2 归一化。"
+)
+async def upsert_vectors(
+    name: str,
+    request: UpsertVectorsRequest,
+    collection_service = Depends(get_collection_service)
+):
+    """写入向量条目"""
+    try:
+        if not request.items:
+            raise ValidationException("条目列表不能为空")
+
+        result = await collection_service.upsert_vectors(
+            name, [item.id for item in request.items], [item.vector for item in request.items], request.overwrite)
+        return Response.success(data=result)
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"写入向量条目失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="写入向量条目失败")
+
+
+@collection_router.put(
+    "/{name}/items/image",
+    dependencies=[Depends(bulk_priority)],
+    response_model=Response,
+    summary="写入图像条目",
+    description="编码图像并写入集合，ids 与 files 按顺序一一对应；解码失败的图像跳过，并在 errors 中返回原因。"
+)
+async def upsert_images(
+    name: str,
+    ids: List[str] = Form(..., description="条目 id 列表，与 files 一一对应"),
+    files: List[UploadFile] = File(..., description="上传的图像文件列表"),
+    overwrite: bool = Form(True, description="id 已存在时是否覆盖"),
+    collection_service = Depends(get_collection_service)
+):
+    """写入图像条目，注：ids、files 和 overwrite，通过 form-data 传递"""
+    try:
+        if len(ids) != len(files):
+            raise ValidationException("ids 与 files 的数量不一致")
+        if len(files) > MAX_IMAGES_PER_REQUEST:
+            raise ValidationException(f"单次最多上传 {MAX_IMAGES_PER_REQUEST} 张图像")
+
+        # 逐个校验文件，不合法的文件只记录错误，不影响其他文件
+        errors: List[Optional[str]] = [None] * len(files)
+        valid_indexes, image_data_list = [], []
+        for index, file in enumerate(files):
+            try:
+                image_data_list.append(await read_upload(file))
+                valid_indexes.append(index)
+            except ValidationException as e:
+                errors[index] = e.msg
+
+        result, encode_errors = await collection_service.upsert_images(
+            name, [ids[i] for i in valid_indexes], image_data_list, overwrite)
+        for index, error in zip(valid_indexes, encode_errors):
+            errors[index] = error
+
+        return Response.success(data={
+            **result,
+            "errors": [{"id": ids[i], "error": error} for i, error in enumerate(errors) if error is not None]
+        })
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"写入图像条目失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="写入图像条目失败")
+
+
+@collection_router.delete(
+    "/{name}/items",
+    response_model=Response,
+    summary="删除条目",
+    description="按 id 删除集合中的条目，不存在的 id 忽略。"
+)
+async def delete_items(
+    name: str,
+    ids: List[str] = Query(..., description="要删除的条目 id，可重复传递"),
+    collection_service = Depends(get_collection_service)
+):
+    """删除条目"""
+    return Response.success(data=collection_service.delete(name, ids))
+
+
+@collection_router.post(
+    "/{name}/search",
+    response_model=Response,
+    summary="检索",
+    description="按文本或向量检索集合，返回内积最高的 top-k 条目。"
+)
+async def search(
+    name: str,
+    request: SearchRequest,
+    collection_service = Depends(get_collection_service)
+):
+    """文本或向量检索"""
+    try:
+        results = await collection_service.search(
+            name, request.top_k, text=request.text, vector=request.vector, nprobe=request.nprobe)
+        return Response.success(data={"results": results})
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"检索失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="检索失败")
+
+
+@collection_router.post(
+    "/{name}/search/image",
+    response_model=Response,
+    summary="以图检索",
+    description="上传一张图像检索集合，返回内积最高的 top-k 条目。"
+)
+async def search_by_image(
+    name: str,
+    file: UploadFile = File(..., description="上传的图像文件"),
+    top_k: int = Form(10, gt=0, description="返回的结果数"),
+    collection_service = Depends(get_collection_service)
+):
+    """以图检索，注：file 和 top_k，通过 form-data 传递"""
+    try:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            raise ValidationException("请上传图像文件")
+
+        image_data = await read_upload(file)
+
+        results = await collection_service.search(name, top_k, image_data=image_data)
+        return Response.success(data={"results": results})
+
+    except AppException:
+        raise
+    except Exception as e:
+        logger.error(f"以图检索失败: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="以图检索失败")
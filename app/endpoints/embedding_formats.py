@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 11:48
+@Author : YangFei
+@File   : embedding_formats.py
+@Desc   : 向量响应的内容协商与序列化，绕过 pydantic 对嵌套浮点列表的校验
+"""
+import base64
+import io
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response as RawResponse
+
+from core.exceptions import AppException, ValidationException
+from core.metrics import SERIALIZE_SECONDS
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+
+# 支持的响应格式
+FORMAT_JSON = "json"  # 默认：统一响应结构，向量为浮点数列表
+FORMAT_BASE64 = "base64"  # 统一响应结构，向量为 base64 编码的小端 float32
+FORMAT_F32 = "f32"  # 原始小端 float32 二进制
+FORMAT_F16 = "f16"  # 原始小端 float16 二进制
+FORMAT_NPY = "npy"  # numpy .npy 文件
+FORMAT_MSGPACK = "msgpack"  # msgpack，需要安装 msgpack
+
+SUPPORTED_FORMATS = (FORMAT_JSON, FORMAT_BASE64, FORMAT_F32, FORMAT_F16, FORMAT_NPY, FORMAT_MSGPACK)
+
+# 以统一 JSON 结构返回的格式
+JSON_FORMATS = (FORMAT_JSON, FORMAT_BASE64)
+
+# 流式接口支持的格式：json/base64 为 NDJSON，f32/f16 为二进制帧
+STREAM_FORMATS = (FORMAT_JSON, FORMAT_BASE64, FORMAT_F32, FORMAT_F16)
+
+# Accept 请求头到响应格式的映射
+_ACCEPT_FORMATS = {
+    "application/octet-stream": FORMAT_F32,
+    "application/x-npy": FORMAT_NPY,
+    "application/msgpack": FORMAT_MSGPACK,
+    "application/x-msgpack": FORMAT_MSGPACK,
+}
+
+_BINARY_DTYPES = {
+    FORMAT_F32: "<f4",
+    FORMAT_F16: "<f2",
+}
+
+
+def negotiate_format(request: Request, fmt: Optional[str] = None) -> str:
+    """ 确定响应格式：优先使用 format 查询参数，其次按 Accept 请求头协商，默认 JSON """
+    if fmt:
+        fmt = fmt.strip().lower()
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValidationException(f"不支持的响应格式 {fmt}，可选项: {list(SUPPORTED_FORMATS)}")
+    else:
+        accept = request.headers.get("accept", "")
+        media_types = [part.split(";")[0].strip().lower() for part in accept.split(",")]
+        fmt = next((_ACCEPT_FORMATS[m] for m in media_types if m in _ACCEPT_FORMATS), FORMAT_JSON)
+
+    if fmt == FORMAT_MSGPACK and msgpack is None:
+        raise ValidationException("服务端未安装 msgpack，无法使用 msgpack 响应格式")
+    return fmt
+
+
+def encode_vector(vector: Optional[np.ndarray], fmt: str):
+    """ 把单个向量编码为 JSON 可用的值：浮点数列表或 base64 字符串 """
+    if vector is None:
+        return None
+    if fmt == FORMAT_BASE64:
+        return base64.b64encode(np.ascontiguousarray(vector, dtype="<f4").tobytes()).decode("ascii")
+    return vector.tolist()
+
+
+def dumps_json(content) -> bytes:
+    """ 序列化为紧凑的 JSON 字节，安装了 orjson 时使用 orjson """
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(RawResponse):
+    """ 直接序列化字典的 JSON 响应，安装了 orjson 时使用 orjson """
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
+def json_response(data: dict) -> FastJSONResponse:
+    """ 以统一响应结构返回，不经过 pydantic 校验 """
+    return FastJSONResponse(content={"code": 200, "msg": "success", "data": data})
+
+
+def embedding_response(fmt: str, embeddings: np.ndarray, data: dict, field: str = "embeddings",
+                       headers: Optional[Dict[str, str]] = None) -> RawResponse:
+    """ 按协商好的格式构造向量响应
+    :param fmt: 响应格式
+    :param embeddings: 向量矩阵（或单个向量）
+    :param data: JSON 格式下附带的其他字段
+    :param field: JSON 格式下向量所在的字段名
+    :param headers: 二进制格式下附加的响应头
+    """
+    with SERIALIZE_SECONDS.time(format=fmt):
+        return _embedding_response(fmt, np.asarray(embeddings, dtype=np.float32), data, field, headers)
+
+
+def _embedding_response(fmt: str, embeddings: np.ndarray, data: dict, field: str,
+                        headers: Optional[Dict[str, str]]) -> RawResponse:
+    """ 构造向量响应，响应体在构造时完成序列化 """
+    if fmt == FORMAT_JSON:
+        return json_response({**data, field: embeddings.tolist()})
+
+    if fmt == FORMAT_BASE64:
+        return json_response({
+            **data,
+            field: encode_vector(embeddings, fmt),
+            "dtype": "float32",
+            "byteorder": "little",
+            "shape": list(embeddings.shape),
+        })
+
+    if fmt == FORMAT_MSGPACK:
+        body = msgpack.packb({
+            **data,
+            field: np.ascontiguousarray(embeddings, dtype="<f4").tobytes(),
+            "dtype": "float32",
+            "shape": list(embeddings.shape),
+        }, use_bin_type=True)
+        return RawResponse(content=body, media_type="application/msgpack", headers=headers)
+
+    if fmt == FORMAT_NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings, allow_pickle=False)
+        return RawResponse(content=buffer.getvalue(), media_type="application/x-npy", headers=headers)
+
+    dtype = np.dtype(_BINARY_DTYPES[fmt])
+    body = np.ascontiguousarray(embeddings, dtype=dtype).tobytes()
+    binary_headers = {
+        "X-Embedding-Shape": ",".join(str(n) for n in embeddings.shape),
+        "X-Embedding-Dtype": dtype.name,
+        "X-Embedding-Byteorder": "little",
+        **(headers or {}),
+    }
+    return RawResponse(content=body, media_type="application/octet-stream", headers=binary_headers)
+
+
+def negotiate_stream_format(fmt: Optional[str] = None) -> str:
+    """ 确定流式接口的响应格式，默认 NDJSON """
+    fmt = (fmt or FORMAT_JSON).strip().lower()
+    if fmt not in STREAM_FORMATS:
+        raise ValidationException(f"流式接口不支持的响应格式 {fmt}，可选项: {list(STREAM_FORMATS)}")
+    return fmt
+
+
+def stream_media_type(fmt: str) -> str:
+    """ 流式接口的响应类型 """
+    return "application/x-ndjson" if fmt in JSON_FORMATS else "application/octet-stream"
+
+
+def binary_frame(header: dict, matrix: Optional[np.ndarray] = None, fmt: str = FORMAT_F32) -> bytes:
+    """ 二进制帧：4 字节小端头部长度 + JSON 头部 + 小端向量矩阵 """
+    header_bytes = dumps_json(header)
+    body = b""
+    if matrix is not None and matrix.size:
+        body = np.ascontiguousarray(matrix, dtype=_BINARY_DTYPES[fmt]).tobytes()
+    return len(header_bytes).to_bytes(4, "little") + header_bytes + body
+
+
+def _batch_frame(batch: List[Tuple[Any, Optional[np.ndarray], Optional[str]]], fmt: str) -> bytes:
+    """ 把一个批次的结果编码为 NDJSON 行或一个二进制帧 """
+    if fmt in JSON_FORMATS:
+        lines = [
+            dumps_json({"id": item_id, "embedding": encode_vector(vector, fmt)} if error is None
+                       else {"id": item_id, "error": error})
+            for item_id, vector, error in batch
+        ]
+        return b"\n".join(lines) + b"\n"
+
+    ok = [(item_id, vector) for item_id, vector, error in batch if error is None]
+    matrix = np.stack([vector for _, vector in ok]) if ok else np.empty((0, 0), dtype=np.float32)
+    return binary_frame({
+        "ids": [item_id for item_id, _ in ok],
+        "errors": [{"id": item_id, "error": error} for item_id, _, error in batch if error is not None],
+        "shape": list(matrix.shape),
+        "dtype": np.dtype(_BINARY_DTYPES[fmt]).name,
+    }, matrix, fmt)
+
+
+async def stream_embeddings(batches: AsyncIterator[List[Tuple[Any, Optional[np.ndarray], Optional[str]]]],
+                            fmt: str) -> AsyncIterator[bytes]:
+    """ 逐批输出流式结果，结束时输出汇总；响应头已经发出，中途失败只能以错误记录结束 """
+    count = failed = 0
+    try:
+        async for batch in batches:
+            count += len(batch)
+            failed += sum(1 for _, _, error in batch if error is not None)
+            yield _batch_frame(batch, fmt)
+    except AppException as e:
+        yield _stream_tail({"error": e.msg, "count": count, "failed": failed, **(e.data if isinstance(e.data, dict) else {})}, fmt)
+        return
+    except Exception as e:
+        logger.error(f"流式向量化失败: {e}", exc_info=True)
+        yield _stream_tail({"error": "流式向量化失败", "count": count, "failed": failed}, fmt)
+        return
+
+    yield _stream_tail({"summary": {"count": count, "failed": failed}}, fmt)
+
+
+def _stream_tail(content: dict, fmt: str) -> bytes:
+    """ 流的最后一条记录：汇总或错误信息 """
+    if fmt in JSON_FORMATS:
+        return dumps_json(content) + b"\n"
+    return binary_frame(content)
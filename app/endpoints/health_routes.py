@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 23:55
+@Author : YangFei
+@File   : health_routes.py
+@Desc   : 健康检查路由：存活探针与就绪探针，不依赖推理相关的包，启动期间也能立即响应
+"""
+import os
+import time
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.schemas.base import Response
+from core.readiness import STARTUP_RETRY_AFTER, get_startup_state
+
+
+# 创建路由
+health_router = APIRouter(prefix="/health", tags=["健康检查"])
+
+
+@health_router.get(
+    "/live",
+    response_model=Response,
+    summary="存活探针",
+    description="进程能够响应请求即为存活；启动失败（如默认模型加载失败）时返回 503，由编排系统重启。"
+)
+async def live():
+    """存活探针"""
+    startup = get_startup_state()
+    data = {"pid": os.getpid(), "phase": startup.phase, "uptime_seconds": round(time.time() - startup.started_at, 3)}
+    if startup.failed:
+        return JSONResponse(status_code=503, content=Response.fail(code=503, msg=startup.error, data=data).model_dump())
+    return Response.success(data=data)
+
+
+@health_router.get(
+    "/ready",
+    response_model=Response,
+    summary="就绪探针",
+    description="默认模型加载并预热完成后返回 200，否则返回 503，响应中包含推理依赖的导入耗时与各模型的加载进度。"
+)
+async def ready():
+    """就绪探针"""
+    startup = get_startup_state()
+    data = {"pid": os.getpid(), **startup.to_dict()}
+    if not startup.ready:
+        headers = None if startup.failed else {"Retry-After": str(int(STARTUP_RETRY_AFTER))}
+        return JSONResponse(status_code=503, headers=headers,
+                            content=Response.fail(code=503, msg=f"服务未就绪（{startup.phase}）", data=data).model_dump())
+    return Response.success(data=data)
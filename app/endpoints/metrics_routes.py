@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 20:05
+@Author : YangFei
+@File   : metrics_routes.py
+@Desc   : Prometheus 监控指标路由，挂载在应用根路径 /metrics
+"""
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import Response as RawResponse
+
+from app.service_dependencies import get_batch_scheduler, get_clip_client
+from core.embedding_cache import get_embedding_cache
+from core.executor import get_inference_executor, get_preprocess_executor
+from core.metrics import CONTENT_TYPE, get_registry
+from core.readiness import get_startup_state
+from core.text_tokens import get_token_cache
+
+_registry = get_registry()
+
+QUEUE_DEPTH = _registry.gauge("clip_batch_queue_depth", "微批队列中等待推理的条目数",
+                              ("model_type", "modality", "priority"))
+REQUESTS_REJECTED = _registry.counter("clip_requests_rejected_total", "被微批调度器拒绝的请求数",
+                                      ("model_type", "modality", "priority", "reason"))
+EXECUTOR_PENDING = _registry.gauge("clip_executor_pending", "线程池中执行中与排队中的任务数", ("executor",))
+MODELS_RESIDENT = _registry.gauge("clip_model_resident", "常驻内存的模型，1 表示已加载", ("model_type", "precision"))
+CACHE_LOOKUPS = _registry.counter("clip_cache_lookups_total", "缓存查询次数", ("cache", "result"))
+WORKER_READY = _registry.gauge("clip_workers_ready", "默认模型已加载并预热完成的工作进程数")
+
+
+def collect_runtime_metrics():
+    """ 采集回调：同步调度器队列深度与拒绝数、线程池排队数、常驻模型与缓存命中数
+
+    推理依赖导入完成之前跳过调度器与模型的指标，避免抓取指标时在事件循环中导入 torch。
+    """
+    startup = get_startup_state()
+    engine_loaded = startup.engine_loaded
+    WORKER_READY.set(1 if startup.ready else 0)
+    QUEUE_DEPTH.clear()
+    for queue in get_batch_scheduler().stats()["queues"] if engine_loaded else []:
+        labels = dict(model_type=queue["model_type"], modality=queue["modality"], priority=queue["priority"])
+        QUEUE_DEPTH.set(queue["queue_depth"], **labels)
+        REQUESTS_REJECTED.set(queue["rejected"], reason="admission", **labels)
+        REQUESTS_REJECTED.set(queue["shed"], reason="deadline", **labels)
+
+    for executor in (get_inference_executor(), get_preprocess_executor()):
+        stats = executor.stats()
+        EXECUTOR_PENDING.set(stats["pending"], executor=stats["name"])
+
+    MODELS_RESIDENT.clear()
+    for model in get_clip_client().get_loaded_models()["models"] if engine_loaded else []:
+        MODELS_RESIDENT.set(1, model_type=model["model_type"], precision=model["precision"])
+
+    cache_stats = get_embedding_cache().stats()
+    CACHE_LOOKUPS.set(cache_stats["memory_hits"], cache="embedding", result="memory_hit")
+    CACHE_LOOKUPS.set(cache_stats["disk_hits"], cache="embedding", result="disk_hit")
+    CACHE_LOOKUPS.set(cache_stats["misses"], cache="embedding", result="miss")
+    token_stats = get_token_cache().stats()
+    CACHE_LOOKUPS.set(token_stats["hits"], cache="token", result="hit")
+    CACHE_LOOKUPS.set(token_stats["misses"], cache="token", result="miss")
+
+
+_registry.add_collector(collect_runtime_metrics)
+
+
+# 创建路由
+metrics_router = APIRouter(tags=["监控模块"])
+
+
+@metrics_router.get(
+    "/metrics",
+    summary="监控指标",
+    description="Prometheus 文本格式的监控指标，配置了 CLIP_METRICS_DIR 时汇总全部工作进程。",
+    include_in_schema=False
+)
+async def metrics():
+    """监控指标接口：在事件循环中导出当前进程的指标，汇总其他进程的文件读写放到线程中执行"""
+    body = await asyncio.to_thread(_registry.render, _registry.snapshot())
+    return RawResponse(content=body, media_type=CONTENT_TYPE)
@@ -6,18 +6,31 @@
 @File   : routes.py
 @Desc   : 路由入口
 """
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from app.service_dependencies import interactive_priority, require_ready
 from .clip_routes import clip_router
+from .collection_routes import collection_router
+from .classify_routes import classify_router
+from .admin_routes import admin_router
 
 
 def create_routes() -> APIRouter:
     """ 创建并返回应用的主路由器，包含所有子路由器 """
-    # 创建主路由器
-    main_router = APIRouter()
+    # 创建主路由器，默认模型就绪之前返回 503；接口默认按交互优先级排队，批量接口在路由上单独声明
+    main_router = APIRouter(dependencies=[Depends(require_ready), Depends(interactive_priority)])
 
     # 包含多模态向量模块路由
     main_router.include_router(clip_router)
 
+    # 包含向量集合模块路由
+    main_router.include_router(collection_router)
+
+    # 包含零样本分类模块路由
+    main_router.include_router(classify_router)
+
+    # 包含管理模块路由
+    main_router.include_router(admin_router)
+
     # 返回主路由器
     return main_router
 
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 19:55
+@Author : YangFei
+@File   : uploads.py
+@Desc   : 上传文件读取：请求体与单个文件的大小限制、图像文件校验，解码时直接读取上传的临时文件
+"""
+import asyncio
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from app.schemas.base import Response
+from core.config import IMAGE_MAX_UPLOAD_BYTES, UPLOAD_MAX_REQUEST_BYTES
+from core.exceptions import ValidationException
+from core.image_decode import ImageFile, inspect_upload
+from core.metrics import STAGE_SECONDS
+
+
+# 单个部分除文件内容之外的部分头（Content-Disposition、Content-Type）允许的字节数
+_PART_HEADER_BYTES = 16 * 1024
+
+
+async def read_upload(file: UploadFile) -> ImageFile:
+    """ 校验已经接收完的上传图像文件并计算摘要，记录耗时；文件内容不会整体读入内存，解码时直接读取上传的临时文件
+
+    超过大小上限的文件在接收过程中已经由 UploadLimitMiddleware 拒绝，这里的校验在文件完整接收之后进行。
+
+    :raises ValidationException: 文件为空、超过大小上限、格式不支持或像素数超过上限
+    """
+    with STAGE_SECONDS.time(stage="upload_read", modality="image", batch_size="1"):
+        try:
+            # 大文件已经落盘，读取文件头与计算摘要放到线程中执行
+            return await asyncio.to_thread(inspect_upload, file.file)
+        except (ValueError, OSError) as e:
+            raise ValidationException(str(e))
+
+
+async def read_uploads(files: List[UploadFile]) -> Tuple[List[Optional[ImageFile]], List[Optional[str]]]:
+    """ 逐个校验上传的图像文件，不合法的文件只记录错误，不影响其他文件
+
+    :return: (图像列表, 错误信息列表)，两者与输入一一对应，不合法的文件图像为 None
+    """
+    images, errors = [], []
+    for file in files:
+        if not file.content_type or not file.content_type.startswith('image/'):
+            images.append(None)
+            errors.append("请上传图像文件")
+            continue
+        try:
+            images.append(await read_upload(file))
+            errors.append(None)
+        except ValidationException as e:
+            images.append(None)
+            errors.append(e.msg)
+    return images, errors
+
+
+def _multipart_boundary(content_type: bytes) -> Optional[bytes]:
+    """ 从 Content-Type 中取出 multipart 分隔符 """
+    for param in content_type.split(b";")[1:]:
+        key, _, value = param.strip().partition(b"=")
+        if key.lower() == b"boundary" and value:
+            return value.strip(b'"')
+    return None
+
+
+class _PartSizeLimit:
+    """ 在请求体流经时查找 multipart 分隔符，统计当前部分已接收的字节数
+
+    分隔符可能跨越两次接收的数据块，保留上一块末尾不足一个分隔符长度的字节一起查找。
+    """
+
+    def __init__(self, boundary: bytes, max_bytes: int):
+        self._delimiter = b"\r\n--" + boundary
+        self._max_bytes = max_bytes
+        # 第一个分隔符之前没有换行，预置换行统一处理
+        self._tail = b"\r\n"
+        self._part_bytes = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """ 接收一块数据，其中任一部分超过上限时返回 False """
+        data = self._tail + chunk
+        # start 之前的字节已经计入当前部分
+        start = len(self._tail)
+        found = data.find(self._delimiter)
+        while found >= 0:
+            if self._part_bytes + found - start > self._max_bytes:
+                return False
+            self._part_bytes, start = 0, found + len(self._delimiter)
+            found = data.find(self._delimiter, start)
+        self._part_bytes += len(data) - start
+        self._tail = data[-(len(self._delimiter) - 1):]
+        return self._part_bytes <= self._max_bytes
+
+
+class UploadLimitMiddleware:
+    """ ASGI 中间件：限制 multipart 请求体与其中单个文件的大小
+
+    带 Content-Length 的请求超过请求体上限时，在解析请求体之前直接返回 413；其余请求在读取时累计字节数，
+    同时按分隔符统计当前部分的字节数，请求体或任一文件超过上限时立即中止解析返回 413，不会继续接收和落盘。
+    """
+
+    def __init__(self, app, max_bytes: int = UPLOAD_MAX_REQUEST_BYTES, max_file_bytes: int = IMAGE_MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (self.max_bytes or self.max_file_bytes):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            await self.app(scope, receive, send)
+            return
+
+        msg = f"请求体超过 {self.max_bytes} 字节上限"
+        content_length = headers.get(b"content-length")
+        if self.max_bytes and content_length is not None and content_length.isdigit() \
+                and int(content_length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content=Response.fail(code=413, msg=msg).model_dump())
+            await response(scope, receive, send)
+            return
+
+        boundary = _multipart_boundary(headers[b"content-type"])
+        # 每个部分允许文件内容的上限加上部分头的字节数
+        parts = _PartSizeLimit(boundary, self.max_file_bytes + _PART_HEADER_BYTES) \
+            if boundary and self.max_file_bytes else None
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                # 在解析请求体的过程中抛出，由全局异常处理器返回 413
+                if self.max_bytes and received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=msg)
+                if parts is not None and not parts.feed(body):
+                    raise HTTPException(status_code=413, detail=f"上传的文件超过 {self.max_file_bytes} 字节上限")
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -7,6 +7,7 @@
 @Desc   : 全局异常处理
 """
 import logging
+import math
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
@@ -28,12 +29,17 @@ def register_exception_handlers(app: FastAPI):
         logger.error(f"捕获到应用程序异常: {e.msg}")
 
         # 组装错误响应内容
-        error_content = Response(code=e.status_code, msg=e.msg).model_dump()
+        error_content = Response.fail(code=e.status_code, msg=e.msg, data=e.data).model_dump()
+
+        # 请求被限流时通过 Retry-After 告知客户端多久之后重试
+        retry_after = getattr(e, "retry_after", None)
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
 
         # 返回 JSON 响应
         return JSONResponse(
             status_code=e.status_code,
             content=error_content,
+            headers=headers,
         )
 
     @app.exception_handler(HTTPException)
@@ -6,15 +6,28 @@
 @File   : main.py
 @Desc   : 入口文件
 """
+import asyncio
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from core.log_config import setup_logging
-from core.cn_clip import get_clip
+from core.config import (
+    WARMUP_ENABLED, DEFAULT_MODEL_TYPE, METRICS_DIR, METRICS_FLUSH_INTERVAL, BACKGROUND_LOAD, SWAP_POLL_INTERVAL
+)
+from core.executor import get_inference_executor, get_preprocess_executor
+from core.embedding_cache import get_embedding_cache
+from core.metrics import RequestMetricsMiddleware, get_registry
+from core.readiness import get_startup_state
+from core.swap_requests import get_swap_requests
+from core.vector_index import get_vector_store
 
 from app.endpoints import router
+from app.endpoints.health_routes import health_router
+from app.endpoints.metrics_routes import metrics_router
+from app.endpoints.uploads import UploadLimitMiddleware
+from app.service_dependencies import get_batch_scheduler, get_clip_client
 from app.errors import register_exception_handlers
 
 # 2. 初始化日志系统
@@ -29,8 +42,22 @@ async def lifespan(app: FastAPI):
     # 启动时初始化资源
     logger.info("Neon CHINESE CLIP 正在初始化...")
 
-    # 初始化 Chinese-CLIP 模型实例
-    await get_clip().init(model_type='mini')
+    # 导入推理依赖，加载并预热默认模型，完成后就绪探针才返回 200
+    startup = get_startup_state()
+    startup.begin()
+    starter = asyncio.create_task(startup.run(DEFAULT_MODEL_TYPE, warmup=WARMUP_ENABLED))
+    if not BACKGROUND_LOAD:
+        # 关闭后台启动时等待加载完成再对外提供服务，加载失败时应用启动失败
+        await starter
+        if startup.failed:
+            raise RuntimeError(f"服务启动失败: {startup.error}")
+
+    # 多进程部署时定期写入指标快照，供抓取 /metrics 的进程汇总
+    flusher = asyncio.create_task(get_registry().run_flusher(METRICS_FLUSH_INTERVAL)) if METRICS_DIR else None
+    # 在线程中预先加载磁盘上的向量集合，首个请求不需要在事件循环中重放
+    preloader = asyncio.create_task(asyncio.to_thread(get_vector_store().preload))
+    # 轮询管理接口发布的热切换请求，每个工作进程各自执行
+    swapper = asyncio.create_task(get_swap_requests().run_watcher(SWAP_POLL_INTERVAL))
 
     try:
         # yield 之前的代码在应用启动时执行
@@ -40,8 +67,25 @@ async def lifespan(app: FastAPI):
     finally:
         # 关闭时释放资源
         logger.info("Neon CHINESE CLIP 正在关闭...")
+        # 启动任务尚未完成时取消，线程中进行的导入或加载会在完成后退出
+        starter.cancel()
+        swapper.cancel()
+        preloader.cancel()
+        # 停止指标快照任务，并写入最后一次快照
+        if flusher is not None:
+            flusher.cancel()
+            get_registry().flush()
+        # 停止微批调度器
+        if startup.engine_loaded:
+            await get_batch_scheduler().shutdown()
+        # 关闭推理与预处理线程池
+        get_inference_executor().shutdown()
+        get_preprocess_executor().shutdown()
+        # 关闭向量磁盘缓存
+        get_embedding_cache().close()
         # 关闭 Chinese-CLIP 模型实例
-        await get_clip().shutdown()
+        if startup.engine_loaded:
+            await get_clip_client().shutdown()
 
 
 # 创建 FastAPI 应用实例
@@ -61,8 +105,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录请求耗时，按路由模板区分接口
+app.add_middleware(RequestMetricsMiddleware)
+
+# 限制上传请求体的大小，过大的请求在写入临时文件之前拒绝
+app.add_middleware(UploadLimitMiddleware)
+
 # 6. 注册全局异常处理器
 register_exception_handlers(app)
 
 # 7. 导入并注册路由
 app.include_router(router=router, prefix="/api")
+
+# 监控指标挂载在根路径，使用 Prometheus 默认的抓取路径
+app.include_router(router=metrics_router)
+
+# 健康检查挂载在根路径，不受启动期间的 503 限制
+app.include_router(router=health_router)
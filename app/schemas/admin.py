@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 23:30
+@Author : YangFei
+@File   : admin.py
+@Desc   : 管理接口请求结构
+"""
+from typing import Optional
+from pydantic import BaseModel, Field
+
+
+class ModelSwapRequest(BaseModel):
+    """模型热切换请求"""
+    model_type: str = Field(..., description="要加载的模型类型，已常驻时重新加载并替换")
+    precision: Optional[str] = Field(default=None, description="新实例的推理精度：fp32、bf16、int8，默认使用当前配置")
+    make_default: bool = Field(default=True, description="切换完成后是否设为默认模型")
+    warmup: bool = Field(default=True, description="切换前是否用合成批次预热新实例")
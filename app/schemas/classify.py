@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 16:32
+@Author : YangFei
+@File   : classify.py
+@Desc   : 零样本分类请求结构，图像分类通过 form-data 传递，直接写在路由里面
+"""
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class LabelSetRequest(BaseModel):
+    """创建或替换标签集请求"""
+    labels: List[str] = Field(..., description="标签列表")
+    template: Optional[str] = Field(default=None, description="提示词模板，{} 替换为标签，如 \"一张{}的照片\"")
+    model_types: List[str] = Field(default_factory=list, description="需要预先计算标签向量的模型类型，其他模型首次使用时计算")
+
+
+class ClassifyTextRequest(BaseModel):
+    """文本零样本分类请求，label_set 与 labels 二选一"""
+    text: str = Field(..., description="要分类的文本")
+    label_set: Optional[str] = Field(default=None, description="已注册的标签集名称")
+    labels: Optional[List[str]] = Field(default=None, description="内联标签列表")
+    template: Optional[str] = Field(default=None, description="内联标签的提示词模板，{} 替换为标签")
+    model_type: str = Field(default="mini", description="使用的模型类型")
+    top_k: Optional[int] = Field(default=None, gt=0, description="只返回概率最高的前 k 个标签，默认全部返回")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 15:20
+@Author : YangFei
+@File   : collection.py
+@Desc   : 向量集合请求结构，图像相关的接口通过 form-data 传递，直接写在路由里面
+"""
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+
+class CreateCollectionRequest(BaseModel):
+    """创建向量集合请求"""
+    name: str = Field(..., min_length=1, max_length=128, description="集合名称")
+    model_type: str = Field(default="mini", description="集合使用的模型类型，文本、图像写入与检索都使用该模型")
+    index_type: str = Field(default="flat", description="索引类型：flat 暴力检索，ivf 近似检索")
+    nlist: Optional[int] = Field(default=None, gt=0, description="IVF 聚类数，默认 4 * sqrt(N)")
+    nprobe: int = Field(default=8, gt=0, description="IVF 检索时探查的聚类数")
+
+
+class TextItem(BaseModel):
+    """文本条目"""
+    id: str = Field(..., description="条目 id")
+    text: str = Field(..., description="文本内容")
+
+
+class VectorItem(BaseModel):
+    """向量条目"""
+    id: str = Field(..., description="条目 id")
+    vector: List[float] = Field(..., description="已归一化的向量")
+
+
+class UpsertTextsRequest(BaseModel):
+    """写入文本条目请求"""
+    items: List[TextItem] = Field(..., description="文本条目列表")
+    overwrite: bool = Field(default=True, description="id 已存在时是否覆盖，为 false 时存在重复 id 则整体失败")
+
+
+class UpsertVectorsRequest(BaseModel):
+    """写入向量条目请求"""
+    items: List[VectorItem] = Field(..., description="向量条目列表")
+    overwrite: bool = Field(default=True, description="id 已存在时是否覆盖，为 false 时存在重复 id 则整体失败")
+
+
+class SearchRequest(BaseModel):
+    """检索请求，text 与 vector 二选一"""
+    text: Optional[str] = Field(default=None, description="查询文本")
+    vector: Optional[List[float]] = Field(default=None, description="查询向量")
+    top_k: int = Field(default=10, gt=0, description="返回的结果数")
+    nprobe: Optional[int] = Field(default=None, gt=0, description="IVF 检索时探查的聚类数，默认使用集合配置")
@@ -6,11 +6,24 @@
 @File   : vector.py
 @Desc   : 向量请求结构, 文件上传的不能使用 pydantic 模型来处理，需要直接写在路由里面
 """
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
 class TextVectorRequest(BaseModel):
     """文本向量请求"""
     texts: List[str] = Field(..., description="要编码的文本列表")
-    model_type: str = Field(default="mini", description="使用的模型类型")
\ No newline at end of file
+    model_type: str = Field(default="mini", description="使用的模型类型")
+    output_dim: Optional[int] = Field(default=None, gt=0, description="输出维度，使用模型的投影矩阵降维并重新归一化，默认原始维度")
+
+
+class ProjectionFitRequest(BaseModel):
+    """拟合降维投影矩阵请求，texts 与 collections 至少提供一个"""
+    texts: List[str] = Field(default_factory=list, description="校准文本")
+    collections: List[str] = Field(default_factory=list, description="作为校准语料的向量集合（需使用同一模型），可用于提供图像向量")
+    method: str = Field(default="pca", description="降维方法：pca 主成分分析，random 随机正交投影（不依赖语料分布）")
+    max_dim: int = Field(default=256, gt=0, description="最大输出维度，请求时 output_dim 不能超过该值")
+    holdout_ratio: float = Field(default=0.2, ge=0, lt=1, description="留出集比例，留出集不参与拟合，用于评估召回率")
+    eval_dims: Optional[List[int]] = Field(default=None, description="评估召回率的维度，默认 64、128、256 与 max_dim")
+    top_k: int = Field(default=10, gt=0, description="评估 recall@k 的 k")
+    seed: int = Field(default=0, description="划分留出集与随机投影的随机种子")
\ No newline at end of file
@@ -5,15 +5,136 @@
 @Author : YangFei
 @File   : service_dependencies.py
 @Desc   : 服务依赖注入
+
+向量服务依赖 torch 与 cn_clip，在后台启动时导入；这里在获取服务时才导入，导入路由不会连带导入推理依赖。
 """
-from fastapi import Depends
+import hmac
+from functools import lru_cache
+from typing import Optional
+from fastapi import Depends, Header
+
+from core.batching import MicroBatchScheduler
+from core.config import ADMIN_TOKEN
+from core.embedding_cache import get_embedding_cache
+from core.exceptions import ForbiddenException, NotFoundException, ServiceUnavailableException
+from core.label_sets import get_label_store
+from core.priority import PRIORITY_BULK, PRIORITY_INTERACTIVE, parse_priority, set_request_priority
+from core.projection import get_projection_store
+from core.readiness import STARTUP_RETRY_AFTER, get_startup_state
+from core.vector_index import get_vector_store
+
+
+def request_priority(default: str):
+    """ 生成设置请求优先级的路由依赖：X-Priority 请求头优先，其次使用接口的默认优先级 """
+
+    async def dependency(
+        x_priority: Optional[str] = Header(None, description="请求优先级：interactive（交互）、bulk（批量）"),
+        x_deadline_ms: Optional[float] = Header(None, gt=0, description="允许的排队时间（毫秒），只能比默认值更短")
+    ):
+        set_request_priority(parse_priority(x_priority) if x_priority else default, x_deadline_ms)
+
+    return dependency
+
+
+async def require_admin(
+    x_admin_token: Optional[str] = Header(None, description="管理接口访问令牌，与 CLIP_ADMIN_TOKEN 一致")
+):
+    """ 管理接口的访问校验：未配置访问令牌时管理接口不启用（404），请求头中的令牌必须一致 """
+    if not ADMIN_TOKEN:
+        raise NotFoundException("管理接口未启用，请配置 CLIP_ADMIN_TOKEN")
+    if not hmac.compare_digest((x_admin_token or "").encode(), ADMIN_TOKEN.encode()):
+        raise ForbiddenException("管理接口访问令牌无效")
 
-from core.cn_clip import get_clip
-from app.services.clip_vector import ClipVectorService
+
+async def require_ready():
+    """ 默认模型加载并预热完成之前，业务接口返回 503 并通过 Retry-After 告知客户端重试时间 """
+    startup = get_startup_state()
+    if startup.failed:
+        raise ServiceUnavailableException(f"服务启动失败: {startup.error}")
+    if not startup.ready:
+        raise ServiceUnavailableException(f"服务正在启动（{startup.phase}），请稍后重试",
+                                          retry_after=STARTUP_RETRY_AFTER)
+
+
+# 交互请求：单条检索、分类等，优先下发
+interactive_priority = request_priority(PRIORITY_INTERACTIVE)
+
+# 批量请求：批量上传、流式批量与回填，按比例分到推理批次
+bulk_priority = request_priority(PRIORITY_BULK)
+
+
+def get_clip_client():
+    """ 获取 Chinese-CLIP 模型实例 """
+    from core.cn_clip import get_clip
+    return get_clip()
+
+
+@lru_cache()
+def get_batch_scheduler() -> MicroBatchScheduler:
+    """ 获取微批调度器（进程内单例），批次由共享的向量服务实例执行 """
+    from app.services.clip_vector import ClipVectorService
+    return MicroBatchScheduler(runner=ClipVectorService(get_clip_client()).run_batch)
 
 
 def get_vector_service(
-    client = Depends(get_clip)
+    client = Depends(get_clip_client),
+    scheduler = Depends(get_batch_scheduler),
+    cache = Depends(get_embedding_cache)
 ):
     """ 获取向量服务 """
-    return ClipVectorService(client)
\ No newline at end of file
+    from app.services.clip_vector import ClipVectorService
+    return ClipVectorService(client, scheduler, cache=cache)
+
+
+def get_collection_service(
+    store = Depends(get_vector_store),
+    vector_service = Depends(get_vector_service)
+):
+    """ 获取向量集合服务 """
+    from app.services.collection import CollectionService
+    return CollectionService(store, vector_service)
+
+
+def get_classify_service(
+    store = Depends(get_label_store),
+    vector_service = Depends(get_vector_service)
+):
+    """ 获取零样本分类服务 """
+    from app.services.classify import ClassifyService
+    return ClassifyService(store, vector_service)
+
+
+def get_bulk_encode_service(
+    vector_service = Depends(get_vector_service)
+):
+    """ 获取流式批量向量化服务 """
+    from app.services.bulk_encode import BulkEncodeService
+    return BulkEncodeService(vector_service)
+
+
+def get_projection_service(
+    store = Depends(get_projection_store),
+    vector_service = Depends(get_vector_service),
+    vector_store = Depends(get_vector_store)
+):
+    """ 获取向量降维服务 """
+    from app.services.projection import ProjectionService
+    return ProjectionService(store, vector_service, vector_store)
+
+
+def get_similarity_service(
+    vector_service = Depends(get_vector_service),
+    vector_store = Depends(get_vector_store)
+):
+    """ 获取相似度矩阵服务 """
+    from app.services.similarity import SimilarityService
+    return SimilarityService(vector_service, vector_store)
+
+
+def get_dedup_service(
+    vector_service = Depends(get_vector_service),
+    vector_store = Depends(get_vector_store)
+):
+    """ 获取近重复图像检测服务 """
+    from app.services.dedup import DedupService
+    return DedupService(vector_service, vector_store)
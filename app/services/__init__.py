@@ -7,7 +7,13 @@
 @Desc   : 
 """
 from .clip_vector import ClipVectorService
+from .bulk_encode import BulkEncodeService
+from .classify import ClassifyService
+from .collection import CollectionService
 
 __all__ = [
     "ClipVectorService",
+    "ClassifyService",
+    "BulkEncodeService",
+    "CollectionService",
 ]
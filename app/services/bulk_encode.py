@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 17:40
+@Author : YangFei
+@File   : bulk_encode.py
+@Desc   : 流式批量向量化服务：逐行读取 NDJSON 记录，分批流水线处理，每批完成后立即返回
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import urllib.request
+import numpy as np
+
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from app.services.clip_vector import ClipVectorService
+from core.config import (
+    STREAM_BATCH_SIZE, STREAM_MAX_INFLIGHT_BATCHES, STREAM_MAX_LINE_BYTES, STREAM_FETCH_URLS, STREAM_FETCH_TIMEOUT
+)
+from core.exceptions import AppException, TooManyRequestsException, ValidationException
+from core.executor import BoundedExecutor, get_preprocess_executor
+
+logger = logging.getLogger(__name__)
+
+# 推理队列已满时的重试次数与初始等待时间（秒），批量回填不应因为瞬时拥塞整体失败
+_BUSY_RETRIES = 5
+_BUSY_BACKOFF = 0.2
+
+# 单个批次的处理结果：[(id, 向量或 None, 错误信息或 None), ...]
+BatchResult = List[Tuple[Any, Optional[np.ndarray], Optional[str]]]
+
+
+class _Record:
+    """ 解析后的单条记录 """
+    __slots__ = ("id", "line", "text", "image", "image_url", "error")
+
+    def __init__(self, line: int, id: Any = None, text: Optional[str] = None, image: Optional[str] = None,
+                 image_url: Optional[str] = None, error: Optional[str] = None):
+        self.id = id
+        self.line = line
+        self.text = text
+        self.image = image
+        self.image_url = image_url
+        self.error = error
+
+
+def _parse_record(line: int, raw: bytes) -> _Record:
+    """ 解析一行 NDJSON 记录，格式错误时记录错误信息而不是抛出 """
+    try:
+        data = json.loads(raw)
+    except ValueError as e:
+        return _Record(line, error=f"第 {line} 行不是合法的 JSON: {e}")
+    if not isinstance(data, dict):
+        return _Record(line, error=f"第 {line} 行必须是 JSON 对象")
+
+    record = _Record(line, id=data.get("id", line), text=data.get("text"), image=data.get("image"),
+                     image_url=data.get("image_url"))
+    fields = [name for name in ("text", "image", "image_url") if data.get(name) is not None]
+    if len(fields) != 1:
+        record.error = "text、image、image_url 必须且只能指定一个"
+    elif not isinstance(data[fields[0]], str) or not data[fields[0]]:
+        record.error = f"{fields[0]} 必须是非空字符串"
+    elif record.image_url is not None and not STREAM_FETCH_URLS:
+        record.error = "服务端未开启图像下载，请使用 base64 编码的 image 字段"
+    return record
+
+
+def _load_image_bytes(image: Optional[str], image_url: Optional[str]) -> bytes:
+    """ 获取图像的原始字节：base64（可带 data URI 前缀）或下载 URL，在预处理线程池中执行 """
+    if image is not None:
+        if image.startswith("data:"):
+            image = image.split(",", 1)[-1]
+        try:
+            return base64.b64decode(image, validate=True)
+        except (binascii.Error, ValueError) as e:
+            raise ValueError(f"base64 解码失败: {e}")
+
+    if not image_url.startswith(("http://", "https://")):
+        raise ValueError("image_url 只支持 http 与 https")
+    with urllib.request.urlopen(image_url, timeout=STREAM_FETCH_TIMEOUT) as response:
+        data = response.read(STREAM_MAX_LINE_BYTES + 1)
+    if len(data) > STREAM_MAX_LINE_BYTES:
+        raise ValueError(f"图像超过 {STREAM_MAX_LINE_BYTES} 字节")
+    return data
+
+
+class BulkEncodeService:
+    """流式批量向量化服务
+
+    请求体逐行解析，每 batch_size 条记录组成一个批次并立即开始处理；同时处理中的批次数不超过 max_inflight，
+    达到上限时暂停读取请求体。因此解码、预处理与推理在相邻批次之间重叠执行，而服务端内存只与批次数、批大小有关，
+    与输入总量无关。结果严格按输入顺序逐批返回。
+    """
+
+    def __init__(self, vector_service: ClipVectorService, preprocess_executor: Optional[BoundedExecutor] = None,
+                 batch_size: int = STREAM_BATCH_SIZE, max_inflight: int = STREAM_MAX_INFLIGHT_BATCHES):
+        """初始化流式批量向量化服务"""
+        self._vector_service = vector_service
+        self._preprocess_executor = preprocess_executor or get_preprocess_executor()
+        self._batch_size = max(1, batch_size)
+        self._max_inflight = max(1, max_inflight)
+
+    def normalize_model_type(self, model_type: str) -> str:
+        """标准化并校验模型类型"""
+        return self._vector_service.normalize_model_type(model_type)
+
+    def check_output_dim(self, model_key: str, output_dim: Optional[int]):
+        """在开始读取请求体之前校验输出维度"""
+        self._vector_service.check_output_dim(model_key, output_dim)
+
+    async def encode_stream(self, chunks: AsyncIterator[bytes], model_key: str,
+                            output_dim: Optional[int] = None) -> AsyncIterator[BatchResult]:
+        """逐批返回向量化结果，解析失败或向量化失败的记录在对应位置返回错误信息"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self._max_inflight)
+        producer = asyncio.create_task(self._produce(chunks, model_key, output_dim, queue))
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield await item
+        finally:
+            # 客户端断开或处理失败时，停止读取并取消尚未完成的批次
+            producer.cancel()
+            while not queue.empty():
+                item = queue.get_nowait()
+                if isinstance(item, asyncio.Task):
+                    item.cancel()
+
+    async def _produce(self, chunks: AsyncIterator[bytes], model_key: str, output_dim: Optional[int],
+                       queue: asyncio.Queue):
+        """读取请求体并按批次创建处理任务，队列满时阻塞，从而对读取请求体形成背压"""
+        try:
+            records: List[_Record] = []
+            async for line, raw in self._iter_lines(chunks):
+                records.append(_parse_record(line, raw))
+                if len(records) >= self._batch_size:
+                    await queue.put(asyncio.create_task(self._process(model_key, records, output_dim)))
+                    records = []
+            if records:
+                await queue.put(asyncio.create_task(self._process(model_key, records, output_dim)))
+            await queue.put(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+
+    @staticmethod
+    async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+        """把请求体切分成行，跳过空行，返回 (行号, 内容)"""
+        buffer = bytearray()
+        line = 0
+        async for chunk in chunks:
+            buffer.extend(chunk)
+            start = 0
+            while True:
+                end = buffer.find(b"\n", start)
+                if end < 0:
+                    break
+                line += 1
+                raw = bytes(buffer[start:end]).strip()
+                if raw:
+                    yield line, raw
+                start = end + 1
+            del buffer[:start]
+            if len(buffer) > STREAM_MAX_LINE_BYTES:
+                raise ValidationException(f"第 {line + 1} 行超过 {STREAM_MAX_LINE_BYTES} 字节")
+
+        raw = bytes(buffer).strip()
+        if raw:
+            yield line + 1, raw
+
+    async def _process(self, model_key: str, records: List[_Record], output_dim: Optional[int] = None) -> BatchResult:
+        """处理一个批次：文本与图像分别向量化，结果按记录顺序返回"""
+        vectors: List[Optional[np.ndarray]] = [None] * len(records)
+        errors: List[Optional[str]] = [record.error for record in records]
+
+        text_indexes = [i for i, r in enumerate(records) if r.error is None and r.text is not None]
+        image_indexes = [i for i, r in enumerate(records) if r.error is None and r.text is None]
+
+        if text_indexes:
+            text_vectors = await self._retry_busy(
+                self._vector_service.encode_text, [records[i].text for i in text_indexes], model_key, output_dim)
+            for row, i in enumerate(text_indexes):
+                vectors[i] = text_vectors[row]
+
+        if image_indexes:
+            await self._retry_busy(self._process_images, model_key, output_dim, records, image_indexes, vectors,
+                                   errors)
+
+        return [(record.id, vectors[i], errors[i]) for i, record in enumerate(records)]
+
+    async def _process_images(self, model_key: str, output_dim: Optional[int], records: List[_Record],
+                              indexes: List[int], vectors: List[Optional[np.ndarray]], errors: List[Optional[str]]):
+        """读取并向量化批次中的图像，结果写回 vectors 与 errors"""
+        loaded = await asyncio.gather(
+            *[self._preprocess_executor.run(_load_image_bytes, records[i].image, records[i].image_url)
+              for i in indexes],
+            return_exceptions=True
+        )
+        valid_indexes, image_data_list = [], []
+        for i, result in zip(indexes, loaded):
+            # 线程池已满属于整体失败，由外层退避重试
+            if isinstance(result, AppException):
+                raise result
+            if isinstance(result, Exception):
+                errors[i] = f"图像读取失败: {result}"
+            else:
+                valid_indexes.append(i)
+                image_data_list.append(result)
+
+        if valid_indexes:
+            image_vectors, messages = await self._vector_service.encode_image_batch(
+                image_data_list, model_key, output_dim)
+            for row, i in enumerate(valid_indexes):
+                vectors[i], errors[i] = image_vectors[row], messages[row]
+
+    @staticmethod
+    async def _retry_busy(fn, *args):
+        """推理队列已满时退避重试，服务端给出重试时间时按重试时间等待"""
+        delay = _BUSY_BACKOFF
+        for attempt in range(_BUSY_RETRIES):
+            try:
+                return await fn(*args)
+            except TooManyRequestsException as e:
+                if attempt == _BUSY_RETRIES - 1:
+                    raise
+                await asyncio.sleep(max(delay, e.retry_after or 0))
+                delay *= 2
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 16:25
+@Author : YangFei
+@File   : classify.py
+@Desc   : 零样本分类服务：图像或文本与一组标签比较，按模型的温度系数换算成概率
+"""
+import logging
+import numpy as np
+
+from typing import List, Optional
+
+from app.services.clip_vector import ClipVectorService
+from core.exceptions import ValidationException
+from core.image_decode import ImageSource
+from core.label_sets import LabelSetStore, build_prompts
+
+logger = logging.getLogger(__name__)
+
+
+class ClassifyService:
+    """零样本分类服务"""
+
+    def __init__(self, store: LabelSetStore, vector_service: ClipVectorService):
+        """初始化零样本分类服务"""
+        self._store = store
+        self._vector_service = vector_service
+
+    async def put_label_set(self, name: str, labels: List[str], template: Optional[str] = None,
+                            model_types: Optional[List[str]] = None) -> dict:
+        """创建或替换标签集，并为指定的模型预先计算标签向量"""
+        model_keys = [self._vector_service.normalize_model_type(model_type) for model_type in model_types or []]
+        label_set = self._store.put(name, labels, template)
+        for model_key in model_keys:
+            matrix = await self._vector_service.encode_text(label_set.prompts, model_key)
+            label_set.set_embeddings(self._vector_service.cache_namespace(model_key), matrix)
+        return label_set.to_dict()
+
+    def drop_label_set(self, name: str):
+        """删除标签集"""
+        self._store.drop(name)
+
+    def list_label_sets(self) -> List[dict]:
+        """列出标签集"""
+        return self._store.list()
+
+    async def _label_embeddings(self, model_key: str, label_set: Optional[str], labels: Optional[List[str]],
+                                template: Optional[str]):
+        """获取标签及其向量矩阵，优先使用已缓存的矩阵"""
+        namespace = self._vector_service.cache_namespace(model_key)
+
+        if label_set is not None:
+            entry = self._store.get(label_set)
+            matrix = entry.get_embeddings(namespace)
+            if matrix is None:
+                matrix = await self._vector_service.encode_text(entry.prompts, model_key)
+                entry.set_embeddings(namespace, matrix)
+            return entry.labels, matrix
+
+        prompts = build_prompts(labels, template)
+        matrix = self._store.get_inline(namespace, prompts)
+        if matrix is None:
+            matrix = await self._vector_service.encode_text(prompts, model_key)
+            self._store.put_inline(namespace, prompts, matrix)
+        return labels, matrix
+
+    async def classify(self, model_type: str, label_set: Optional[str] = None, labels: Optional[List[str]] = None,
+                       template: Optional[str] = None, text: Optional[str] = None,
+                       image_data: Optional[ImageSource] = None, top_k: Optional[int] = None) -> dict:
+        """对图像或文本做零样本分类，返回按概率排序的标签"""
+        if (label_set is None) == (not labels):
+            raise ValidationException("label_set 与 labels 必须且只能指定一个")
+        if (text is None) == (image_data is None):
+            raise ValidationException("文本与图像必须且只能指定一个")
+
+        model_key = self._vector_service.normalize_model_type(model_type)
+        names, matrix = await self._label_embeddings(model_key, label_set, labels, template)
+
+        if text is not None:
+            query = (await self._vector_service.encode_text([text], model_key))[0]
+        else:
+            query = await self._vector_service.encode_image(image_data, model_key)
+
+        logit_scale = await self._vector_service.get_logit_scale(model_key)
+        return {
+            "model_type": model_key,
+            "logit_scale": logit_scale,
+            "results": self._rank(query, matrix, logit_scale, names, top_k),
+        }
+
+    @staticmethod
+    def _rank(query: np.ndarray, matrix: np.ndarray, logit_scale: float, labels: List[str],
+              top_k: Optional[int] = None) -> List[dict]:
+        """一次矩阵运算得到全部标签的相似度与 softmax 概率，按概率从高到低返回"""
+        similarities = matrix @ query
+        logits = logit_scale * similarities
+        # 减去最大值保证数值稳定
+        exp = np.exp(logits - logits.max())
+        probabilities = exp / exp.sum()
+
+        order = np.argsort(-probabilities)
+        if top_k is not None:
+            order = order[:top_k]
+        return [
+            {"label": labels[i], "probability": float(probabilities[i]), "similarity": float(similarities[i])}
+            for i in order
+        ]
@@ -6,15 +6,23 @@
 @File   : clip_vector_service.py
 @Desc   : Chinese-CLIP 多模态向量服务
 """
-from core.exceptions import InternalServerException, AppException
-import io
+from core.exceptions import InternalServerException, AppException, ValidationException
+import asyncio
 import logging
+import numpy as np
 import torch
 
-from typing import List
-from PIL import Image
+from typing import List, Optional, Tuple
 
-from core.cn_clip import ChineseCLIP
+from core.batching import MicroBatchScheduler
+from core.cn_clip import ChineseCLIP, LoadedModel
+from core.config import INFER_MAX_BATCH_SIZE
+from core.embedding_cache import EmbeddingCache
+from core.executor import BoundedExecutor, get_inference_executor, get_preprocess_executor
+from core.image_decode import ImageSource, load_image, load_image_with_hash
+from core.metrics import BATCH_SIZE, STAGE_SECONDS, batch_size_label
+from core.projection import Projection, ProjectionStore, get_projection_store
+from core.text_tokens import TokenCache, get_token_cache, length_buckets
 
 logger = logging.getLogger(__name__)
 
@@ -22,36 +30,235 @@ logger = logging.getLogger(__name__)
 class ClipVectorService:
     """Chinese-CLIP 多模态向量服务"""
 
-    def __init__(self, client: ChineseCLIP = None):
+    def __init__(self, client: ChineseCLIP = None, scheduler: Optional[MicroBatchScheduler] = None,
+                 inference_executor: Optional[BoundedExecutor] = None,
+                 preprocess_executor: Optional[BoundedExecutor] = None,
+                 cache: Optional[EmbeddingCache] = None, token_cache: Optional[TokenCache] = None,
+                 projections: Optional[ProjectionStore] = None):
         """初始化 Chinese-CLIP 服务实例"""
         # 获取模型实例
         self._client = client
+        # 微批调度器，为空时每个请求单独推理
+        self._scheduler = scheduler
+        # 向量缓存，为空时不使用缓存
+        self._cache = cache if cache is not None and cache.enabled else None
+        # 前向推理与图像解码都在线程池中执行，事件循环只等待结果
+        self._inference_executor = inference_executor or get_inference_executor()
+        self._preprocess_executor = preprocess_executor or get_preprocess_executor()
+        # 文本 token id 缓存
+        self._token_cache = token_cache or get_token_cache()
+        # 降维投影矩阵，请求指定 output_dim 时使用
+        self._projections = projections or get_projection_store()
 
     def get_available_models(self) -> List[str]:
         """获取可用模型列表"""
         return self._client.get_available_models()
 
+    def get_loaded_models(self) -> dict:
+        """获取常驻内存的模型信息"""
+        return self._client.get_loaded_models()
+
     async def switch_model(self, model_type: str):
-        """切换模型"""
+        """切换默认模型"""
         await self._client.switch_model(model_type)
 
-    async def encode_text(self, texts: List[str]) -> List[List[float]]:
-        """文本向量化"""
-        try:
-            model = self._client.model
-            text_tokens = self._client.tokenize(texts)
-            text_tokens = text_tokens.to(next(model.parameters()).device)
+    def request_hot_swap(self, model_type: str, precision: Optional[str] = None, make_default: bool = True,
+                         warmup: bool = True) -> dict:
+        """发布热切换请求，由全部工作进程执行，返回请求内容"""
+        return self._client.request_hot_swap(model_type, precision, make_default, warmup)
+
+    def get_swaps(self) -> List[dict]:
+        """获取最近的热切换报告"""
+        return self._client.get_swaps()
+
+    def normalize_model_type(self, model_type: str) -> str:
+        """标准化并校验模型类型"""
+        return self._client.normalize_model_type(model_type)
+
+    def cache_namespace(self, model_type: str) -> str:
+        """获取模型类型的向量缓存命名空间（模型@精度）"""
+        return self._client.cache_namespace(model_type)
+
+    async def get_logit_scale(self, model_type: str) -> float:
+        """获取模型的温度系数"""
+        return await self._client.get_logit_scale(self.normalize_model_type(model_type))
+
+    def _resolve_model_type(self, model_type: Optional[str]) -> str:
+        """确定本次请求使用的模型类型，未指定时使用当前模型"""
+        return self._client.normalize_model_type(model_type or self._client.model_type)
+
+    async def _dispatch(self, model_type: str, modality: str, items: list) -> np.ndarray:
+        """提交推理：有调度器时进入微批队列，否则直接执行"""
+        if self._scheduler is not None:
+            return await self._scheduler.submit(model_type, modality, items)
+        return await self.run_batch(model_type, modality, items)
+
+    async def run_batch(self, model_type: str, modality: str, items: list) -> np.ndarray:
+        """在指定模型上执行一次批量推理，返回归一化后的向量矩阵"""
+        BATCH_SIZE.observe(len(items), model_type=model_type, modality=modality)
+        # 推理期间持有模型引用，避免被淘汰
+        async with self._client.acquire(model_type) as entry:
+            if modality == "text":
+                return await self._run_text(entry, items)
+
+            # 超过单次前向推理上限的批次切块执行，避免一次性占用过多内存
+            outputs = []
+            for start in range(0, len(items), INFER_MAX_BATCH_SIZE):
+                chunk = items[start:start + INFER_MAX_BATCH_SIZE]
+                outputs.append(await self._inference_executor.run(self._forward_image, entry, chunk))
+
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+    async def _run_text(self, entry: LoadedModel, texts: List[str]) -> np.ndarray:
+        """文本推理：按 token 数分桶，每个桶补齐到最小长度后执行，结果按原始顺序返回"""
+        token_ids = await self._preprocess_executor.run(self._tokenize, entry.model_type, texts)
+        # 追踪后的编码器只接受固定形状，补齐到完整的上下文长度
+        buckets = length_buckets(token_ids, INFER_MAX_BATCH_SIZE, full_length=entry.compiled is not None)
+
+        outputs = None
+        for indexes, text_tokens in buckets:
+            features = await self._inference_executor.run(self._forward_text, entry, text_tokens)
+            if outputs is None:
+                outputs = np.empty((len(texts), features.shape[1]), dtype=features.dtype)
+            outputs[indexes] = features
+        return outputs
+
+    def _tokenize(self, model_type: str, texts: List[str]) -> List[Tuple[int, ...]]:
+        """文本分词（带缓存），记录分词耗时"""
+        with STAGE_SECONDS.time(stage="tokenize", model_type=model_type, modality="text",
+                                batch_size=batch_size_label(len(texts))):
+            return self._token_cache.encode(texts)
 
-            with torch.no_grad():
+    def _forward_text(self, entry: LoadedModel, text_tokens: torch.Tensor) -> np.ndarray:
+        """文本前向推理，输入为补齐后的 token 张量"""
+        labels = dict(model_type=entry.model_type, modality="text", batch_size=batch_size_label(len(text_tokens)))
+        text_tokens = text_tokens.to(entry.device)
+
+        with torch.no_grad():
+            with STAGE_SECONDS.time(stage="forward", **labels):
                 # 编码文本
-                text_features = model.encode_text(text_tokens)
+                text_features = entry.encode_text(text_tokens)
+            with STAGE_SECONDS.time(stage="normalize", **labels):
                 # 计算文本向量的范数
                 text_norm = text_features.norm(dim=1, keepdim=True)
                 # 归一化向量
                 text_features = text_features / text_norm
+                return text_features.cpu().numpy()
+
+    def _forward_image(self, entry: LoadedModel, images: List[torch.Tensor]) -> np.ndarray:
+        """图像前向推理，多张预处理后的图像堆叠成一个批次"""
+        labels = dict(model_type=entry.model_type, modality="image", batch_size=batch_size_label(len(images)))
+        # 堆叠成 batch 维度
+        image_tensor = torch.stack(images)
+        # 将图像张量移动到模型所在设备
+        image_tensor = image_tensor.to(entry.device)
+
+        with torch.no_grad():
+            with STAGE_SECONDS.time(stage="forward", **labels):
+                # 编码图像
+                image_features = entry.encode_image(image_tensor)
+            with STAGE_SECONDS.time(stage="normalize", **labels):
+                # 计算图像向量的范数
+                image_norm = image_features.norm(dim=1, keepdim=True)
+                # 归一化向量
+                image_features = image_features / image_norm
+                return image_features.cpu().numpy()
+
+    def check_output_dim(self, model_type: str, output_dim: Optional[int]):
+        """校验输出维度：指定 output_dim 时模型需要有可以输出该维度的投影矩阵"""
+        self._projection(self.normalize_model_type(model_type), output_dim)
+
+    def _projection(self, model_key: str, output_dim: Optional[int]) -> Optional[Projection]:
+        """获取 output_dim 对应的投影矩阵，在推理之前校验，未指定 output_dim 时返回 None"""
+        return self._projections.require(model_key, output_dim) if output_dim else None
+
+    @staticmethod
+    def _project(projection: Optional[Projection], modality: str, vectors: np.ndarray,
+                 output_dim: Optional[int]) -> np.ndarray:
+        """投影到 output_dim 维并重新归一化
+
+        缓存与微批中保存的都是原始维度的向量，投影在取回结果后对整个请求的矩阵一次完成。
+        """
+        if projection is None:
+            return vectors
+        with STAGE_SECONDS.time(stage="project", model_type=projection.model_type, modality=modality,
+                                batch_size=batch_size_label(len(vectors) if vectors.ndim > 1 else 1)):
+            return projection.project(vectors, output_dim)
+
+    async def _encode_texts(self, model_key: str, texts: List[str]) -> np.ndarray:
+        """文本向量化（带缓存），只对未命中缓存的文本执行推理"""
+        namespace = self._client.cache_namespace(model_key)
+        keys = [self._cache.text_key(namespace, text) for text in texts] if self._cache else []
+        vectors = await self._cache.get_many(keys) if self._cache else [None] * len(texts)
 
-            # 返回文本向量列表
-            return text_features.cpu().numpy().tolist()
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            text_features = await self._dispatch(model_key, "text", [texts[i] for i in missing])
+            for row, i in enumerate(missing):
+                vectors[i] = text_features[row]
+            if self._cache:
+                await self._cache.put_many([keys[i] for i in missing], text_features)
+
+        return np.stack(vectors)
+
+    async def _encode_images(self, model_key: str, image_data_list: List[ImageSource],
+                             hashes: Optional[List[Optional[int]]] = None
+                             ) -> Tuple[List[Optional[np.ndarray]], List[Optional[Exception]]]:
+        """图像向量化（带缓存），只对未命中缓存的图像解码并推理
+
+        :param hashes: 与输入一一对应的列表，指定时解码的同时计算感知哈希写入其中；命中缓存、解码失败的图像保持不变
+        :return: (向量列表, 异常列表)，两者与输入一一对应，失败项的向量为 None
+        """
+        namespace = self._client.cache_namespace(model_key)
+        keys = [self._cache.image_key(namespace, data) for data in image_data_list] if self._cache else []
+        vectors = await self._cache.get_many(keys) if self._cache else [None] * len(image_data_list)
+        errors: List[Optional[Exception]] = [None] * len(image_data_list)
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors, errors
+
+        # 并行解码与预处理
+        preprocess = self._client.get_preprocess(model_key)
+        resolution = self._client.get_input_resolution(model_key)
+        loader = load_image_with_hash if hashes is not None else load_image
+        loaded = await asyncio.gather(
+            *[self._preprocess_executor.run(loader, image_data_list[i], preprocess, resolution, model_key)
+              for i in missing],
+            return_exceptions=True
+        )
+
+        valid_indexes, image_tensors = [], []
+        for i, result in zip(missing, loaded):
+            # 线程池已满属于整体失败，直接抛出
+            if isinstance(result, AppException):
+                raise result
+            if isinstance(result, Exception):
+                logger.warning(f"第 {i} 张图像解码失败: {result}")
+                errors[i] = result
+            else:
+                if hashes is not None:
+                    result, hashes[i] = result
+                valid_indexes.append(i)
+                image_tensors.append(result)
+
+        if valid_indexes:
+            image_features = await self._dispatch(model_key, "image", image_tensors)
+            for row, i in enumerate(valid_indexes):
+                vectors[i] = image_features[row]
+            if self._cache:
+                await self._cache.put_many([keys[i] for i in valid_indexes], image_features)
+
+        return vectors, errors
+
+    async def encode_text(self, texts: List[str], model_type: Optional[str] = None,
+                          output_dim: Optional[int] = None) -> np.ndarray:
+        """文本向量化，返回 (N, D) 的 float32 矩阵，指定 output_dim 时 D 为 output_dim"""
+        try:
+            model_key = self._resolve_model_type(model_type)
+            projection = self._projection(model_key, output_dim)
+            vectors = await self._encode_texts(model_key, texts)
+            return self._project(projection, "text", vectors, output_dim)
 
         except AppException as ae:
             raise ae
@@ -60,37 +267,23 @@ class ClipVectorService:
             logger.error(f"文本向量化失败: {e}")
             raise InternalServerException("文本向量化失败")
 
-    async def encode_text_batch(self, texts: List[str]) -> List[List[float]]:
+    async def encode_text_batch(self, texts: List[str], model_type: Optional[str] = None,
+                                output_dim: Optional[int] = None) -> np.ndarray:
         """ 批量文本向量化（兼容现有接口）"""
-        return await self.encode_text(texts)
+        return await self.encode_text(texts, model_type, output_dim)
 
-    async def encode_image(self, image_data: bytes) -> List[float]:
-        """图像向量化"""
+    async def encode_image(self, image_data: ImageSource, model_type: Optional[str] = None,
+                           output_dim: Optional[int] = None) -> np.ndarray:
+        """图像向量化，返回 (D,) 的 float32 向量，指定 output_dim 时 D 为 output_dim"""
         try:
-            model = self._client.model
-            preprocess = self._client.preprocess
-
-            image = Image.open(io.BytesIO(image_data)).convert("RGB")
+            model_key = self._resolve_model_type(model_type)
+            projection = self._projection(model_key, output_dim)
 
-            # 调用 Compose 对象处理图像，返回 tensor
-            image_tensor: torch.Tensor = preprocess(image)  # type: ignore
+            vectors, errors = await self._encode_images(model_key, [image_data])
+            if errors[0] is not None:
+                raise ValidationException(f"图像解码失败: {errors[0]}")
 
-            # 增加 batch 维度
-            image_tensor = image_tensor.unsqueeze(0)
-            # 将图像张量移动到模型所在设备
-            image_tensor = image_tensor.to(next(model.parameters()).device)
-
-            # 进行图像编码
-            with torch.no_grad():
-                # 编码图像
-                image_features = model.encode_image(image_tensor)
-                # 计算图像向量的范数
-                image_norm = image_features.norm(dim=1, keepdim=True)
-                # 归一化向量
-                image_features = image_features / image_norm
-
-            # 返回图像向量列表
-            return image_features.cpu().numpy()[0].tolist()
+            return self._project(projection, "image", vectors[0], output_dim)
 
         except AppException as ae:
             raise ae
@@ -99,15 +292,33 @@ class ClipVectorService:
             logger.error(f"图像向量化失败: {e}")
             raise InternalServerException("图像向量化失败")
 
-    async def encode_image_batch(self, image_data_list: List[bytes]) -> List[List[float]]:
-        """批量图像向量化"""
+    async def encode_image_batch(self, image_data_list: List[ImageSource], model_type: Optional[str] = None,
+                                 output_dim: Optional[int] = None, hashes: Optional[List[Optional[int]]] = None
+                                 ) -> Tuple[List[Optional[np.ndarray]], List[Optional[str]]]:
+        """批量图像向量化
+
+        所有图像并行解码、预处理后堆叠成批次推理，单张图像失败不影响其他图像。
+        :param hashes: 指定时在解码的同时计算感知哈希写入其中，命中缓存的图像不解码，哈希保持为 None
+        :return: (向量列表, 错误信息列表)，两者与输入一一对应，失败项的向量为 None
+        """
         try:
-            results = []
-            for image_data in image_data_list:
-                vector = await self.encode_image(image_data)
-                results.append(vector)
-            return results
+            model_key = self._resolve_model_type(model_type)
+            projection = self._projection(model_key, output_dim)
+
+            vectors, errors = await self._encode_images(model_key, image_data_list, hashes)
+
+            valid = [i for i, vector in enumerate(vectors) if vector is not None]
+            if projection is not None and valid:
+                projected = self._project(projection, "image", np.stack([vectors[i] for i in valid]), output_dim)
+                for row, i in enumerate(valid):
+                    vectors[i] = projected[row]
+
+            messages = [f"图像解码失败: {error}" if error is not None else None for error in errors]
+            return vectors, messages
+
+        except AppException as ae:
+            raise ae
+
         except Exception as e:
             logger.error(f"批量图像向量化失败: {e}")
             raise InternalServerException("批量图像向量化失败")
-
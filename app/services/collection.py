@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 15:32
+@Author : YangFei
+@File   : collection.py
+@Desc   : 向量集合服务：写入文本、图像或向量，并在服务端完成 top-k 检索
+"""
+import logging
+import numpy as np
+
+from typing import List, Optional, Tuple
+
+from app.services.clip_vector import ClipVectorService
+from core.config import SEARCH_MAX_TOP_K
+from core.executor import BoundedExecutor, get_preprocess_executor
+from core.exceptions import ValidationException
+from core.image_decode import ImageSource
+from core.vector_index import VectorStore, VectorCollection
+
+logger = logging.getLogger(__name__)
+
+
+class CollectionService:
+    """向量集合服务"""
+
+    def __init__(self, store: VectorStore, vector_service: ClipVectorService,
+                 executor: Optional[BoundedExecutor] = None):
+        """初始化向量集合服务"""
+        self._store = store
+        self._vector_service = vector_service
+        # 检索与写入的矩阵运算在线程池中执行
+        self._executor = executor or get_preprocess_executor()
+
+    def create(self, name: str, model_type: str, index_type: str, nlist: Optional[int], nprobe: int) -> dict:
+        """创建集合"""
+        model_key = self._vector_service.normalize_model_type(model_type)
+        return self._store.create(name, model_key, index_type.strip().lower(), nlist, nprobe).stats()
+
+    def drop(self, name: str):
+        """删除集合"""
+        self._store.drop(name)
+
+    def list(self) -> List[dict]:
+        """列出集合"""
+        return self._store.list()
+
+    def get(self, name: str) -> VectorCollection:
+        """获取集合"""
+        return self._store.get(name)
+
+    async def _upsert(self, collection: VectorCollection, ids: List[str], vectors: np.ndarray,
+                      overwrite: bool) -> dict:
+        """写入向量并返回统计"""
+        inserted, updated = await self._executor.run(collection.upsert, ids, vectors, overwrite)
+        return {"inserted": inserted, "updated": updated, "count": len(collection)}
+
+    async def upsert_texts(self, name: str, ids: List[str], texts: List[str], overwrite: bool = True) -> dict:
+        """编码文本并写入集合"""
+        collection = self._store.get(name)
+        vectors = await self._vector_service.encode_text(texts, collection.model_type)
+        return await self._upsert(collection, ids, vectors, overwrite)
+
+    async def upsert_vectors(self, name: str, ids: List[str], vectors: List[List[float]],
+                             overwrite: bool = True) -> dict:
+        """直接写入向量，向量会重新做 L2 归一化"""
+        collection = self._store.get(name)
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+        return await self._upsert(collection, ids, matrix, overwrite)
+
+    async def upsert_images(self, name: str, ids: List[str], image_data_list: List[ImageSource],
+                            overwrite: bool = True) -> Tuple[dict, List[Optional[str]]]:
+        """编码图像并写入集合，解码失败的图像跳过
+        :return: (写入统计, 与输入一一对应的错误信息)
+        """
+        collection = self._store.get(name)
+        vectors, errors = await self._vector_service.encode_image_batch(image_data_list, collection.model_type)
+
+        valid = [i for i, vector in enumerate(vectors) if vector is not None]
+        if not valid:
+            return {"inserted": 0, "updated": 0, "count": len(collection)}, errors
+
+        result = await self._upsert(collection, [ids[i] for i in valid], np.stack([vectors[i] for i in valid]),
+                                    overwrite)
+        return result, errors
+
+    def delete(self, name: str, ids: List[str]) -> dict:
+        """删除条目"""
+        collection = self._store.get(name)
+        deleted = collection.delete(ids)
+        return {"deleted": deleted, "count": len(collection)}
+
+    async def search(self, name: str, top_k: int, text: Optional[str] = None,
+                     vector: Optional[List[float]] = None, image_data: Optional[ImageSource] = None,
+                     nprobe: Optional[int] = None) -> List[dict]:
+        """按文本、图像或向量检索，返回 top-k 的 id 与分数"""
+        if top_k > SEARCH_MAX_TOP_K:
+            raise ValidationException(f"top_k 不能超过 {SEARCH_MAX_TOP_K}")
+        if sum(x is not None for x in (text, vector, image_data)) != 1:
+            raise ValidationException("text、vector、图像必须且只能指定一个")
+
+        collection = self._store.get(name)
+        if text is not None:
+            query = await self._vector_service.encode_text([text], collection.model_type)
+        elif image_data is not None:
+            query = (await self._vector_service.encode_image(image_data, collection.model_type))[np.newaxis, :]
+        else:
+            query = self._normalize(np.asarray([vector], dtype=np.float32))
+
+        results = await self._executor.run(collection.search, query, top_k, nprobe)
+        return [{"id": item_id, "score": score} for item_id, score in results[0]]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2 归一化"""
+        if vectors.ndim != 2 or not vectors.shape[1]:
+            raise ValidationException("向量格式不正确")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        if np.any(norms == 0):
+            raise ValidationException("向量不能全为 0")
+        return vectors / norms
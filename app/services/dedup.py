@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 01:05
+@Author : YangFei
+@File   : dedup.py
+@Desc   : 近重复图像检测服务：感知哈希分桶得到候选对，只对候选图像推理并比较向量；增量模式与已有的向量集合比较
+"""
+import asyncio
+import logging
+import numpy as np
+
+from typing import Dict, List, Optional, Tuple
+
+from app.services.clip_vector import ClipVectorService
+from core.config import DEDUP_THRESHOLD, DEDUP_HASH_BANDS, DEDUP_MAX_HAMMING
+from core.dedup import MAX_DISTANCE_LIMIT, candidate_pairs, effective_bands, group_pairs
+from core.exceptions import AppException, ValidationException
+from core.executor import BoundedExecutor, get_preprocess_executor
+from core.image_decode import ImageSource, perceptual_hash
+from core.vector_index import VectorCollection, VectorStore
+
+logger = logging.getLogger(__name__)
+
+# 增量模式下每张新图像在集合中检索的近邻数
+_COLLECTION_TOP_K = 5
+
+
+class DedupService:
+    """近重复图像检测服务"""
+
+    def __init__(self, vector_service: ClipVectorService, vector_store: VectorStore,
+                 executor: Optional[BoundedExecutor] = None):
+        """初始化近重复图像检测服务"""
+        self._vector_service = vector_service
+        self._vector_store = vector_store
+        # 感知哈希、候选对分桶与集合检索在线程池中执行
+        self._executor = executor or get_preprocess_executor()
+
+    async def _hash_images(self, model_key: str, images: List[Optional[ImageSource]], errors: List[Optional[str]],
+                           hashes: Optional[List[Optional[int]]] = None) -> List[Optional[int]]:
+        """并行计算感知哈希，失败的图像哈希为 None，错误信息写入 errors
+
+        :param hashes: 已经得到的哈希（如推理时一并计算的），只计算其中为 None 且没有错误的图像
+        """
+        hashes = hashes if hashes is not None else [None] * len(images)
+        valid = [i for i, image in enumerate(images) if image is not None and hashes[i] is None and errors[i] is None]
+        results = await asyncio.gather(
+            *[self._executor.run(perceptual_hash, images[i], model_key) for i in valid],
+            return_exceptions=True
+        )
+
+        for i, result in zip(valid, results):
+            # 线程池已满属于整体失败，直接抛出
+            if isinstance(result, AppException):
+                raise result
+            if isinstance(result, Exception):
+                errors[i] = f"图像解码失败: {result}"
+            else:
+                hashes[i] = result
+        return hashes
+
+    async def _embed(self, model_key: str, images: List[Optional[ImageSource]], indexes: List[int],
+                     errors: List[Optional[str]], hashes: Optional[List[Optional[int]]] = None
+                     ) -> Dict[int, np.ndarray]:
+        """对指定的图像推理，返回 {下标: 向量}，失败的错误信息写入 errors
+
+        :param hashes: 与 images 一一对应，指定时用推理的解码结果一并计算感知哈希写入其中（命中缓存的图像除外）
+        """
+        if not indexes:
+            return {}
+        batch_hashes = [None] * len(indexes) if hashes is not None else None
+        vectors, messages = await self._vector_service.encode_image_batch([images[i] for i in indexes], model_key,
+                                                                          hashes=batch_hashes)
+        if hashes is not None:
+            for i, value in zip(indexes, batch_hashes):
+                hashes[i] = value
+        embeddings = {}
+        for i, vector, message in zip(indexes, vectors, messages):
+            if vector is None:
+                errors[i] = message
+            else:
+                embeddings[i] = vector
+        return embeddings
+
+    @staticmethod
+    def _duplicate_pairs(pairs: List[Tuple[int, int]], embeddings: Dict[int, np.ndarray], threshold: float
+                         ) -> List[Tuple[int, int, float]]:
+        """计算候选对的余弦相似度，返回不低于阈值的 (i, j, similarity)"""
+        pairs = [(i, j) for i, j in pairs if i in embeddings and j in embeddings]
+        if not pairs:
+            return []
+        left = np.stack([embeddings[i] for i, _ in pairs])
+        right = np.stack([embeddings[j] for _, j in pairs])
+        similarities = np.einsum("ij,ij->i", left, right)
+        return [(i, j, float(s)) for (i, j), s in zip(pairs, similarities) if s >= threshold]
+
+    async def dedup(self, model_type: str, images: List[Optional[ImageSource]],
+                    image_errors: Optional[List[Optional[str]]] = None, threshold: float = DEDUP_THRESHOLD,
+                    max_distance: int = DEDUP_MAX_HAMMING, collection: Optional[str] = None,
+                    ids: Optional[List[str]] = None, insert: bool = False) -> dict:
+        """检测一批图像中的近重复图像
+
+        1. 计算全部图像的感知哈希，按哈希分段分桶（不少于 max_distance + 1 段），得到汉明距离不超过 max_distance 的候选对；
+           增量模式下全部图像都要推理，哈希在推理的解码中一并计算
+        2. 只对出现在候选对中的图像推理（增量模式下全部推理），候选对的余弦相似度不低于 threshold 时判定为重复
+        3. 指定 collection 时（增量模式），每张图像再与集合中已有的向量检索比较；insert 为 True 时，
+           把既不与集合重复、也不是批内重复副本的图像以 ids 写入集合
+
+        :param images: 上传的图像，校验失败的图像为 None
+        :param image_errors: 与 images 一一对应的校验错误信息
+        :return: 每张图像的哈希、所在分组、与集合中的匹配，以及分组与各阶段的统计；
+                 stats.truncated_members 大于 0 时超大桶中的比较被截断，候选对可能有遗漏
+        """
+        image_errors = image_errors or [None if image is not None else "图像无效" for image in images]
+        errors = list(image_errors)
+        if not images:
+            raise ValidationException("图像不能为空")
+        if not 0 < threshold <= 1:
+            raise ValidationException("threshold 必须在 (0, 1] 之间")
+        if not 0 <= max_distance <= MAX_DISTANCE_LIMIT:
+            raise ValidationException(f"max_distance 必须在 0 ~ {MAX_DISTANCE_LIMIT} 之间")
+        if ids is not None and len(ids) != len(images):
+            raise ValidationException("ids 与图像的数量必须一致")
+        if insert and (collection is None or ids is None):
+            raise ValidationException("写入集合时必须指定 collection 与 ids")
+        bands = effective_bands(max_distance, DEDUP_HASH_BANDS)
+
+        model_key = self._vector_service.normalize_model_type(model_type)
+        entry: Optional[VectorCollection] = None
+        if collection is not None:
+            entry = self._vector_store.get(collection)
+            if entry.model_type != model_key:
+                raise ValidationException(f"集合 {collection} 的模型 {entry.model_type} 与 {model_key} 不一致")
+
+        # 增量模式需要与集合比较（写入时也需要向量），全部推理，哈希在推理的解码中一并计算，只有命中缓存的图像单独计算；
+        # 批量模式先计算哈希得到候选对，只推理候选图像，候选图像会再解码一次（JPEG 计算哈希时按最小的 draft 比例解码）
+        if entry is not None:
+            indexes = [i for i, image in enumerate(images) if image is not None]
+            hashes: List[Optional[int]] = [None] * len(images)
+            embeddings = await self._embed(model_key, images, indexes, errors, hashes)
+            hashes = await self._hash_images(model_key, images, errors, hashes)
+            pairs, truncated = await self._executor.run(candidate_pairs, hashes, max_distance, bands)
+        else:
+            hashes = await self._hash_images(model_key, images, errors)
+            pairs, truncated = await self._executor.run(candidate_pairs, hashes, max_distance, bands)
+            indexes = sorted({i for pair in pairs for i in pair})
+            embeddings = await self._embed(model_key, images, indexes, errors)
+
+        duplicates = self._duplicate_pairs(pairs, embeddings, threshold)
+        groups = group_pairs(len(images), [(i, j) for i, j, _ in duplicates])
+
+        items = [{"index": i, "hash": f"{value:016x}" if value is not None else None, "group": None,
+                  "duplicate_of": None, "similarity": None, "error": errors[i]}
+                 for i, value in enumerate(hashes)]
+        if ids is not None:
+            for item, item_id in zip(items, ids):
+                item["id"] = item_id
+
+        # 组内第一张图像作为代表，其他图像记录与代表的相似度（代表与成员不一定直接相连时为 None）
+        similarity = {(i, j): s for i, j, s in duplicates}
+        for group_id, members in enumerate(groups):
+            head = members[0]
+            for i in members:
+                items[i]["group"] = group_id
+                if i != head:
+                    items[i]["duplicate_of"] = head
+                    items[i]["similarity"] = similarity.get((head, i))
+
+        if entry is not None:
+            await self._match_collection(entry, embeddings, items, threshold)
+
+        inserted = 0
+        if insert:
+            inserted = await self._insert(entry, ids, embeddings, items)
+
+        return {
+            "model_type": model_key,
+            "threshold": threshold,
+            "max_distance": max_distance,
+            "bands": bands,
+            "collection": collection,
+            "items": items,
+            "groups": groups,
+            "stats": {
+                "images": len(images),
+                "hashed": sum(value is not None for value in hashes),
+                "candidate_pairs": len(pairs),
+                # 超大桶中比较被截断的成员数（按段累计），大于 0 时候选对可能有遗漏
+                "truncated_members": truncated,
+                "embedded": len(indexes),
+                "duplicate_pairs": len(duplicates),
+                "groups": len(groups),
+                "failed": sum(error is not None for error in errors),
+                **({"inserted": inserted} if insert else {}),
+            },
+        }
+
+    async def _match_collection(self, entry: VectorCollection, embeddings: Dict[int, np.ndarray],
+                                items: List[dict], threshold: float):
+        """增量模式：在集合中检索每张图像的近邻，相似度不低于阈值的记录为匹配，检索使用集合自身的索引"""
+        if not embeddings:
+            return
+        indexes = sorted(embeddings)
+        results = await self._executor.run(entry.search, np.stack([embeddings[i] for i in indexes]),
+                                           _COLLECTION_TOP_K)
+        for i, result in zip(indexes, results):
+            items[i]["matches"] = [{"id": item_id, "similarity": score}
+                                   for item_id, score in result if score >= threshold]
+
+    async def _insert(self, entry: VectorCollection, ids: List[str], embeddings: Dict[int, np.ndarray],
+                      items: List[dict]) -> int:
+        """把不重复的图像写入集合：与集合中已有图像重复的、批内重复的副本都不写入"""
+        unique = [i for i in sorted(embeddings)
+                  if items[i]["duplicate_of"] is None and not items[i].get("matches")]
+        if not unique:
+            return 0
+        inserted, _ = await self._executor.run(entry.upsert, [ids[i] for i in unique],
+                                               np.stack([embeddings[i] for i in unique]), False)
+        for i in unique:
+            items[i]["inserted"] = True
+        return inserted
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 22:55
+@Author : YangFei
+@File   : projection.py
+@Desc   : 向量降维服务：用校准语料（文本与向量集合）拟合投影矩阵，并报告留出集上的召回率
+"""
+import asyncio
+import logging
+import numpy as np
+
+from typing import List, Optional
+
+from app.services.clip_vector import ClipVectorService
+from core.exceptions import ValidationException
+from core.projection import ProjectionStore
+from core.vector_index import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# 校准文本分块编码，每块不超过批量队列的积压上限
+_TEXT_CHUNK_SIZE = 128
+
+
+class ProjectionService:
+    """向量降维服务"""
+
+    def __init__(self, store: ProjectionStore, vector_service: ClipVectorService, vector_store: VectorStore):
+        """初始化向量降维服务"""
+        self._store = store
+        self._vector_service = vector_service
+        self._vector_store = vector_store
+
+    def list(self) -> List[dict]:
+        """列出投影矩阵"""
+        return self._store.list()
+
+    def drop(self, model_type: str):
+        """删除投影矩阵"""
+        self._store.drop(self._vector_service.normalize_model_type(model_type))
+
+    async def _calibration_vectors(self, model_key: str, texts: List[str], collections: List[str]) -> np.ndarray:
+        """收集校准向量：编码文本，并读取同一模型的向量集合（图像向量可以通过集合提供）"""
+        parts = []
+        for start in range(0, len(texts), _TEXT_CHUNK_SIZE):
+            parts.append(await self._vector_service.encode_text(texts[start:start + _TEXT_CHUNK_SIZE], model_key))
+
+        for name in collections:
+            collection = self._vector_store.get(name)
+            if collection.model_type != model_key:
+                raise ValidationException(f"集合 {name} 的模型 {collection.model_type} 与 {model_key} 不一致")
+            if len(collection):
+                parts.append(collection.matrix())
+
+        if not parts:
+            raise ValidationException("校准语料不能为空，请提供 texts 或 collections")
+        return np.concatenate(parts, axis=0)
+
+    async def fit(self, model_type: str, texts: List[str], collections: List[str], method: str, max_dim: int,
+                  holdout_ratio: float, eval_dims: Optional[List[int]], top_k: int, seed: int) -> dict:
+        """拟合并保存投影矩阵，返回投影信息与召回率报告"""
+        model_key = self._vector_service.normalize_model_type(model_type)
+        vectors = await self._calibration_vectors(model_key, texts, collections)
+        # SVD 与召回率评估耗时与语料规模相关，放到线程中执行，不阻塞事件循环
+        projection = await asyncio.to_thread(self._store.fit, model_key, vectors, method.strip().lower(), max_dim,
+                                             holdout_ratio, eval_dims, top_k, seed)
+        return projection.to_dict()
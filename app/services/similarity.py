@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 00:20
+@Author : YangFei
+@File   : similarity.py
+@Desc   : 相似度矩阵服务：N 条文本与 M 张图像两侧各批量编码一次，一次矩阵乘法得到全部文本-图像对的分数
+"""
+import asyncio
+import logging
+import numpy as np
+
+from typing import List, Optional, Tuple
+
+from app.services.clip_vector import ClipVectorService
+from core.config import SIMILARITY_MAX_ITEMS, SEARCH_MAX_TOP_K
+from core.exceptions import ValidationException
+from core.executor import BoundedExecutor, get_preprocess_executor
+from core.image_decode import ImageSource
+from core.vector_index import VectorCollection, VectorStore, top_k_indices
+
+logger = logging.getLogger(__name__)
+
+# 分数类型
+SCORE_SIMILARITY = "similarity"  # 余弦相似度
+SCORE_LOGIT = "logit"  # 乘以模型温度系数 logit_scale 后的 logit
+
+SUPPORTED_SCORES = (SCORE_SIMILARITY, SCORE_LOGIT)
+
+# 文本分块编码，每块不超过批量队列的积压上限
+_TEXT_CHUNK_SIZE = 128
+
+
+class SimilarityService:
+    """相似度矩阵服务"""
+
+    def __init__(self, vector_service: ClipVectorService, vector_store: VectorStore,
+                 executor: Optional[BoundedExecutor] = None):
+        """初始化相似度矩阵服务"""
+        self._vector_service = vector_service
+        self._vector_store = vector_store
+        # 矩阵乘法与 top_k 排序在线程池中执行
+        self._executor = executor or get_preprocess_executor()
+
+    async def _encode_texts(self, model_key: str, texts: List[str]) -> np.ndarray:
+        """分块编码文本，各块由微批调度器合并推理"""
+        parts = []
+        for start in range(0, len(texts), _TEXT_CHUNK_SIZE):
+            parts.append(await self._vector_service.encode_text(texts[start:start + _TEXT_CHUNK_SIZE], model_key))
+        return np.concatenate(parts, axis=0)
+
+    async def _image_columns(self, model_key: str, images: List[Optional[ImageSource]],
+                             image_errors: List[Optional[str]], collection: Optional[VectorCollection],
+                             image_ids: List[str]) -> Tuple[List[Optional[np.ndarray]], List[Optional[str]]]:
+        """图像一侧的向量：先是上传的图像，再是集合中按 id 读取的向量
+        :return: (向量列表, 错误信息列表)，与列一一对应，失败的列向量为 None
+        """
+        vectors: List[Optional[np.ndarray]] = [None] * len(images)
+        errors: List[Optional[str]] = list(image_errors)
+        valid = [i for i, image in enumerate(images) if image is not None]
+        if valid:
+            embeddings, encode_errors = await self._vector_service.encode_image_batch([images[i] for i in valid],
+                                                                                      model_key)
+            for i, embedding, error in zip(valid, embeddings, encode_errors):
+                vectors[i], errors[i] = embedding, error
+
+        if image_ids:
+            found, matrix = collection.get(image_ids)
+            rows = dict(zip(found, matrix))
+            for item_id in image_ids:
+                vector = rows.get(item_id)
+                vectors.append(vector)
+                errors.append(None if vector is not None else f"集合 {collection.name} 中不存在 {item_id}")
+        return vectors, errors
+
+    @staticmethod
+    def _scores(texts: np.ndarray, images: np.ndarray, scale: float, top_k: Optional[int]
+                ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """一次矩阵乘法得到 (N, M) 的分数矩阵，失败的列为 NaN；指定 top_k 时每行只保留分数最高的 top_k 列"""
+        scores = texts @ images.T
+        if scale != 1.0:
+            scores *= scale
+        if top_k is None:
+            return scores, None
+
+        # 失败的列不参与排序
+        ranked = np.where(np.isnan(scores), -np.inf, scores)
+        indices = top_k_indices(ranked, top_k)
+        return np.take_along_axis(scores, indices, axis=1), indices
+
+    async def similarity(self, model_type: str, texts: List[str], images: List[Optional[ImageSource]],
+                         image_errors: Optional[List[Optional[str]]] = None, collection: Optional[str] = None,
+                         image_ids: Optional[List[str]] = None, score: str = SCORE_SIMILARITY,
+                         top_k: Optional[int] = None) -> dict:
+        """计算文本与图像两两之间的分数
+
+        :param images: 上传的图像，对应前 len(images) 列；校验失败的图像为 None
+        :param image_errors: 与 images 一一对应的校验错误信息，对应的列直接标记为失败
+        :param collection: image_ids 所在的向量集合，集合的模型必须与 model_type 一致
+        :param image_ids: 集合中已经写入的图像 id，对应其后的列
+        :param score: similarity 返回余弦相似度，logit 返回乘以 logit_scale 后的值
+        :param top_k: 每行只返回分数最高的 top_k 列
+        :return: scores 为 (N, M) 矩阵，或指定 top_k 时的 (N, top_k) 矩阵与对应的列下标 indices
+        """
+        image_ids = image_ids or []
+        image_errors = image_errors or [None if image is not None else "图像无效" for image in images]
+        score = score.strip().lower()
+        if score not in SUPPORTED_SCORES:
+            raise ValidationException(f"不支持的分数类型 {score}，可选项: {list(SUPPORTED_SCORES)}")
+        if not texts:
+            raise ValidationException("文本列表不能为空")
+        if not images and not image_ids:
+            raise ValidationException("图像不能为空，请上传图像或指定集合中的图像 id")
+        if len(texts) > SIMILARITY_MAX_ITEMS or len(image_ids) > SIMILARITY_MAX_ITEMS:
+            raise ValidationException(f"单次最多 {SIMILARITY_MAX_ITEMS} 条文本与 {SIMILARITY_MAX_ITEMS} 个图像 id")
+        if image_ids and not collection:
+            raise ValidationException("指定图像 id 时必须指定集合")
+        if top_k is not None and not 0 < top_k <= SEARCH_MAX_TOP_K:
+            raise ValidationException(f"top_k 必须在 1 ~ {SEARCH_MAX_TOP_K} 之间")
+
+        model_key = self._vector_service.normalize_model_type(model_type)
+        entry = None
+        if image_ids:
+            entry = self._vector_store.get(collection)
+            if entry.model_type != model_key:
+                raise ValidationException(f"集合 {collection} 的模型 {entry.model_type} 与 {model_key} 不一致")
+
+        # 两侧并发编码，各自合并成批次推理
+        text_matrix, (vectors, errors) = await asyncio.gather(
+            self._encode_texts(model_key, texts),
+            self._image_columns(model_key, images, image_errors, entry, image_ids)
+        )
+
+        image_matrix = np.full((len(vectors), text_matrix.shape[1]), np.nan, dtype=np.float32)
+        for column, vector in enumerate(vectors):
+            if vector is not None:
+                image_matrix[column] = vector
+
+        logit_scale = await self._vector_service.get_logit_scale(model_key)
+        scale = logit_scale if score == SCORE_LOGIT else 1.0
+        scores, indices = await self._executor.run(self._scores, text_matrix, image_matrix, scale, top_k)
+
+        return {
+            "model_type": model_key,
+            "score": score,
+            "logit_scale": logit_scale,
+            "failed": [{"column": column, "error": error} for column, error in enumerate(errors) if error is not None],
+            "scores": scores,
+            "indices": indices,
+        }
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 20:30
+@Author : YangFei
+@File   : __init__.py
+@Desc   : 性能基准测试：合成负载、吞吐与延迟统计、基线对比
+"""
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 20:38
+@Author : YangFei
+@File   : asgi_client.py
+@Desc   : 进程内 ASGI 客户端：直接调用 FastAPI 应用，不经过网络，测量的是应用本身的开销
+"""
+import asyncio
+import json
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+
+class ASGIClient:
+    """ 最小的进程内 HTTP 客户端，只支持一次性发送的请求体 """
+
+    def __init__(self, app):
+        self._app = app
+
+    async def request(self, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None,
+                      query: str = "") -> Tuple[int, bytes]:
+        """ 发送请求，返回 (状态码, 响应体) """
+        headers = {**(headers or {}), "content-length": str(len(body))}
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+        }
+
+        request_sent = False
+        response_done = asyncio.Event()
+        status = 0
+        chunks: List[bytes] = []
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # 请求体已经发完，等响应结束后再通知断开，流式响应期间不会被误判为客户端断开
+            await response_done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    response_done.set()
+
+        try:
+            await self._app(scope, receive, send)
+        finally:
+            response_done.set()
+        return status, b"".join(chunks)
+
+    async def post_json(self, path: str, content, query: str = "") -> Tuple[int, bytes]:
+        """ 发送 JSON 请求体 """
+        return await self.request("POST", path, json.dumps(content, ensure_ascii=False).encode("utf-8"),
+                                  {"content-type": "application/json"}, query)
+
+    async def post_multipart(self, path: str, fields: Dict[str, str], files: List[Tuple[str, str, bytes, str]],
+                             query: str = "") -> Tuple[int, bytes]:
+        """ 发送 multipart/form-data 请求体
+        :param files: [(字段名, 文件名, 内容, 内容类型)]
+        """
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in fields.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, filename, content, content_type in files:
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                         f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b"\r\n")
+        parts.append(f"--{boundary}--\r\n".encode())
+        return await self.request("POST", path, b"".join(parts),
+                                  {"content-type": f"multipart/form-data; boundary={boundary}"}, query)
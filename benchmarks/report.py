@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 20:45
+@Author : YangFei
+@File   : report.py
+@Desc   : 基准测试结果：延迟分位数、峰值内存采样、JSON 报告与基线对比
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 场景的唯一键，对比基线时按键匹配
+SCENARIO_KEYS = ("target", "model_type", "modality", "batch_size", "concurrency")
+
+
+class RSSSampler:
+    """ 后台线程定期采样当前进程的常驻内存，记录场景运行期间的峰值
+
+    Linux 读取 /proc/self/statm；其他平台退化为 ru_maxrss（进程启动以来的峰值）。
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self._interval = interval
+        self._peak = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def current_bytes() -> int:
+        """ 当前常驻内存（字节） """
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # macOS 的单位是字节，Linux 是 KB
+            return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            self._peak = max(self._peak, self.current_bytes())
+
+    def __enter__(self) -> "RSSSampler":
+        self._peak = self.current_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, self.current_bytes())
+
+    @property
+    def peak_mb(self) -> float:
+        return round(self._peak / 1024 / 1024, 1)
+
+
+def summarize(latencies: List[float], items: int, errors: int, elapsed: float) -> dict:
+    """ 汇总一个场景的结果
+    :param latencies: 成功请求的耗时（秒）
+    :param items: 成功处理的条目数
+    :param errors: 失败的请求数
+    :param elapsed: 场景总耗时（秒）
+    """
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if values.size else (0.0, 0.0, 0.0)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "items": items,
+        "elapsed_s": round(elapsed, 3),
+        "throughput": round(items / elapsed, 2) if elapsed > 0 else 0,
+        "mean_ms": round(float(values.mean()), 2) if values.size else 0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+    }
+
+
+def environment() -> dict:
+    """ 运行环境信息，对比基线时用来判断两次结果是否可比 """
+    import torch
+
+    return {
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def save_report(path: str, results: List[dict], meta: dict):
+    """ 保存 JSON 报告 """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+def load_report(path: str) -> dict:
+    """ 读取 JSON 报告 """
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def scenario_key(result: dict) -> Tuple:
+    return tuple(result[key] for key in SCENARIO_KEYS)
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[dict]:
+    """ 与基线对比，返回每个场景的变化；吞吐下降、p95 延迟或峰值内存上升超过阈值的场景标记为回归
+
+    :param threshold: 允许的相对变化，如 0.1 表示 10%
+    """
+    base_by_key: Dict[Tuple, dict] = {scenario_key(r): r for r in baseline}
+    rows = []
+    for result in results:
+        base = base_by_key.get(scenario_key(result))
+        if base is None:
+            continue
+        throughput = _relative(result["throughput"], base["throughput"])
+        p95 = _relative(result["p95_ms"], base["p95_ms"])
+        rss = _relative(result["peak_rss_mb"], base["peak_rss_mb"])
+        reasons = []
+        if throughput < -threshold:
+            reasons.append(f"吞吐 {throughput:+.1%}")
+        if p95 > threshold:
+            reasons.append(f"p95 {p95:+.1%}")
+        if rss > threshold:
+            reasons.append(f"峰值内存 {rss:+.1%}")
+        rows.append({**{key: result[key] for key in SCENARIO_KEYS}, "throughput_change": round(throughput, 4),
+                     "p95_change": round(p95, 4), "rss_change": round(rss, 4), "regressions": reasons})
+    return rows
+
+
+def _relative(value: float, base: float) -> float:
+    return (value - base) / base if base else 0.0
+
+
+def format_results(results: List[dict]) -> str:
+    """ 以表格输出结果 """
+    header = f"{'target':<8}{'model':<10}{'modality':<9}{'batch':>6}{'conc':>6}{'items/s':>10}" \
+             f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rss MB':>9}{'errors':>8}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(f"{r['target']:<8}{r['model_type']:<10}{r['modality']:<9}{r['batch_size']:>6}"
+                     f"{r['concurrency']:>6}{r['throughput']:>10.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                     f"{r['p99_ms']:>10.1f}{r['peak_rss_mb']:>9.0f}{r['errors']:>8}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows: List[dict]) -> str:
+    """ 以表格输出与基线的对比 """
+    header = f"{'target':<8}{'model':<10}{'modality':<9}{'batch':>6}{'conc':>6}{'items/s':>10}{'p95':>10}" \
+             f"{'rss':>10}  结论"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        verdict = "回归: " + "，".join(r["regressions"]) if r["regressions"] else "正常"
+        lines.append(f"{r['target']:<8}{r['model_type']:<10}{r['modality']:<9}{r['batch_size']:>6}"
+                     f"{r['concurrency']:>6}{r['throughput_change']:>+10.1%}{r['p95_change']:>+10.1%}"
+                     f"{r['rss_change']:>+10.1%}  {verdict}")
+    return "\n".join(lines)
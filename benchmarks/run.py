@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 20:55
+@Author : YangFei
+@File   : run.py
+@Desc   : 基准测试入口：按 目标 x 模型 x 模态 x 批大小 x 并发数 运行场景，输出吞吐、延迟分位数与峰值内存
+
+测试目标:
+    model    直接调用 ClipVectorService.run_batch，只包含前向推理（图像预先解码）
+    service  调用 ClipVectorService.encode_text/encode_image_batch，包含解码、分词与微批调度
+    http     通过进程内 ASGI 客户端请求 FastAPI 应用，包含请求解析与响应序列化
+
+用法:
+    python -m benchmarks.run --model-types mini --output bench/current.json
+    python -m benchmarks.run --model-types mini --output bench/current.json --baseline bench/baseline.json
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TARGET_MODEL = "model"
+TARGET_SERVICE = "service"
+TARGET_HTTP = "http"
+TARGETS = (TARGET_MODEL, TARGET_SERVICE, TARGET_HTTP)
+
+MODALITIES = ("text", "image")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def _str_list(value: str) -> List[str]:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Chinese-CLIP 向量服务基准测试")
+    parser.add_argument("--targets", type=_str_list, default=list(TARGETS), help="测试目标，逗号分隔: model,service,http")
+    parser.add_argument("--model-types", type=_str_list, default=None, help="模型类型，逗号分隔，默认全部可用模型")
+    parser.add_argument("--modalities", type=_str_list, default=list(MODALITIES), help="模态，逗号分隔: text,image")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32], help="每个请求的条目数，逗号分隔")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4], help="并发请求数，逗号分隔")
+    parser.add_argument("--requests", type=int, default=20, help="每个场景的请求数")
+    parser.add_argument("--warmup", type=int, default=2, help="每个场景正式计时前的预热请求数")
+    parser.add_argument("--image-size", default="640x480", help="生成图像的尺寸，如 640x480")
+    parser.add_argument("--device", choices=["cpu", "auto"], default="cpu", help="cpu 表示屏蔽 GPU，结果在任意机器上可比")
+    parser.add_argument("--output", default="benchmarks/results/latest.json", help="结果 JSON 文件")
+    parser.add_argument("--baseline", default=None, help="基线结果 JSON 文件，指定时输出对比并在回归时返回非零退出码")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定回归的相对变化阈值")
+    args = parser.parse_args(argv)
+
+    unknown = [t for t in args.targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"不支持的测试目标 {unknown}，可选项: {list(TARGETS)}")
+    unknown = [m for m in args.modalities if m not in MODALITIES]
+    if unknown:
+        parser.error(f"不支持的模态 {unknown}，可选项: {list(MODALITIES)}")
+    return args
+
+
+def _prepare_environment(args: argparse.Namespace):
+    """ 在导入 torch 与服务模块之前设置环境变量 """
+    if args.device == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    # 关闭向量缓存，重复的输入也会完整执行推理
+    os.environ["CLIP_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["CLIP_CACHE_DISK_PATH"] = ""
+    # 多进程指标汇总与基准测试无关
+    os.environ["CLIP_METRICS_DIR"] = ""
+    # lifespan 等待默认模型加载完成，进入后即可发送请求
+    os.environ["CLIP_BACKGROUND_LOAD"] = "0"
+
+
+async def _drive(call: Callable[[int], Awaitable[int]], requests: int, concurrency: int, warmup: int) -> dict:
+    """ 以固定并发数执行请求，返回耗时统计
+
+    :param call: 执行第 i 个请求，返回成功处理的条目数
+    """
+    from benchmarks.report import summarize
+
+    for i in range(warmup):
+        await call(-1 - i)
+
+    latencies: List[float] = []
+    items = errors = 0
+    indexes = iter(range(requests))
+
+    async def worker():
+        nonlocal items, errors
+        # 多个协程共享同一个迭代器，每个请求只会被执行一次
+        for i in indexes:
+            start = time.perf_counter()
+            try:
+                count = await call(i)
+            except Exception as e:
+                errors += 1
+                logger.debug(f"请求 {i} 失败: {e}")
+                continue
+            latencies.append(time.perf_counter() - start)
+            items += count
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, items, errors, time.perf_counter() - start)
+
+
+class BenchmarkSuite:
+    """ 基准测试场景：生成负载，按测试目标构造请求函数 """
+
+    def __init__(self, args: argparse.Namespace):
+        from benchmarks.workloads import make_images, parse_size
+
+        self._args = args
+        image_size = parse_size(args.image_size)
+        # 图像预先生成，缓存已关闭，可以在请求间复用
+        self._images = make_images(max(args.batch_sizes), image_size)
+        # 经过微批调度的服务、直接推理的服务与进程内 HTTP 客户端，在应用 lifespan 中创建
+        self._vector_service = None
+        self._raw_service = None
+        self._client = None
+
+    async def run(self) -> List[dict]:
+        from app.main import app
+        from app.service_dependencies import get_batch_scheduler
+        from app.services.clip_vector import ClipVectorService
+        from benchmarks.asgi_client import ASGIClient
+        from core.cn_clip import get_clip
+
+        results = []
+        # 执行应用的 lifespan：加载默认模型（已关闭后台启动），结束时释放线程池与模型
+        async with app.router.lifespan_context(app):
+            clip = get_clip()
+            self._vector_service = ClipVectorService(clip, get_batch_scheduler())
+            self._raw_service = ClipVectorService(clip)
+            self._client = ASGIClient(app)
+
+            model_types = self._args.model_types or clip.get_available_models()
+            for model_type in model_types:
+                model_key = clip.normalize_model_type(model_type)
+                await clip.warmup(model_key)
+                for target in self._args.targets:
+                    for modality in self._args.modalities:
+                        for batch_size in self._args.batch_sizes:
+                            for concurrency in self._args.concurrency:
+                                result = await self._run_scenario(target, model_key, modality, batch_size,
+                                                                  concurrency)
+                                if result is not None:
+                                    results.append(result)
+        return results
+
+    async def _run_scenario(self, target: str, model_type: str, modality: str, batch_size: int,
+                            concurrency: int) -> Optional[dict]:
+        from benchmarks.report import RSSSampler
+        from core.config import MAX_IMAGES_PER_REQUEST
+
+        if target == TARGET_HTTP and modality == "image" and batch_size > MAX_IMAGES_PER_REQUEST:
+            logger.warning(f"批大小 {batch_size} 超过单次请求的图像上限 {MAX_IMAGES_PER_REQUEST}，跳过 http 图像场景")
+            return None
+
+        call = await self._make_call(target, model_type, modality, batch_size)
+        with RSSSampler() as sampler:
+            stats = await _drive(call, self._args.requests, concurrency, self._args.warmup)
+
+        result = {"target": target, "model_type": model_type, "modality": modality, "batch_size": batch_size,
+                  "concurrency": concurrency, **stats, "peak_rss_mb": sampler.peak_mb}
+        logger.info(f"{target}/{model_type}/{modality} batch={batch_size} concurrency={concurrency}: "
+                    f"{result['throughput']} items/s, p95 {result['p95_ms']}ms, 峰值内存 {result['peak_rss_mb']}MB，"
+                    f"失败 {result['errors']}")
+        return result
+
+    async def _make_call(self, target: str, model_type: str, modality: str,
+                         batch_size: int) -> Callable[[int], Awaitable[int]]:
+        """ 构造请求函数：参数为请求序号（负数为预热），返回成功处理的条目数 """
+        from benchmarks.workloads import make_texts
+        from core.cn_clip import get_clip
+        from core.image_decode import load_image
+
+        images = self._images[:batch_size]
+
+        def texts(i: int) -> List[str]:
+            # 每个请求使用不同的文本，避免命中 token 缓存；种子固定，多次运行的输入一致
+            return make_texts(batch_size, seed=f"{target}/{model_type}/{batch_size}/{i}")
+
+        if target == TARGET_MODEL:
+            if modality == "text":
+                return lambda i: self._count(self._raw_service.run_batch(model_type, "text", texts(i)))
+            # 只测前向推理，图像预先解码并预处理
+            clip = get_clip()
+            preprocess = clip.get_preprocess(model_type)
+            resolution = clip.get_input_resolution(model_type)
+            tensors = [load_image(data, preprocess, resolution) for data in images]
+            return lambda i: self._count(self._raw_service.run_batch(model_type, "image", tensors))
+
+        if target == TARGET_SERVICE:
+            if modality == "text":
+                return lambda i: self._count(self._vector_service.encode_text(texts(i), model_type))
+
+            async def encode_images(i: int) -> int:
+                vectors, _ = await self._vector_service.encode_image_batch(images, model_type)
+                return sum(1 for vector in vectors if vector is not None)
+            return encode_images
+
+        if modality == "text":
+            async def post_text(i: int) -> int:
+                status, body = await self._client.post_json("/api/clip/encode/text",
+                                                            {"texts": texts(i), "model_type": model_type})
+                self._check_status(status, body)
+                return batch_size
+            return post_text
+
+        async def post_images(i: int) -> int:
+            files = [("files", f"{n}.jpg", data, "image/jpeg") for n, data in enumerate(images)]
+            status, body = await self._client.post_multipart("/api/clip/encode/images", {"model_type": model_type},
+                                                             files)
+            self._check_status(status, body)
+            return batch_size
+        return post_images
+
+    @staticmethod
+    async def _count(result: Awaitable) -> int:
+        return len(await result)
+
+    @staticmethod
+    def _check_status(status: int, body: bytes):
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    _prepare_environment(args)
+
+    import app.main  # noqa: F401 应用模块导入时会把日志级别设置为 DEBUG，导入后恢复为 INFO
+    from benchmarks.report import (compare, environment, format_comparison, format_results, load_report,
+                                   save_report)
+    from core.log_config import setup_logging
+
+    setup_logging(log_level=logging.INFO)
+    results = asyncio.run(BenchmarkSuite(args).run())
+
+    meta = {"environment": environment(), "args": {k: v for k, v in vars(args).items() if k != "baseline"}}
+    save_report(args.output, results, meta)
+    print(format_results(results))
+    print(f"\n结果已保存到 {args.output}")
+
+    if not args.baseline:
+        return 0
+
+    baseline = load_report(args.baseline)
+    if baseline["meta"].get("environment", {}).get("cpu_count") != meta["environment"]["cpu_count"]:
+        print("⚠️ 基线与本次运行的 CPU 核数不同，对比结果仅供参考")
+    rows = compare(results, baseline["results"], args.threshold)
+    print(f"\n与基线 {args.baseline} 对比（阈值 {args.threshold:.0%}）:")
+    print(format_comparison(rows))
+    regressions = [row for row in rows if row["regressions"]]
+    if regressions:
+        print(f"\n❌ {len(regressions)} 个场景出现性能回归")
+        return 1
+    print("\n✅ 没有发现性能回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
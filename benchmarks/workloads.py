@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 20:32
+@Author : YangFei
+@File   : workloads.py
+@Desc   : 合成负载：随机中文文本与生成的 JPEG 图像，不依赖任何数据集
+"""
+import io
+import random
+from typing import List, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# 常用汉字，生成的文本覆盖不同的 token 数
+_CHARS = ("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定"
+          "行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其"
+          "些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建")
+
+
+def make_texts(count: int, seed: Union[int, str], min_length: int = 4, max_length: int = 48) -> List[str]:
+    """ 生成随机中文文本，长度在 [min_length, max_length] 之间均匀分布
+
+    不同的 seed 生成不同的文本，避免命中 token 缓存。
+    """
+    rng = random.Random(seed)
+    return ["".join(rng.choice(_CHARS) for _ in range(rng.randint(min_length, max_length))) for _ in range(count)]
+
+
+def make_image(rng: np.random.Generator, size: Tuple[int, int], quality: int = 90) -> bytes:
+    """ 生成一张 JPEG 图像：低分辨率随机色块放大后的平滑图像，压缩率接近真实照片 """
+    width, height = size
+    blocks = rng.integers(0, 256, size=(max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    image = Image.fromarray(blocks, mode="RGB").resize((width, height), Image.Resampling.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def make_images(count: int, size: Tuple[int, int], seed: int = 0) -> List[bytes]:
+    """ 生成一组互不相同的 JPEG 图像 """
+    rng = np.random.default_rng(seed)
+    return [make_image(rng, size) for _ in range(count)]
+
+
+def parse_size(value: str) -> Tuple[int, int]:
+    """ 解析 640x480 形式的图像尺寸 """
+    width, _, height = value.lower().partition("x")
+    return int(width), int(height or width)
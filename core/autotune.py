@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 21:35
+@Author : YangFei
+@File   : autotune.py
+@Desc   : CPU 线程自动调优：在加载好的模型上实测几种 工作进程数 x 线程数 的组合，选出总吞吐最高的一种
+
+每种组合同时启动对应数量的测量进程，各自按 core.cpu_topology 的切分方式分配物理核，
+同时开始推理固定批大小的图像，统计全部进程的总吞吐，能反映内存带宽与缓存的争用。
+
+用法（gunicorn 开启 CLIP_AUTOTUNE 时自动执行，结果缓存到 CLIP_AUTOTUNE_PATH）:
+    python -m core.autotune mini
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from core.config import AUTOTUNE_PATH, AUTOTUNE_SECONDS, AUTOTUNE_TIMEOUT, PIN_WORKERS, SHARED_WEIGHTS
+from core.cpu_topology import apply_thread_settings, available_cpus, physical_cores, split_cores
+
+logger = logging.getLogger(__name__)
+
+# 测量使用的图像批大小
+AUTOTUNE_BATCH_SIZE = 8
+
+# 关闭共享权重时每个进程持有一份私有权重，工作进程数不超过这个值，避免内存不足
+PRIVATE_WEIGHTS_MAX_WORKERS = 2
+
+# 测量结束后等待测量进程汇报结果的额外时间（秒）
+_RESULT_GRACE_SECONDS = 30.0
+
+
+def candidate_splits(cores: int, max_workers: int = 0) -> List[Tuple[int, int]]:
+    """ 候选的 (工作进程数, 每个进程的线程数) 组合：线程数取 1、2、4... 直到全部物理核，进程数 = 物理核数 / 线程数
+
+    进程数受 max_workers 限制时，线程数按限制后的进程数重新平分物理核。
+    """
+    splits, threads = [], 1
+    while True:
+        workers = max(1, cores // threads)
+        if max_workers:
+            workers = min(workers, max_workers)
+        split = (workers, max(1, cores // workers))
+        if split not in splits:
+            splits.append(split)
+        if workers == 1:
+            return splits
+        threads *= 2
+
+
+def _measure_worker(model_type: str, threads: int, cpus: Optional[List[int]], duration: float, timeout: float,
+                    barrier, results):
+    """ 测量进程：加载模型，等全部进程就绪后同时开始推理，返回本进程的吞吐（张/秒）
+
+    其他测量进程在 timeout 秒内没有就绪时，barrier.wait 抛出 BrokenBarrierError，本进程以非 0 状态退出。
+    """
+    apply_thread_settings(threads, cpus=cpus)
+
+    import torch
+    from core.cn_clip import ChineseCLIP
+
+    async def run() -> float:
+        clip = ChineseCLIP()
+        await clip.init(model_type=model_type)
+        async with clip.acquire() as entry:
+            images = torch.randn(AUTOTUNE_BATCH_SIZE, 3, entry.input_resolution, entry.input_resolution)
+            entry.encode_image(images)
+
+            barrier.wait(timeout)
+            count, start = 0, time.perf_counter()
+            while time.perf_counter() - start < duration:
+                entry.encode_image(images)
+                count += AUTOTUNE_BATCH_SIZE
+            return count / (time.perf_counter() - start)
+
+    results.put(asyncio.run(run()))
+
+
+def measure_split(model_type: str, workers: int, threads: int, duration: float, pin: bool = PIN_WORKERS,
+                  timeout: float = AUTOTUNE_TIMEOUT) -> Optional[float]:
+    """ 同时启动 workers 个测量进程，每个进程 threads 个线程，返回总吞吐（张/秒）
+
+    任一测量进程异常退出，或 timeout + duration 秒内没有全部汇报结果时，终止全部测量进程并返回 None。
+    """
+    # 使用 spawn，测量进程不继承当前进程的 OpenMP 线程状态
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+
+    plan = split_cores(physical_cores(), workers)
+    processes = []
+    for slot in range(workers):
+        cpus = sorted(cpu for core in plan[slot] for cpu in core) if pin else None
+        process = context.Process(target=_measure_worker,
+                                  args=(model_type, threads, cpus, duration, timeout, barrier, results), daemon=True)
+        process.start()
+        processes.append(process)
+
+    throughputs: List[float] = []
+    deadline = time.monotonic() + timeout + duration + _RESULT_GRACE_SECONDS
+    try:
+        while len(throughputs) < workers:
+            try:
+                throughputs.append(results.get(timeout=1.0))
+                continue
+            except queue.Empty:
+                pass
+            failed = [p.exitcode for p in processes if p.exitcode not in (None, 0)]
+            if failed:
+                logger.warning(f"{workers} 个工作进程 x {threads} 个线程：测量进程异常退出（退出码 {failed}），跳过")
+                return None
+            if time.monotonic() > deadline:
+                logger.warning(f"{workers} 个工作进程 x {threads} 个线程：测量超时，跳过")
+                return None
+    finally:
+        for process in processes:
+            if process.is_alive() and len(throughputs) < workers:
+                process.terminate()
+            process.join(timeout=_RESULT_GRACE_SECONDS)
+    return sum(throughputs)
+
+
+def autotune(model_type: str, duration: float = AUTOTUNE_SECONDS, pin: bool = PIN_WORKERS) -> dict:
+    """ 实测全部候选组合，返回最优组合与各组合的测量结果 """
+    cores = len(physical_cores())
+    max_workers = 0 if SHARED_WEIGHTS else PRIVATE_WEIGHTS_MAX_WORKERS
+    measurements = []
+    for workers, threads in candidate_splits(cores, max_workers):
+        throughput = measure_split(model_type, workers, threads, duration, pin)
+        if throughput is None:
+            continue
+        logger.info(f"⏱️ {workers} 个工作进程 x {threads} 个线程: {throughput:.1f} 张/秒")
+        measurements.append({"workers": workers, "threads": threads, "throughput": round(throughput, 2)})
+
+    if not measurements:
+        raise RuntimeError("全部组合的测量都失败了")
+    best = max(measurements, key=lambda m: m["throughput"])
+    logger.info(f"✅ 自动调优选择 {best['workers']} 个工作进程 x {best['threads']} 个线程")
+    return {
+        "model_type": model_type,
+        "cpus": available_cpus(),
+        "workers": best["workers"],
+        "threads": best["threads"],
+        "measurements": measurements,
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def load_tuned(model_type: str, path: str = AUTOTUNE_PATH) -> Optional[dict]:
+    """ 读取缓存的调优结果，CPU 或模型变化后失效 """
+    try:
+        with open(path, encoding="utf-8") as f:
+            tuned = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if tuned.get("model_type") != model_type or tuned.get("cpus") != available_cpus():
+        return None
+    return tuned
+
+
+def main(argv=None):
+    """ 执行自动调优并写入结果文件 """
+    from core.log_config import setup_logging
+
+    setup_logging(log_level=logging.INFO)
+    args = argv if argv is not None else sys.argv[1:]
+    model_type = args[0] if args else "mini"
+
+    from core.cn_clip import get_clip
+    model_key = get_clip().normalize_model_type(model_type)
+
+    tuned = autotune(model_key)
+    os.makedirs(os.path.dirname(os.path.abspath(AUTOTUNE_PATH)), exist_ok=True)
+    with open(AUTOTUNE_PATH, "w", encoding="utf-8") as f:
+        json.dump(tuned, f, ensure_ascii=False, indent=2)
+    logger.info(f"📦 调优结果已保存到 {os.path.abspath(AUTOTUNE_PATH)}")
+
+
+if __name__ == "__main__":
+    main()
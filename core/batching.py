@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 09:20
+@Author : YangFei
+@File   : batching.py
+@Desc   : 动态微批调度器，把并发请求按模型合并成一次批量推理，交互请求与批量请求分道排队
+"""
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import (
+    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BATCH_MAX_QUEUE_SIZE, BULK_SHARE, BULK_MAX_INFLIGHT, BULK_MAX_QUEUE_SIZE
+)
+from core.exceptions import TooManyRequestsException
+from core.priority import PRIORITIES, PRIORITY_BULK, PRIORITY_INTERACTIVE, current_deadline_ms, current_priority
+
+logger = logging.getLogger(__name__)
+
+# 批大小直方图的分桶上界，超过最后一个桶的计入 "+Inf"
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+# 批量执行函数：(model_type, modality, items) -> 与 items 一一对应的向量矩阵
+BatchRunner = Callable[[str, str, List[Any]], Awaitable[np.ndarray]]
+
+
+class _PendingRequest:
+    """ 队列中等待合并的单个请求 """
+    __slots__ = ("items", "future", "enqueued_at", "deadline")
+
+    def __init__(self, items: List[Any], future: asyncio.Future, enqueued_at: float, deadline: Optional[float]):
+        self.items = items
+        self.future = future
+        self.enqueued_at = enqueued_at
+        # 最晚开始推理的时间（事件循环时间），为空表示不限制
+        self.deadline = deadline
+
+
+class _QueueStats:
+    """ 单个队列的统计信息 """
+
+    def __init__(self):
+        self.batches = 0
+        self.requests = 0
+        self.items = 0
+        self.batch_size_histogram: Dict[str, int] = {str(b): 0 for b in BATCH_SIZE_BUCKETS}
+        self.batch_size_histogram["+Inf"] = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        # 入队时被拒绝的请求数（队列已满或预计超时）
+        self.rejected = 0
+        # 排队超时被丢弃的请求数
+        self.shed = 0
+
+    def observe(self, batch_size: int, waits_ms: List[float]):
+        """ 记录一次下发的批次 """
+        self.batches += 1
+        self.requests += len(waits_ms)
+        self.items += batch_size
+        bucket = next((str(b) for b in BATCH_SIZE_BUCKETS if batch_size <= b), "+Inf")
+        self.batch_size_histogram[bucket] += 1
+        self.wait_ms_total += sum(waits_ms)
+        self.wait_ms_max = max(self.wait_ms_max, *waits_ms)
+
+    def to_dict(self) -> dict:
+        """ 导出统计信息 """
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "batch_size_histogram": dict(self.batch_size_histogram),
+            "avg_wait_ms": round(self.wait_ms_total / self.requests, 3) if self.requests else 0,
+            "max_wait_ms": round(self.wait_ms_max, 3),
+            "rejected": self.rejected,
+            "shed": self.shed,
+        }
+
+
+class _Lane:
+    """ 单个优先级的等待队列 """
+
+    def __init__(self):
+        self.requests: Deque[_PendingRequest] = deque()
+        # 队列中等待的条目数
+        self.items = 0
+        self.stats = _QueueStats()
+
+
+class _KeyState:
+    """ 单个 (模型类型, 模态) 的各优先级队列与调度状态 """
+
+    def __init__(self):
+        self.lanes: Dict[str, _Lane] = {priority: _Lane() for priority in PRIORITIES}
+        # 有新请求入队或批量名额释放时唤醒后台任务
+        self.wakeup = asyncio.Event()
+        # 批量请求排队期间连续下发的交互批次数
+        self.interactive_streak = 0
+        # 推理吞吐（条/秒）的指数滑动平均，用于估计排队时间
+        self.items_per_second = 0.0
+
+
+class MicroBatchScheduler:
+    """ 动态微批调度器
+
+    并发到达的请求按 (model_type, modality) 与优先级进入各自的队列，
+    当累计条目数达到 max_batch_size，或首个请求等待超过 max_wait_ms 时，
+    合并成一个批次交给 runner 执行，再按原始顺序把结果切片返回给各个调用方。
+    超过 max_batch_size 的提交在入队时切片，批次大小不超过 max_batch_size。
+
+    交互请求优先下发；交互请求与批量请求同时排队时，批量请求按 bulk_share 分到一定比例的批次，不会被饿死。
+    批量批次的并发数受 bulk_max_inflight 限制，预计或实际排队超过时限的请求直接以 429 拒绝，并给出重试时间。
+    """
+
+    def __init__(self, runner: BatchRunner, max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, max_queue_size: int = BATCH_MAX_QUEUE_SIZE,
+                 bulk_share: float = BULK_SHARE, bulk_max_inflight: int = BULK_MAX_INFLIGHT,
+                 bulk_max_queue_size: int = BULK_MAX_QUEUE_SIZE):
+        """ 初始化调度器
+        :param runner: 批量执行函数，返回的矩阵行数必须与 items 数量一致
+        :param max_batch_size: 单批最大条目数
+        :param max_wait_ms: 最长攒批等待时间（毫秒）
+        :param max_queue_size: 单个交互队列允许积压的最大条目数
+        :param bulk_share: 交互请求与批量请求同时排队时，批量批次占的比例
+        :param bulk_max_inflight: 同时执行的批量批次数（全部队列合计）
+        :param bulk_max_queue_size: 单个批量队列允许积压的最大条目数
+        """
+        self._runner = runner
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000
+        self._max_queue_size = max(1, max_queue_size)
+        self._bulk_share = min(1.0, max(0.01, bulk_share))
+        # 每下发多少个交互批次，至少下发一个批量批次
+        self._interactive_per_bulk = max(1, round((1 - self._bulk_share) / self._bulk_share))
+        self._bulk_max_inflight = max(1, bulk_max_inflight)
+        self._bulk_max_queue_size = max(1, bulk_max_queue_size)
+        self._bulk_inflight = 0
+        self._states: Dict[Tuple[str, str], _KeyState] = {}
+        self._workers: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def submit(self, model_type: str, modality: str, items: List[Any], priority: Optional[str] = None,
+                     deadline_ms: Optional[float] = None) -> np.ndarray:
+        """ 提交一组条目，等待合并推理完成后返回对应的向量矩阵
+        :param priority: 优先级，为空时使用当前请求的优先级
+        :param deadline_ms: 允许的排队时间（毫秒），为空时使用当前请求的时限，0 表示不限制
+        """
+        if not items:
+            raise ValueError("提交的条目不能为空")
+
+        priority = priority or current_priority()
+        deadline_ms = current_deadline_ms() if deadline_ms is None else deadline_ms
+        key = (model_type, modality)
+        state = self._ensure_worker(key)
+        lane = state.lanes[priority]
+
+        # 队列已经积压过多时直接拒绝，由客户端稍后重试
+        max_queue_size = self._bulk_max_queue_size if priority == PRIORITY_BULK else self._max_queue_size
+        if lane.items > 0 and lane.items + len(items) > max_queue_size:
+            lane.stats.rejected += 1
+            logger.warning(f"微批队列 {model_type}/{modality}/{priority} 已满({lane.items})，拒绝新请求")
+            raise TooManyRequestsException("推理队列已满，请稍后重试.",
+                                           retry_after=max(1.0, self._estimate_wait(state, priority, len(items))))
+
+        # 按当前吞吐估计排队时间，预计超过时限的请求不再入队
+        if deadline_ms:
+            wait = self._estimate_wait(state, priority, len(items))
+            if wait * 1000 > deadline_ms:
+                lane.stats.rejected += 1
+                raise TooManyRequestsException(f"预计排队 {wait:.1f}s，超过 {deadline_ms / 1000:.1f}s 的时限，请稍后重试.",
+                                               retry_after=wait)
+
+        # 超过单批上限的提交切成多个请求入队，每个切片下发之后都会重新选择优先级，
+        # 大批量提交不会整块占住推理，交互请求可以插在切片之间
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        deadline = now + deadline_ms / 1000 if deadline_ms else None
+        futures = []
+        for start in range(0, len(items), self._max_batch_size):
+            future = loop.create_future()
+            lane.requests.append(_PendingRequest(items[start:start + self._max_batch_size], future, now, deadline))
+            futures.append(future)
+        lane.items += len(items)
+        state.wakeup.set()
+
+        if len(futures) == 1:
+            return await futures[0]
+        try:
+            return np.concatenate(await asyncio.gather(*futures), axis=0)
+        except BaseException:
+            # 任一切片失败或调用方取消时，其余切片不再推理
+            for future in futures:
+                future.cancel()
+            raise
+
+    def _estimate_wait(self, state: _KeyState, priority: str, count: int) -> float:
+        """ 估计新请求的排队时间（秒）：排在前面的条目数 / 推理吞吐；还没有吞吐数据时返回 0 """
+        if not state.items_per_second:
+            return 0.0
+        ahead = state.lanes[PRIORITY_INTERACTIVE].items + count
+        if priority == PRIORITY_BULK:
+            ahead += state.lanes[PRIORITY_BULK].items
+        return ahead / state.items_per_second
+
+    def _ensure_worker(self, key: Tuple[str, str]) -> _KeyState:
+        """ 获取队列状态，并确保对应的后台消费任务在运行 """
+        if key not in self._states:
+            self._states[key] = _KeyState()
+
+        worker = self._workers.get(key)
+        if worker is None or worker.done():
+            # 后台任务长期存在，不继承创建它的请求的上下文（优先级等）
+            self._workers[key] = asyncio.create_task(self._worker(key), name=f"batcher-{key[0]}-{key[1]}",
+                                                     context=contextvars.Context())
+
+        return self._states[key]
+
+    def _pick_lane(self, state: _KeyState) -> Optional[str]:
+        """ 选择下一个批次的优先级：交互优先，批量请求按比例插入，批量名额用完时只下发交互请求 """
+        interactive = bool(state.lanes[PRIORITY_INTERACTIVE].requests)
+        bulk_ready = bool(state.lanes[PRIORITY_BULK].requests) and self._bulk_inflight < self._bulk_max_inflight
+        if interactive and not (bulk_ready and state.interactive_streak >= self._interactive_per_bulk):
+            return PRIORITY_INTERACTIVE
+        return PRIORITY_BULK if bulk_ready else None
+
+    async def _worker(self, key: Tuple[str, str]):
+        """ 后台消费任务：选择优先级、攒批并下发 """
+        state = self._states[key]
+
+        while True:
+            priority = self._pick_lane(state)
+            if priority is None:
+                state.wakeup.clear()
+                await state.wakeup.wait()
+                continue
+
+            batch = await self._collect(state, priority)
+            if not batch:
+                continue
+
+            if priority == PRIORITY_INTERACTIVE:
+                if state.lanes[PRIORITY_BULK].requests:
+                    state.interactive_streak += 1
+                await self._flush(key, state, priority, batch)
+                continue
+
+            state.interactive_streak = 0
+            self._bulk_inflight += 1
+            try:
+                await self._flush(key, state, priority, batch)
+            finally:
+                self._bulk_inflight -= 1
+                # 批量名额释放，唤醒其他因名额用完而等待的队列
+                for other in self._states.values():
+                    other.wakeup.set()
+
+    async def _collect(self, state: _KeyState, priority: str) -> List[_PendingRequest]:
+        """ 从指定优先级的队列中攒一个批次，跳过已取消和排队超时的请求 """
+        lane = state.lanes[priority]
+        loop = asyncio.get_running_loop()
+        batch: List[_PendingRequest] = []
+        size = 0
+        deadline = None
+
+        while size < self._max_batch_size:
+            # 已经到达的请求直接取走，不必等待；放不下的请求留给下一个批次
+            if lane.requests:
+                if batch and size + len(lane.requests[0].items) > self._max_batch_size:
+                    break
+                request = lane.requests.popleft()
+                lane.items -= len(request.items)
+                if self._expired(state, priority, request, loop.time()):
+                    continue
+                batch.append(request)
+                size += len(request.items)
+                if deadline is None:
+                    deadline = loop.time() + self._max_wait
+                continue
+
+            if deadline is None:
+                break
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            state.wakeup.clear()
+            try:
+                await asyncio.wait_for(state.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def _expired(self, state: _KeyState, priority: str, request: _PendingRequest, now: float) -> bool:
+        """ 请求是否已经取消或排队超时，超时的请求以 429 结束 """
+        if request.future.done():
+            return True
+        if request.deadline is None or now <= request.deadline:
+            return False
+
+        state.lanes[priority].stats.shed += 1
+        request.future.set_exception(TooManyRequestsException(
+            "排队超时，请稍后重试.", retry_after=max(1.0, self._estimate_wait(state, priority, 0))))
+        return True
+
+    async def _flush(self, key: Tuple[str, str], state: _KeyState, priority: str, batch: List[_PendingRequest]):
+        """ 执行一个批次，并把结果切片分发给各个调用方 """
+        items = [item for r in batch for item in r.items]
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        state.lanes[priority].stats.observe(len(items), [(now - r.enqueued_at) * 1000 for r in batch])
+
+        try:
+            outputs = await self._runner(key[0], key[1], items)
+        except asyncio.CancelledError:
+            for r in batch:
+                r.future.cancel()
+            raise
+        except Exception as e:
+            for r in batch:
+                if not r.future.done():
+                    r.future.set_exception(e)
+            return
+
+        elapsed = loop.time() - now
+        if elapsed > 0:
+            rate = len(items) / elapsed
+            state.items_per_second = rate if not state.items_per_second else 0.8 * state.items_per_second + 0.2 * rate
+
+        offset = 0
+        for r in batch:
+            count = len(r.items)
+            if not r.future.done():
+                r.future.set_result(outputs[offset:offset + count])
+            offset += count
+
+    def stats(self) -> dict:
+        """ 获取调度器统计信息：各优先级的队列深度、批大小直方图、等待时间与拒绝数 """
+        return {
+            "max_batch_size": self._max_batch_size,
+            "max_wait_ms": self._max_wait * 1000,
+            "max_queue_size": self._max_queue_size,
+            "bulk_share": self._bulk_share,
+            "bulk_max_inflight": self._bulk_max_inflight,
+            "bulk_max_queue_size": self._bulk_max_queue_size,
+            "bulk_inflight": self._bulk_inflight,
+            "queues": [
+                {
+                    "model_type": model_type,
+                    "modality": modality,
+                    "priority": priority,
+                    "queue_depth": self._states[(model_type, modality)].lanes[priority].items,
+                    "items_per_second": round(self._states[(model_type, modality)].items_per_second, 2),
+                    **self._states[(model_type, modality)].lanes[priority].stats.to_dict(),
+                }
+                for model_type, modality in sorted(self._states.keys())
+                for priority in PRIORITIES
+            ],
+        }
+
+    async def shutdown(self):
+        """ 停止所有后台任务，未完成的请求以异常结束 """
+        for worker in self._workers.values():
+            worker.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+
+        for state in self._states.values():
+            for lane in state.lanes.values():
+                while lane.requests:
+                    request = lane.requests.popleft()
+                    if not request.future.done():
+                        request.future.set_exception(RuntimeError("微批调度器已关闭"))
+        self._states.clear()
+
+        logger.info("微批调度器已关闭")
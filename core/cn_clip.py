@@ -7,29 +7,156 @@
 @Desc   : Chinese-CLIP 多模态向量模型
 """
 import os
+import time
+import asyncio
 import logging
 import torch
-from typing import List, Optional
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional
 from functools import lru_cache
 from torchvision.transforms import Compose
 from cn_clip.clip import load_from_name, tokenize
 from cn_clip.clip.model import CLIP
+from cn_clip.clip.utils import _MODEL_INFO, image_transform
 
 
+from core.compiled import COMPILE_OFF, COMPILE_TRACE, CompiledEncoders, parse_buckets
+from core.config import (
+    MODEL_MEMORY_BUDGET_MB, MODEL_PRECISION, COMPILE_MODE, COMPILE_BATCH_BUCKETS, COMPILE_CACHE_DIR,
+    SHARED_WEIGHTS, SHARED_WEIGHTS_DIR, SWAP_DRAIN_TIMEOUT
+)
 from core.exceptions import BasRequestException
+from core.metrics import MODEL_LOADS, MODEL_EVICTIONS, MODEL_SWITCHES
+from core.readiness import MODEL_FAILED, MODEL_LOADED, MODEL_LOADING, MODEL_READY, MODEL_WARMING, get_startup_state
+from core.shared_weights import export_weights, load_mapped, source_path, weights_identity
+from core.swap_requests import get_swap_requests
+from core.precision import (
+    PRECISION_FP32, PRECISION_BF16, parse_precision_config, resolve_precision, apply_precision, inference_context,
+    module_bytes, reference_inputs, encode_reference, deviation_report, validate_precision
+)
 
 logger = logging.getLogger(__name__)
 
+# 热切换进行中的状态
+_SWAP_ACTIVE = ("pending", "loading", "warming")
+
+
+class LoadedModel:
+    """常驻内存的模型条目"""
+
+    def __init__(self, model_type: str, model: CLIP, preprocess: Compose, device: str, input_resolution: int,
+                 precision: str = PRECISION_FP32, deviation: Optional[dict] = None,
+                 compiled: Optional[CompiledEncoders] = None, weights_id: str = ""):
+        self.model_type = model_type
+        self.model = model
+        self.preprocess = preprocess
+        self.device = device
+        self.input_resolution = input_resolution
+        # 推理精度，以及加载时评估的与 fp32 的余弦偏差（fp32 时为空）
+        self.precision = precision
+        self.deviation = deviation
+        # 追踪后的编码器，为空时使用 eager 模式
+        self.compiled = compiled
+        # 加载时预训练权重文件的标识，用于区分更新前后的向量缓存
+        self.weights_id = weights_id
+        # 模型训练得到的温度系数（已取指数），零样本分类时用于把相似度换算成 logits
+        self.logit_scale = float(model.logit_scale.exp().item())
+        if compiled is not None and compiled.from_disk:
+            # 从磁盘加载的追踪模块持有独立的权重副本，推理不再使用 eager 模型，释放其权重，只常驻一份
+            self.model = None
+        # 权重占用的字节数，用于内存预算
+        self.size_bytes = module_bytes(self.model if self.model is not None else compiled.module)
+        # 正在使用该模型的请求数，大于 0 时不会被淘汰
+        self.ref_count = 0
+        self.loaded_at = time.time()
+        self.last_used = time.time()
+
+    def to_dict(self) -> dict:
+        """导出模型条目信息"""
+        return {
+            "model_type": self.model_type,
+            "device": self.device,
+            "precision": self.precision,
+            "weights_id": self.weights_id,
+            "deviation": self.deviation,
+            "compiled_buckets": self.compiled.buckets if self.compiled is not None else None,
+            "logit_scale": round(self.logit_scale, 4),
+            "size_mb": round(self.size_bytes / 1024 / 1024, 1),
+            "ref_count": self.ref_count,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+        }
+
+    def inference_context(self):
+        """获取推理时的精度上下文"""
+        return inference_context(self.precision, self.device)
+
+    def encode_text(self, text_tokens: torch.Tensor) -> torch.Tensor:
+        """编码文本 token，返回未归一化的 fp32 向量"""
+        encoder = self.compiled if self.compiled is not None else self.model
+        with torch.no_grad(), self.inference_context():
+            return encoder.encode_text(text_tokens).float()
+
+    def encode_image(self, images: torch.Tensor) -> torch.Tensor:
+        """编码预处理后的图像，返回未归一化的 fp32 向量"""
+        encoder = self.compiled if self.compiled is not None else self.model
+        with torch.no_grad(), self.inference_context():
+            return encoder.encode_image(images).float()
+
+    def warmup_batch_sizes(self) -> List[int]:
+        """预热使用的批大小，编译模式下覆盖全部分桶"""
+        return self.compiled.buckets if self.compiled is not None else [1, 8]
+
+    def release(self):
+        """释放权重引用，只能在没有请求使用该实例之后调用"""
+        self.model = None
+        self.compiled = None
+
+    def warmup(self, batch_sizes: List[int]):
+        """用合成输入跑若干批次，触发算子初始化与内存分配，避免首个请求承担冷启动开销"""
+        start = time.perf_counter()
+        for batch_size in batch_sizes:
+            self.encode_text(tokenize(["预热"] * batch_size).to(self.device))
+            self.encode_image(torch.zeros(batch_size, 3, self.input_resolution, self.input_resolution,
+                                          device=self.device))
+        logger.info(f"🔥 模型 {self.model_type} 预热完成，批大小 {batch_sizes}，耗时 {time.perf_counter() - start:.1f}s")
+
 
 class ChineseCLIP:
-    """Chinese-CLIP 多模态向量模型"""
+    """Chinese-CLIP 多模态向量模型
 
-    def __init__(self):
+    多个模型类型可以同时常驻内存，按最近最少使用（LRU）顺序在超出内存预算时淘汰，
+    正在被请求使用的模型不会被淘汰。
+    """
+
+    def __init__(self, memory_budget_mb: int = MODEL_MEMORY_BUDGET_MB, precision_config: str = MODEL_PRECISION,
+                 compile_mode: str = COMPILE_MODE, shared_weights: bool = SHARED_WEIGHTS):
         """初始化 Chinese-CLIP 模型实例"""
-        self._model: Optional[CLIP] = None
-        self._preprocess: Optional[Compose] = None
-        # 当前的模型name
+        # 已加载的模型，按最近使用顺序排列（末尾为最近使用）
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        # 每个模型类型一把加载锁，保证并发的首次请求只加载一次
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        # 常驻模型的内存预算（字节），0 表示不限制
+        self._memory_budget_bytes = max(0, memory_budget_mb) * 1024 * 1024
+        # 各模型类型的推理精度
+        self._precisions = parse_precision_config(precision_config)
+        # 编译执行模式与批大小分桶
+        self._compile_mode = compile_mode.strip().lower()
+        if self._compile_mode not in (COMPILE_OFF, COMPILE_TRACE):
+            raise ValueError(f"不支持的编译模式 {compile_mode}，可选项: {[COMPILE_OFF, COMPILE_TRACE]}")
+        self._compile_buckets = parse_buckets(COMPILE_BATCH_BUCKETS)
+        # CPU 推理时是否以 mmap 共享权重
+        self._shared_weights = shared_weights
+        # 模型目录
+        self._model_dir: str = "models/pretrained_weights"
+        # 默认的模型name，请求未指定模型类型时使用
         self._model_type: str = ''
+        # 各模型类型的图像预处理器（只依赖输入分辨率，无需加载模型）
+        self._preprocess_cache: Dict[str, Compose] = {}
+        # 最近的热切换报告（包括进行中的），以及本进程最近执行的切换请求 id
+        self._swaps: Deque[dict] = deque(maxlen=20)
+        self._swap_request_id: Optional[str] = None
         # 预定义模型配置
         self._model_configs = {
             "mini": "RN50",  # 迷你版, 速度最快，适用于开发测试场景
@@ -40,73 +167,352 @@ class ChineseCLIP:
         }
 
     async def init(self, model_type: str = "mini", model_dir: str = "models/pretrained_weights"):
-        """初始化服务，加载所有模型"""
-        if self._model is not None:
+        """初始化服务，加载默认模型"""
+        if self._model_type:
             logger.warning('Chinese-CLIP 模型实例已经完成初始化。')
             return
 
         logger.info("🚀 开始初始化 Chinese-CLIP 模型实例...")
 
-        # 标准化模型键
-        model_key = model_type.strip().lower()
-        # 保存模型类型
+        # 标准化并验证模型类型；已经发布过热切换请求时按请求的模型与精度启动，与其他工作进程保持一致
+        model_key = self.normalize_model_type(model_type)
+        self._model_dir = model_dir
+        request = get_swap_requests().latest()
+        if request is not None:
+            model_key = self._startup_swap_settings(request, model_key)
+
+        await self._ensure_loaded(model_key)
+
+        # 保存默认模型类型
         self._model_type = model_key
+        if request is not None:
+            get_swap_requests().write_status(request["id"], {"model_type": request["model_type"], "status": "done",
+                                                             "at_startup": True, "finished_at": time.time()})
 
-        # 验证模型类型
-        if model_key not in self._model_configs:
-            raise BasRequestException(
-                f"指定模型 {model_type} 不存在，可选项: {list(self._model_configs.keys())}")
+    def _load(self, model_key: str, precision: Optional[str] = None) -> LoadedModel:
+        """加载模型（阻塞），在线程中执行
 
+        :param precision: 推理精度，默认使用配置中该模型类型的精度
+        """
         # 使用绝对路径
-        abs_model_dir = os.path.abspath(model_dir)
+        abs_model_dir = os.path.abspath(self._model_dir)
         logger.info(f"📁 模型目录: {abs_model_dir}")
 
-        try:
-            # 判断是否使用 GPU
-            device = "cuda" if torch.cuda.is_available() else "cpu"
+        # 判断是否使用 GPU
+        device = "cuda" if torch.cuda.is_available() else "cpu"
 
+        resolution = _MODEL_INFO[self._model_configs[model_key]]["input_resolution"]
+        if self._shared_weights and device == "cpu":
+            # 权重以 mmap 映射，多个工作进程共享同一份物理内存
+            model = load_mapped(self._model_configs[model_key], self.export_shared_weights(model_key))
+            preprocess = image_transform(resolution)
+        else:
             # 自动从 model_dir 查找对应的 .pt 文件
             model, preprocess = load_from_name(
                 name=self._model_configs[model_key],
                 device=device,
                 download_root=abs_model_dir
             )
+        # 预训练权重文件不存在时由上面的加载下载，标识在加载之后读取
+        weights_id = self.weights_identity(model_key)
 
-            # 切换到评估模式（关闭 dropout 等训练相关层）
-            model.eval()
+        # 切换到评估模式（关闭 dropout 等训练相关层）
+        model.eval()
 
-            # 保存模型和预处理器
-            self._model = model
-            self._preprocess = preprocess
+        precision = resolve_precision(precision or self.get_precision(model_key), device)
+        deviation = None
+        if precision != PRECISION_FP32:
+            # 转换前先用 fp32 编码参考输入，转换后再编码一次，评估精度损失
+            inputs = reference_inputs(resolution, device)
+            reference = encode_reference(model, PRECISION_FP32, device, inputs)
+            model = apply_precision(model, precision)
+            deviation = deviation_report(reference, encode_reference(model, precision, device, inputs))
+            logger.info(f"📐 模型 {model_key} 使用 {precision} 精度，与 fp32 的余弦偏差: {deviation}")
 
-            logger.info(f"✅  成功加载的模型类型 {model_key} -> {device}")
+        compiled = None
+        if self._compile_mode == COMPILE_TRACE:
+            if precision == PRECISION_BF16:
+                logger.warning(f"模型 {model_key} 使用 bf16 自动混合精度，不支持追踪，使用 eager 模式")
+            else:
+                # mmap 映射的 fp32 权重总是重新追踪：追踪模块与映射的权重共享内存，
+                # 从磁盘加载的追踪模块则会持有各进程私有的权重副本
+                mapped = self._shared_weights and device == "cpu" and precision == PRECISION_FP32
+                compiled = CompiledEncoders(model, model_key, precision, resolution, self._compile_buckets,
+                                            COMPILE_CACHE_DIR, device, weights_id, load_cached=not mapped)
 
-        except Exception as e:
-            logger.error(f"❌ 加载模型 {model_key} 失败: {e}")
-            raise
+        return LoadedModel(model_key, model, preprocess, device, resolution, precision, deviation, compiled,
+                           weights_id)
 
-    async def switch_model(self, model_type: str = 'mini', model_dir: str = "models/pretrained_weights") -> None:
-        """切换当前使用的模型"""
-        logger.debug(f"🔄 切换 Chinese-CLIP 模型到 {model_type}...")
+    async def _ensure_loaded(self, model_key: str) -> LoadedModel:
+        """确保模型已加载，返回模型条目"""
+        entry = self._models.get(model_key)
+        if entry is not None:
+            self._models.move_to_end(model_key)
+            return entry
 
-        # 标准化模型键
-        model_key = model_type.strip().lower()
+        lock = self._load_locks.setdefault(model_key, asyncio.Lock())
+        async with lock:
+            # 等锁期间可能已经被其他请求加载完成
+            entry = self._models.get(model_key)
+            if entry is not None:
+                self._models.move_to_end(model_key)
+                return entry
 
-        if self._model_type and model_key != self._model_type:
-            # 清理当前模型资源
-            await self.shutdown()
+            start = time.perf_counter()
+            startup = get_startup_state()
+            startup.update_model(model_key, MODEL_LOADING)
+            try:
+                # 加载过程较慢，放到线程中执行避免阻塞事件循环
+                entry = await asyncio.to_thread(self._load, model_key)
+            except Exception as e:
+                logger.error(f"❌ 加载模型 {model_key} 失败: {e}")
+                startup.update_model(model_key, MODEL_FAILED, error=str(e))
+                raise
 
-            # 重新初始化模型
-            await self.init(model_type=model_type, model_dir=model_dir)
+            self._models[model_key] = entry
+            MODEL_LOADS.inc(model_type=model_key)
+            startup.update_model(model_key, MODEL_LOADED, device=entry.device, precision=entry.precision,
+                                 size_mb=round(entry.size_bytes / 1024 / 1024, 1),
+                                 load_seconds=round(time.perf_counter() - start, 3))
+            logger.info(f"✅  成功加载的模型类型 {model_key} -> {entry.device}，"
+                        f"占用 {entry.size_bytes / 1024 / 1024:.0f}MB，耗时 {time.perf_counter() - start:.1f}s")
 
-            logger.info(f"✅ 成功切换到 {model_type} 模型。")
-        else:
+            self._evict_if_needed(keep=model_key)
+            if self._memory_budget_bytes and self._resident_bytes() > self._memory_budget_bytes:
+                logger.warning(f"常驻模型占用 {self._resident_bytes() / 1024 / 1024:.0f}MB，"
+                               f"超出预算 {self._memory_budget_bytes / 1024 / 1024:.0f}MB，待使用中的模型释放后再淘汰")
+            return entry
+
+    def _evict_if_needed(self, keep: str = ''):
+        """超出内存预算时，按 LRU 顺序淘汰未被使用的模型"""
+        if not self._memory_budget_bytes:
+            return
+
+        evicted = False
+        for model_key in list(self._models.keys()):
+            if self._resident_bytes() <= self._memory_budget_bytes:
+                break
+
+            entry = self._models[model_key]
+            # 默认模型、刚加载的模型和正在使用的模型不淘汰
+            if model_key in (keep, self._model_type) or entry.ref_count > 0:
+                continue
+
+            del self._models[model_key]
+            evicted = True
+            MODEL_EVICTIONS.inc(model_type=model_key)
+            logger.info(f"♻️ 内存预算不足，淘汰模型 {model_key}（{entry.size_bytes / 1024 / 1024:.0f}MB）")
+
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _resident_bytes(self) -> int:
+        """常驻模型占用的总字节数"""
+        return sum(entry.size_bytes for entry in self._models.values())
+
+    @asynccontextmanager
+    async def acquire(self, model_type: Optional[str] = None) -> AsyncIterator[LoadedModel]:
+        """获取指定模型并在使用期间持有引用，避免被淘汰
+
+        用法: async with clip.acquire("base") as entry: entry.model.encode_image(...)
+        """
+        model_key = self.normalize_model_type(model_type or self._model_type)
+        entry = await self._ensure_loaded(model_key)
+
+        # _ensure_loaded 返回后没有再让出事件循环，引用计数的增加与加载之间不会被淘汰打断
+        entry.ref_count += 1
+        entry.last_used = time.time()
+        try:
+            yield entry
+        finally:
+            entry.ref_count -= 1
+            self._evict_if_needed()
+
+    async def get_logit_scale(self, model_type: Optional[str] = None) -> float:
+        """获取模型的温度系数，模型未加载时先加载"""
+        async with self.acquire(model_type) as entry:
+            return entry.logit_scale
+
+    async def warmup(self, model_type: Optional[str] = None) -> None:
+        """预热指定模型（默认模型），编译模式下覆盖全部分桶"""
+        async with self.acquire(model_type) as entry:
+            startup = get_startup_state()
+            startup.update_model(entry.model_type, MODEL_WARMING)
+            start = time.perf_counter()
+            await asyncio.to_thread(entry.warmup, entry.warmup_batch_sizes())
+            startup.update_model(entry.model_type, MODEL_READY, warmup_seconds=round(time.perf_counter() - start, 3))
+
+    async def switch_model(self, model_type: str = 'mini', model_dir: str = "models/pretrained_weights") -> None:
+        """切换默认使用的模型，已加载的其他模型继续常驻"""
+        logger.debug(f"🔄 切换 Chinese-CLIP 默认模型到 {model_type}...")
+
+        model_key = self.normalize_model_type(model_type)
+        if model_key == self._model_type:
             logger.debug('已经是指定模型类型，无需切换。')
+            return
+
+        self._model_dir = model_dir
+        if model_key not in self._models:
+            # 模型尚未常驻时在后台加载并预热，完成后再切换，切换前原默认模型继续处理请求
+            await self.hot_swap(model_key, make_default=True)
+        else:
+            self._model_type = model_key
+            MODEL_SWITCHES.inc(model_type=model_key)
+
+        logger.info(f"✅ 成功切换到 {model_type} 模型。")
+
+    def request_hot_swap(self, model_type: str, precision: Optional[str] = None, make_default: bool = True,
+                         warmup: bool = True) -> dict:
+        """发布热切换请求，全部工作进程（包括本进程）轮询到请求后各自在后台执行，立即返回请求内容"""
+        model_key = self.normalize_model_type(model_type)
+        precision = validate_precision(precision) if precision else None
+        requests = get_swap_requests()
+        if any(status.get("model_type") == model_key and status.get("status") in _SWAP_ACTIVE
+               for status in requests.statuses()):
+            raise BasRequestException(f"模型 {model_key} 正在热切换中，请稍后重试")
+        return requests.publish(model_key, precision, make_default, warmup)
+
+    def _startup_swap_settings(self, request: dict, model_key: str) -> str:
+        """新启动的工作进程按最近的热切换请求设置精度，返回要加载的默认模型"""
+        self._swap_request_id = request["id"]
+        swap_key = self.normalize_model_type(request["model_type"])
+        if request.get("precision"):
+            self._precisions[swap_key] = validate_precision(request["precision"])
+        logger.info(f"按热切换请求 {request['id']} 启动: {swap_key}（{self.get_precision(swap_key)}）")
+        return swap_key if request.get("make_default", True) else model_key
+
+    async def apply_swap_request(self, request: dict) -> Optional[dict]:
+        """在本进程执行热切换请求，同一个请求只执行一次，进度写入本进程的状态文件
+        :return: 切换报告，请求已经执行过时返回 None
+        """
+        if request["id"] == self._swap_request_id:
+            return None
+        self._swap_request_id = request["id"]
+
+        requests = get_swap_requests()
+        report = {"model_type": request["model_type"], "request_id": request["id"], "status": "pending",
+                  "started_at": time.time()}
+        self._swaps.append(report)
+        requests.write_status(request["id"], report)
+        try:
+            await self.hot_swap(request["model_type"], request.get("precision"), request.get("make_default", True),
+                                request.get("warmup", True), report=report)
+        except Exception:
+            # 失败原因已经写入报告
+            pass
+        finally:
+            requests.write_status(request["id"], report)
+        return report
+
+    async def hot_swap(self, model_type: str, precision: Optional[str] = None, make_default: bool = True,
+                       warmup: bool = True, drain_timeout: float = SWAP_DRAIN_TIMEOUT,
+                       report: Optional[dict] = None) -> dict:
+        """热切换模型，切换期间旧实例继续处理请求
+
+        1. 在线程中加载新实例（可以指定新的精度，或重新加载更新后的权重文件），并用合成批次预热
+        2. 原子替换模型引用（之间没有 await），之后的请求都使用新实例，可同时切换默认模型
+        3. 等待仍持有旧实例的请求完成后释放旧权重
+
+        :return: 切换报告：各阶段耗时、新旧实例同时常驻的时长与内存
+        """
+        model_key = self.normalize_model_type(model_type)
+        precision = validate_precision(precision) if precision else None
+        if report is None:
+            report = {"model_type": model_key, "status": "pending", "started_at": time.time()}
+            self._swaps.append(report)
+        report.update(precision=precision or self.get_precision(model_key), make_default=make_default)
+
+        start = time.perf_counter()
+        lock = self._load_locks.setdefault(model_key, asyncio.Lock())
+        try:
+            # 持有加载锁，避免与首次加载或其他热切换并发加载同一个模型
+            async with lock:
+                report["status"] = "loading"
+                entry = await asyncio.to_thread(self._load, model_key, precision)
+                report["load_seconds"] = round(time.perf_counter() - start, 3)
+
+                if warmup:
+                    report["status"] = "warming"
+                    warmup_start = time.perf_counter()
+                    await asyncio.to_thread(entry.warmup, entry.warmup_batch_sizes())
+                    report["warmup_seconds"] = round(time.perf_counter() - warmup_start, 3)
+
+                # 原子切换：以下赋值之间不让出事件循环，新请求立即拿到新实例，进行中的请求继续持有旧实例
+                old = self._models.get(model_key)
+                self._models[model_key] = entry
+                self._models.move_to_end(model_key)
+                if precision:
+                    self._precisions[model_key] = precision
+                previous_default = self._model_type
+                if make_default:
+                    self._model_type = model_key
+                switched = time.perf_counter()
+
+            MODEL_LOADS.inc(model_type=model_key)
+            get_startup_state().update_model(model_key, MODEL_READY if warmup else MODEL_LOADED, device=entry.device,
+                                             precision=entry.precision,
+                                             size_mb=round(entry.size_bytes / 1024 / 1024, 1),
+                                             load_seconds=report["load_seconds"],
+                                             warmup_seconds=report.get("warmup_seconds"))
+            if make_default and previous_default != model_key:
+                MODEL_SWITCHES.inc(model_type=model_key)
+            logger.info(f"🔁 模型 {model_key} 已切换到新实例（{entry.precision}），"
+                        f"加载与预热耗时 {switched - start:.1f}s")
+
+            report.update(status="draining", cutover_at=time.time(), previous_default=previous_default,
+                          new_size_mb=round(entry.size_bytes / 1024 / 1024, 1),
+                          old_size_mb=round(old.size_bytes / 1024 / 1024, 1) if old is not None else 0,
+                          overlap_mb=round((entry.size_bytes + (old.size_bytes if old else 0)) / 1024 / 1024, 1),
+                          shared_weights=self._shared_weights and entry.device == "cpu")
+
+            drained, replaced = True, old is not None
+            if replaced:
+                report["old_ref_count"] = old.ref_count
+                drained = await self._drain(old, drain_timeout)
+                if drained:
+                    old.release()
+                else:
+                    logger.warning(f"模型 {model_key} 的旧实例仍有 {old.ref_count} 个请求在使用，"
+                                   f"将在最后一个请求完成后释放")
+                old = None
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            self._evict_if_needed(keep=model_key)
+
+            finished = time.perf_counter()
+            report.update(status="done", drained=drained,
+                          drain_seconds=round(finished - switched, 3),
+                          # 新旧实例同时常驻的时长：从开始加载新实例到释放旧实例
+                          overlap_seconds=round(finished - start, 3) if replaced else 0,
+                          total_seconds=round(finished - start, 3))
+            logger.info(f"✅ 模型 {model_key} 热切换完成: {report}")
+            return report
+
+        except asyncio.CancelledError:
+            report.update(status="cancelled", total_seconds=round(time.perf_counter() - start, 3))
+            raise
+        except Exception as e:
+            logger.error(f"❌ 模型 {model_key} 热切换失败，继续使用原实例: {e}", exc_info=True)
+            report.update(status="failed", error=str(e), total_seconds=round(time.perf_counter() - start, 3))
+            raise
+
+    @staticmethod
+    async def _drain(entry: LoadedModel, timeout: float) -> bool:
+        """等待持有模型实例的请求全部完成，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        while entry.ref_count > 0:
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def get_swaps(self) -> List[dict]:
+        """获取最近的热切换报告，从新到旧"""
+        return [dict(report) for report in reversed(self._swaps)]
 
     async def shutdown(self) -> None:
         """关闭服务，清理资源"""
-        self._model = None
-        self._preprocess = None
+        self._models.clear()
         self._model_type = ''
 
         if torch.cuda.is_available():
@@ -118,6 +524,62 @@ class ChineseCLIP:
         """获取可用模型列表"""
         return list(self._model_configs.keys())
 
+    def get_loaded_models(self) -> dict:
+        """获取常驻模型信息与内存预算"""
+        return {
+            "default_model": self._model_type,
+            "memory_budget_mb": self._memory_budget_bytes // 1024 // 1024,
+            "resident_mb": round(self._resident_bytes() / 1024 / 1024, 1),
+            # 按最近使用顺序，从最近到最久
+            "models": [entry.to_dict() for entry in reversed(self._models.values())],
+        }
+
+    def normalize_model_type(self, model_type: str) -> str:
+        """标准化并校验模型类型，返回模型键"""
+        model_key = model_type.strip().lower()
+        if model_key not in self._model_configs:
+            raise BasRequestException(
+                f"指定模型 {model_type} 不存在，可选项: {list(self._model_configs.keys())}")
+        return model_key
+
+    def get_precision(self, model_type: str) -> str:
+        """获取模型类型配置的推理精度"""
+        model_key = self.normalize_model_type(model_type)
+        return self._precisions.get(model_key, self._precisions["*"])
+
+    def weights_identity(self, model_type: str) -> str:
+        """获取预训练权重文件的标识（大小与修改时间），文件不存在时为空"""
+        model_key = self.normalize_model_type(model_type)
+        return weights_identity(source_path(self._model_configs[model_key], self._model_dir))
+
+    def cache_namespace(self, model_type: str) -> str:
+        """获取向量缓存的命名空间，不同精度、不同权重文件的向量互不混用
+
+        模型已常驻时使用常驻实例加载时的权重标识，权重文件更新后、热切换完成前仍然命中旧实例的缓存；
+        热切换到新权重后命名空间随之变化，不会读到旧权重的向量。
+        """
+        model_key = self.normalize_model_type(model_type)
+        entry = self._models.get(model_key)
+        weights_id = entry.weights_id if entry is not None else self.weights_identity(model_key)
+        return f"{model_key}@{self.get_precision(model_key)}#{weights_id}"
+
+    def export_shared_weights(self, model_type: str) -> str:
+        """导出共享权重文件（已存在时直接返回路径），可在工作进程启动前预先执行"""
+        model_key = self.normalize_model_type(model_type)
+        return export_weights(self._model_configs[model_key], model_key, self._model_dir, SHARED_WEIGHTS_DIR)
+
+    def get_input_resolution(self, model_type: str) -> int:
+        """获取指定模型类型的图像输入分辨率，可在模型加载前使用"""
+        model_key = self.normalize_model_type(model_type)
+        return _MODEL_INFO[self._model_configs[model_key]]["input_resolution"]
+
+    def get_preprocess(self, model_type: str) -> Compose:
+        """获取指定模型类型的图像预处理器，可在模型加载前使用"""
+        model_key = self.normalize_model_type(model_type)
+        if model_key not in self._preprocess_cache:
+            self._preprocess_cache[model_key] = image_transform(self.get_input_resolution(model_key))
+        return self._preprocess_cache[model_key]
+
     @classmethod
     def tokenize(cls, texts: List[str]):
         """文本标记化"""
@@ -125,18 +587,26 @@ class ChineseCLIP:
         return tokenize(texts)
 
     @property
-    def model(self):
-        """获取当前加载的模型"""
-        if self._model is None:
+    def model_type(self) -> str:
+        """获取默认的模型类型"""
+        return self._model_type
+
+    def _default_entry(self) -> LoadedModel:
+        """获取默认模型条目"""
+        entry = self._models.get(self._model_type)
+        if entry is None:
             raise RuntimeError("Chinese-CLIP 模型实例未初始化")
-        return self._model
+        return entry
+
+    @property
+    def model(self):
+        """获取默认模型"""
+        return self._default_entry().model
 
     @property
     def preprocess(self):
-        """获取当前模型的预处理器"""
-        if self._preprocess is None:
-            raise RuntimeError("Chinese-CLIP 模型实例未初始化")
-        return self._preprocess
+        """获取默认模型的预处理器"""
+        return self._default_entry().preprocess
 
 
 @lru_cache()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 14:02
+@Author : YangFei
+@File   : compiled.py
+@Desc   : TorchScript 追踪的编码器，按批大小分桶并缓存到磁盘
+"""
+import os
+import time
+import logging
+from typing import Dict, List
+
+import torch
+from torch import nn
+
+from cn_clip.clip import tokenize
+
+logger = logging.getLogger(__name__)
+
+COMPILE_OFF = "off"
+COMPILE_TRACE = "trace"
+
+
+class _Encoders(nn.Module):
+    """ 文本、图像编码器包装，两种模态追踪到同一个模块上，权重只保存一份 """
+
+    def __init__(self, model: nn.Module):
+        super().__init__()
+        self.model = model
+
+    def encode_text(self, text_tokens: torch.Tensor) -> torch.Tensor:
+        return self.model.encode_text(text_tokens)
+
+    def encode_image(self, images: torch.Tensor) -> torch.Tensor:
+        return self.model.encode_image(images)
+
+
+def parse_buckets(value: str) -> List[int]:
+    """ 解析批大小分桶配置，如 "1,2,4,8" """
+    buckets = sorted({int(part) for part in value.split(",") if part.strip()})
+    if not buckets or buckets[0] < 1:
+        raise ValueError(f"批大小分桶配置无效: {value}")
+    return buckets
+
+
+class CompiledEncoders:
+    """ 按批大小分桶追踪的文本、图像编码器
+
+    两种模态追踪到同一个 TorchScript 模块上，每个批大小分桶是其中一个固定形状的方法（text_b{n}、image_b{n}），
+    全部方法共享同一份权重。推理时把批次补齐到不小于实际大小的最小分桶，超过最大分桶的批次按最大分桶切块执行。
+    追踪结果按模型、预训练权重的标识、精度与 torch 版本缓存到磁盘，之后的启动直接加载，无需重新追踪；
+    权重文件更新后标识变化，会重新追踪，不会加载到旧权重的追踪结果。
+
+    从磁盘加载的模块持有独立的权重副本，调用方应释放原模型的权重；load_cached 为 False 时总是对传入的模型
+    重新追踪，追踪得到的模块与原模型共享权重（如 mmap 映射的共享权重），不产生副本。
+    """
+
+    def __init__(self, model: nn.Module, model_key: str, precision: str, input_resolution: int,
+                 buckets: List[int], cache_dir: str, device: str, weights_id: str = "", load_cached: bool = True):
+        self._buckets = buckets
+        self._device = device
+
+        os.makedirs(cache_dir, exist_ok=True)
+        bucket_tag = "-".join(str(b) for b in buckets)
+        path = os.path.join(cache_dir, f"{model_key}-{weights_id or 'unknown'}-{precision}"
+                                       f"-torch{torch.__version__}-b{bucket_tag}.pt")
+
+        start = time.perf_counter()
+        examples = {}
+        for bucket in buckets:
+            examples[f"text_b{bucket}"] = tokenize(["预热"] * bucket).to(device)
+            examples[f"image_b{bucket}"] = torch.zeros(bucket, 3, input_resolution, input_resolution, device=device)
+        self._module, self.from_disk = self._load_or_trace(path, _Encoders(model).eval(), examples, load_cached)
+
+        logger.info(f"⚙️ 模型 {model_key} 的编码器已就绪，分桶 {buckets}，"
+                    f"{'从磁盘缓存加载' if self.from_disk else '重新追踪'}，耗时 {time.perf_counter() - start:.1f}s")
+
+    def _load_or_trace(self, path: str, module: _Encoders, examples: Dict[str, torch.Tensor], load_cached: bool):
+        """ 优先从磁盘加载追踪结果，不存在或加载失败时重新追踪并保存
+        :return: (追踪模块, 是否从磁盘加载)
+        """
+        if load_cached and os.path.exists(path):
+            try:
+                return torch.jit.load(path, map_location=self._device), True
+            except Exception as e:
+                logger.warning(f"加载追踪缓存 {path} 失败，重新追踪: {e}")
+
+        # 每个分桶追踪成同一个模块上的一个方法，共享权重
+        for method in examples:
+            setattr(module, method, module.encode_text if method.startswith("text_") else module.encode_image)
+        with torch.no_grad():
+            traced = torch.jit.trace_module(module, examples, check_trace=False)
+
+        if load_cached:
+            # 先写临时文件再重命名，避免多个工作进程同时写入时读到不完整的文件
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            torch.jit.save(traced, tmp_path)
+            os.replace(tmp_path, path)
+        return traced, False
+
+    @property
+    def module(self) -> torch.jit.ScriptModule:
+        """ 追踪得到的模块 """
+        return self._module
+
+    @property
+    def buckets(self) -> List[int]:
+        """ 批大小分桶 """
+        return list(self._buckets)
+
+    def _run(self, modality: str, inputs: torch.Tensor) -> torch.Tensor:
+        """ 按分桶补齐后执行，再截取有效的行 """
+        max_bucket = self._buckets[-1]
+        outputs = []
+        for start in range(0, inputs.shape[0], max_bucket):
+            chunk = inputs[start:start + max_bucket]
+            size = chunk.shape[0]
+            bucket = next(b for b in self._buckets if b >= size)
+            if bucket > size:
+                # 补齐的行全部为 0，结果会被丢弃
+                padding = chunk.new_zeros((bucket - size, *chunk.shape[1:]))
+                chunk = torch.cat([chunk, padding], dim=0)
+            outputs.append(getattr(self._module, f"{modality}_b{bucket}")(chunk)[:size])
+        return outputs[0] if len(outputs) == 1 else torch.cat(outputs, dim=0)
+
+    def encode_text(self, text_tokens: torch.Tensor) -> torch.Tensor:
+        """ 编码文本 token """
+        return self._run("text", text_tokens)
+
+    def encode_image(self, images: torch.Tensor) -> torch.Tensor:
+        """ 编码预处理后的图像 """
+        return self._run("image", images)
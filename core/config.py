@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 09:12
+@Author : YangFei
+@File   : config.py
+@Desc   : 服务运行配置，统一从环境变量读取，便于容器部署时调整
+"""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    """ 读取整型环境变量，未设置或为空时返回默认值 """
+    value = os.getenv(name, "").strip()
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """ 读取浮点型环境变量，未设置或为空时返回默认值 """
+    value = os.getenv(name, "").strip()
+    return float(value) if value else default
+
+
+def _env_str(name: str, default: str) -> str:
+    """ 读取字符串环境变量，未设置或为空时返回默认值 """
+    value = os.getenv(name, "").strip()
+    return value or default
+
+
+# 微批调度：单次合并推理的最大条目数（文本条数或图像张数）
+BATCH_MAX_SIZE = _env_int("CLIP_BATCH_MAX_SIZE", 32)
+
+# 微批调度：首个请求入队后，最多等待多少毫秒再强制下发
+BATCH_MAX_WAIT_MS = _env_float("CLIP_BATCH_MAX_WAIT_MS", 5.0)
+
+# 微批调度：单个队列允许积压的最大条目数，超过后直接返回 429
+BATCH_MAX_QUEUE_SIZE = _env_int("CLIP_BATCH_MAX_QUEUE_SIZE", 512)
+
+# 推理线程池：同时执行前向推理的线程数（每个线程内部仍由 torch 做算子级并行）
+INFER_WORKERS = _env_int("CLIP_INFER_WORKERS", 1)
+
+# 推理线程池：允许排队等待的最大任务数，超过后直接返回 429
+INFER_MAX_PENDING = _env_int("CLIP_INFER_MAX_PENDING", 64)
+
+# 预处理线程池：并行解码、预处理图像的线程数（PIL 解码时会释放 GIL）
+PREPROCESS_WORKERS = _env_int("CLIP_PREPROCESS_WORKERS", min(4, os.cpu_count() or 1))
+
+# 预处理线程池：允许排队等待的最大任务数，超过后直接返回 429
+PREPROCESS_MAX_PENDING = _env_int("CLIP_PREPROCESS_MAX_PENDING", 256)
+
+# 推理：单次前向推理的最大批大小，更大的批次会被切分成多块依次执行
+INFER_MAX_BATCH_SIZE = _env_int("CLIP_INFER_MAX_BATCH_SIZE", 32)
+
+# 批量图像接口：单次请求允许上传的最大图像数
+MAX_IMAGES_PER_REQUEST = _env_int("CLIP_MAX_IMAGES_PER_REQUEST", 256)
+
+# 模型常驻：多个模型类型同时常驻内存时的总内存预算（MB），超出后按 LRU 淘汰未使用的模型，0 表示不限制
+MODEL_MEMORY_BUDGET_MB = _env_int("CLIP_MODEL_MEMORY_BUDGET_MB", 4096)
+
+# 向量缓存：进程内 LRU 缓存的最大条目数，0 表示关闭进程内缓存
+CACHE_MAX_ENTRIES = _env_int("CLIP_CACHE_MAX_ENTRIES", 20000)
+
+# 向量缓存：缓存条目的有效期（秒），0 表示永不过期
+CACHE_TTL_SECONDS = _env_int("CLIP_CACHE_TTL_SECONDS", 86400)
+
+# 向量缓存：磁盘缓存（sqlite）文件路径，为空表示不启用；多个 gunicorn 工作进程可共享同一个文件
+CACHE_DISK_PATH = _env_str("CLIP_CACHE_DISK_PATH", "")
+
+# 向量缓存：磁盘缓存的最大条目数，超出时按写入时间淘汰最早的条目，0 表示不限制
+CACHE_DISK_MAX_ENTRIES = _env_int("CLIP_CACHE_DISK_MAX_ENTRIES", 1000000)
+
+# 推理精度：默认精度 fp32 / bf16 / int8，可按模型类型单独指定，如 "fp32,large=int8,huge=int8"
+MODEL_PRECISION = _env_str("CLIP_MODEL_PRECISION", "fp32")
+
+# 编译执行：off 关闭，trace 使用 TorchScript 按批大小分桶追踪编码器
+COMPILE_MODE = _env_str("CLIP_COMPILE_MODE", "off")
+
+# 编译执行：追踪的批大小分桶，推理时补齐到不小于实际批大小的最小分桶
+COMPILE_BATCH_BUCKETS = _env_str("CLIP_COMPILE_BATCH_BUCKETS", "1,2,4,8,16,32")
+
+# 编译执行：追踪结果的磁盘缓存目录，按模型、精度与 torch 版本区分
+COMPILE_CACHE_DIR = _env_str("CLIP_COMPILE_CACHE_DIR", "models/compiled")
+
+# 启动预热：对默认模型执行若干次合成批次推理，完成后才报告就绪
+WARMUP_ENABLED = _env_int("CLIP_WARMUP", 1) > 0
+
+# 后台启动：推理依赖的导入与默认模型的加载、预热在后台任务中执行，工作进程立即接受连接；
+# 关闭后在 lifespan 中等待加载完成再对外提供服务
+BACKGROUND_LOAD = _env_int("CLIP_BACKGROUND_LOAD", 1) > 0
+
+# 向量集合：快照与操作日志的保存目录，全部工作进程共享，工作进程回收或重启后重新加载；为空时集合只保存在进程内存中
+COLLECTION_DIR = _env_str("CLIP_COLLECTION_DIR", "models/collections")
+
+# 向量集合：IVF 近似索引开始训练的最小向量数，少于该数量时始终使用暴力检索
+IVF_MIN_TRAIN_SIZE = _env_int("CLIP_IVF_MIN_TRAIN_SIZE", 20000)
+
+# 向量集合：IVF 检索时默认探查的聚类数
+IVF_DEFAULT_NPROBE = _env_int("CLIP_IVF_NPROBE", 8)
+
+# 向量集合：检索接口允许返回的最大结果数
+SEARCH_MAX_TOP_K = _env_int("CLIP_SEARCH_MAX_TOP_K", 1000)
+
+# 零样本分类：单个标签集允许的最大标签数
+CLASSIFY_MAX_LABELS = _env_int("CLIP_CLASSIFY_MAX_LABELS", 1000)
+
+# 零样本分类：标签集与标签向量矩阵的保存目录，全部工作进程共享
+LABEL_SET_DIR = _env_str("CLIP_LABEL_SET_DIR", "models/label_sets")
+
+# 零样本分类：请求内联标签的向量矩阵缓存数（按模型与标签内容区分，LRU 淘汰）
+CLASSIFY_INLINE_CACHE_SIZE = _env_int("CLIP_CLASSIFY_INLINE_CACHE_SIZE", 128)
+
+# 相似度矩阵：单次请求允许的最大文本数与集合图像 id 数（上传的图像数受 CLIP_MAX_IMAGES_PER_REQUEST 限制）
+SIMILARITY_MAX_ITEMS = _env_int("CLIP_SIMILARITY_MAX_ITEMS", 1024)
+
+# 近重复检测：图像向量的余弦相似度不低于该值时判定为重复
+DEDUP_THRESHOLD = _env_float("CLIP_DEDUP_THRESHOLD", 0.95)
+
+# 近重复检测：64 位感知哈希的最少分段数，任意一段相同的图像进入同一个候选桶；
+# 实际分段数不少于 max_distance + 1，保证汉明距离不超过 max_distance 的图像对不会漏掉
+DEDUP_HASH_BANDS = _env_int("CLIP_DEDUP_HASH_BANDS", 4)
+
+# 近重复检测：候选对的感知哈希汉明距离上限（不超过 32），超过时不再比较图像向量
+DEDUP_MAX_HAMMING = _env_int("CLIP_DEDUP_MAX_HAMMING", 12)
+
+# 近重复检测：成员数不超过该值的桶内两两全部比较，候选对不会漏掉
+DEDUP_FULL_COMPARE_SIZE = _env_int("CLIP_DEDUP_FULL_COMPARE_SIZE", 1024)
+
+# 近重复检测：成员数超过 CLIP_DEDUP_FULL_COMPARE_SIZE 的桶（如大量纯色图像）内，每个成员最多与排序后相邻的多少个成员比较，
+# 限制候选对数量；截断的成员数在响应的 stats.truncated_members 中返回
+DEDUP_MAX_BUCKET_SPAN = _env_int("CLIP_DEDUP_MAX_BUCKET_SPAN", 256)
+
+# 文本分词：token id 的 LRU 缓存条目数，0 表示关闭
+TOKEN_CACHE_SIZE = _env_int("CLIP_TOKEN_CACHE_SIZE", 50000)
+
+# 文本分词：按长度分桶时补齐长度的步长，同一批次中补齐到相同长度的文本合并成一次前向推理
+TEXT_LENGTH_BUCKET_STEP = _env_int("CLIP_TEXT_LENGTH_BUCKET_STEP", 8)
+
+# 流式批量向量化：每个批次的记录数
+STREAM_BATCH_SIZE = _env_int("CLIP_STREAM_BATCH_SIZE", 64)
+
+# 流式批量向量化：同时处理中的批次数，超过后暂停读取请求体，保证内存占用有上限
+STREAM_MAX_INFLIGHT_BATCHES = _env_int("CLIP_STREAM_MAX_INFLIGHT_BATCHES", 4)
+
+# 流式批量向量化：单行记录的最大字节数（base64 图像也在一行内）
+STREAM_MAX_LINE_BYTES = _env_int("CLIP_STREAM_MAX_LINE_BYTES", 16 * 1024 * 1024)
+
+# 流式批量向量化：是否允许服务端下载 image_url 指向的图像，默认关闭以避免 SSRF
+STREAM_FETCH_URLS = _env_int("CLIP_STREAM_FETCH_URLS", 0) > 0
+
+# 流式批量向量化：下载图像的超时时间（秒）
+STREAM_FETCH_TIMEOUT = _env_float("CLIP_STREAM_FETCH_TIMEOUT", 10.0)
+
+# 图像解码：允许的最大像素数（宽 x 高），超过的图像在解码前拒绝，防止解压炸弹占满内存
+IMAGE_MAX_PIXELS = _env_int("CLIP_IMAGE_MAX_PIXELS", 50_000_000)
+
+# 图像解码：JPEG 是否使用 draft 模式按接近模型输入分辨率的比例直接缩小解码
+IMAGE_JPEG_DRAFT = _env_int("CLIP_IMAGE_JPEG_DRAFT", 1) > 0
+
+# 图像上传：单个图像文件的最大字节数，multipart 请求中任一文件超过时在接收过程中中止并返回 413
+IMAGE_MAX_UPLOAD_BYTES = _env_int("CLIP_IMAGE_MAX_UPLOAD_BYTES", 20 * 1024 * 1024)
+
+# 图像上传：单个 multipart 请求体的最大字节数，按 Content-Length 在解析请求体之前拒绝
+UPLOAD_MAX_REQUEST_BYTES = _env_int("CLIP_UPLOAD_MAX_REQUEST_BYTES", 256 * 1024 * 1024)
+
+# 图像解码：单个工作进程同时解码中的图像占用的内存上限（MB，按解码后的像素缓冲区估算）
+IMAGE_DECODE_MEMORY_MB = _env_int("CLIP_IMAGE_DECODE_MEMORY_MB", 512)
+
+# 图像解码：单个工作进程同时解码的最大图像数
+IMAGE_MAX_CONCURRENT_DECODES = _env_int("CLIP_IMAGE_MAX_CONCURRENT_DECODES", PREPROCESS_WORKERS)
+
+# 图像解码：等待解码内存或并发名额的最长时间（秒），超时返回 429
+IMAGE_DECODE_WAIT_SECONDS = _env_float("CLIP_IMAGE_DECODE_WAIT_SECONDS", 5.0)
+
+# 默认模型：应用启动时加载并预热的模型类型
+DEFAULT_MODEL_TYPE = _env_str("CLIP_DEFAULT_MODEL", "mini")
+
+# 共享权重：CPU 推理时把权重导出为文件并以 mmap 只读映射，多个工作进程通过页缓存共享同一份物理内存
+SHARED_WEIGHTS = _env_int("CLIP_SHARED_WEIGHTS", 1) > 0
+
+# 共享权重：导出的权重文件目录
+SHARED_WEIGHTS_DIR = _env_str("CLIP_SHARED_WEIGHTS_DIR", "models/shared")
+
+# 监控指标：多进程汇总目录，各工作进程定期把指标快照写入该目录，/metrics 汇总全部进程；为空表示只输出当前进程
+METRICS_DIR = _env_str("CLIP_METRICS_DIR", "")
+
+# 监控指标：工作进程写入指标快照的间隔（秒）
+METRICS_FLUSH_INTERVAL = _env_float("CLIP_METRICS_FLUSH_INTERVAL", 5.0)
+
+# CPU 线程：每个工作进程的推理（intra-op）线程数，0 表示按物理核数平均分配给各工作进程
+THREADS_PER_WORKER = _env_int("CLIP_THREADS_PER_WORKER", 0)
+
+# CPU 线程：每个工作进程的 inter-op 线程数
+INTEROP_THREADS = _env_int("CLIP_INTEROP_THREADS", 1)
+
+# CPU 线程：是否把各工作进程绑定到分配给它的物理核上
+PIN_WORKERS = _env_int("CLIP_PIN_WORKERS", 0) > 0
+
+# CPU 线程：gunicorn 启动时在默认模型上实测几种 工作进程数 x 线程数 的组合，选出吞吐最高的一种
+AUTOTUNE = _env_int("CLIP_AUTOTUNE", 0) > 0
+
+# CPU 线程：自动调优结果的缓存文件，CPU 与模型不变时直接复用
+AUTOTUNE_PATH = _env_str("CLIP_AUTOTUNE_PATH", "models/autotune.json")
+
+# CPU 线程：自动调优时每种组合的测量时长（秒）
+AUTOTUNE_SECONDS = _env_float("CLIP_AUTOTUNE_SECONDS", 3.0)
+
+# CPU 线程：自动调优时测量进程加载模型并全部就绪的最长等待时间（秒），超时的组合跳过
+AUTOTUNE_TIMEOUT = _env_float("CLIP_AUTOTUNE_TIMEOUT", 300.0)
+
+# 优先级：交互请求与批量请求同时排队时，批量请求最多占用的批次比例
+BULK_SHARE = _env_float("CLIP_BULK_SHARE", 0.2)
+
+# 优先级：同时执行的批量推理批次数（全部模型类型合计）
+BULK_MAX_INFLIGHT = _env_int("CLIP_BULK_MAX_INFLIGHT", 1)
+
+# 优先级：单个批量队列允许积压的最大条目数
+BULK_MAX_QUEUE_SIZE = _env_int("CLIP_BULK_MAX_QUEUE_SIZE", 256)
+
+# 优先级：批量请求在队列中的最长等待时间（毫秒），预计或实际超过时直接拒绝，0 表示不限制
+BULK_DEADLINE_MS = _env_float("CLIP_BULK_DEADLINE_MS", 30000)
+
+# 优先级：交互请求在队列中的最长等待时间（毫秒），0 表示不限制
+INTERACTIVE_DEADLINE_MS = _env_float("CLIP_INTERACTIVE_DEADLINE_MS", 0)
+
+# 优先级：批量请求最多占用线程池排队名额的比例，其余名额留给交互请求
+BULK_EXECUTOR_SHARE = _env_float("CLIP_BULK_EXECUTOR_SHARE", 0.5)
+
+# 向量降维：按模型类型拟合的投影矩阵（PCA 或随机正交）保存目录，各工作进程共享
+PROJECTION_DIR = _env_str("CLIP_PROJECTION_DIR", "models/projections")
+
+# 向量降维：评估召回率时留出集的最大条目数（留出集内两两计算相似度）
+PROJECTION_EVAL_MAX_SIZE = _env_int("CLIP_PROJECTION_EVAL_MAX_SIZE", 2000)
+
+# 模型热切换：新实例切换后等待进行中的请求释放旧实例的最长时间（秒），超时后旧实例在最后一个请求完成时释放
+SWAP_DRAIN_TIMEOUT = _env_float("CLIP_SWAP_DRAIN_TIMEOUT", 60.0)
+
+# 模型热切换：切换请求与各工作进程执行状态的目录，全部工作进程共享
+SWAP_DIR = _env_str("CLIP_SWAP_DIR", "models/swaps")
+
+# 模型热切换：工作进程轮询切换请求的间隔（秒）
+SWAP_POLL_INTERVAL = _env_float("CLIP_SWAP_POLL_INTERVAL", 2.0)
+
+# 管理接口：访问令牌，请求需要携带相同的 X-Admin-Token 请求头；为空时不启用管理接口（返回 404）
+ADMIN_TOKEN = _env_str("CLIP_ADMIN_TOKEN", "")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 21:20
+@Author : YangFei
+@File   : cpu_topology.py
+@Desc   : CPU 拓扑感知的线程配置：按物理核把 CPU 分给各工作进程，设置线程数并可选绑核
+"""
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from core.config import INTEROP_THREADS, PIN_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# 推理相关库读取的线程数环境变量，设置后子进程与延迟初始化的线程池也使用相同的线程数
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def available_cpus() -> List[int]:
+    """ 当前进程允许使用的逻辑 CPU（考虑容器的 cpuset 限制） """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_cores(cpus: Optional[List[int]] = None) -> List[List[int]]:
+    """ 把逻辑 CPU 按物理核分组，同一物理核的超线程放在一组，按 (插槽, 核编号) 排序
+
+    读取不到拓扑信息（非 Linux）时每个逻辑 CPU 单独一组。
+    """
+    cpus = cpus if cpus is not None else available_cpus()
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for cpu in cpus:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{topology}/physical_package_id") as f:
+                package = int(f.read())
+            with open(f"{topology}/core_id") as f:
+                core = int(f.read())
+        except (OSError, ValueError):
+            package, core = 0, cpu
+        groups.setdefault((package, core), []).append(cpu)
+    return [sorted(groups[key]) for key in sorted(groups)]
+
+
+def split_cores(cores: List[List[int]], workers: int) -> List[List[List[int]]]:
+    """ 把物理核切分给各工作进程，每个进程分到连续的一段物理核（同一插槽内的核相邻，尽量不跨 NUMA 节点）
+
+    工作进程数多于物理核数时，多个进程共用同一个物理核。
+    :return: 每个工作进程分到的物理核列表
+    """
+    workers = max(1, workers)
+    if workers >= len(cores):
+        return [[cores[i % len(cores)]] for i in range(workers)]
+
+    per_worker, remainder = divmod(len(cores), workers)
+    plan, start = [], 0
+    for i in range(workers):
+        count = per_worker + (1 if i < remainder else 0)
+        plan.append(cores[start:start + count])
+        start += count
+    return plan
+
+
+def apply_thread_settings(threads: int, interop_threads: int = INTEROP_THREADS, cpus: Optional[List[int]] = None):
+    """ 设置当前进程的推理线程数，并可选绑定到指定的逻辑 CPU
+
+    需要在 fork 之后、第一次推理之前调用；inter-op 线程数只能在并行任务开始前设置一次。
+    """
+    import torch
+
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(max(1, interop_threads))
+    except RuntimeError as e:
+        logger.warning(f"inter-op 线程数设置失败（并行任务已经开始）: {e}")
+
+
+def configure_worker(slot: int, workers: int, threads: int = 0, pin: bool = PIN_WORKERS) -> str:
+    """ 按工作进程的编号分配物理核并设置线程数
+
+    :param slot: 工作进程编号，0 ~ workers-1
+    :param workers: 工作进程总数
+    :param threads: 每个进程的推理线程数，0 表示使用分到的物理核数
+    :param pin: 是否把进程绑定到分到的 CPU 上
+    :return: 配置说明，用于日志
+    """
+    plan = split_cores(physical_cores(), workers)
+    assigned = plan[slot % len(plan)]
+    threads = threads or len(assigned)
+    cpus = sorted(cpu for core in assigned for cpu in core)
+
+    apply_thread_settings(threads, cpus=cpus if pin else None)
+    pinned = f"，绑定 CPU {cpus}" if pin else ""
+    return f"工作进程 {slot}: {threads} 个推理线程，{INTEROP_THREADS} 个 inter-op 线程{pinned}"
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 00:50
+@Author : YangFei
+@File   : dedup.py
+@Desc   : 近重复图像检测：感知哈希分桶筛选候选对，只在候选对之间比较 CLIP 向量
+
+64 位感知哈希按位切成若干段（band），任意一段完全相同的两张图像成为候选对，再按汉明距离过滤。
+采用多索引哈希：分段数取 max(配置的分段数, max_distance + 1)，距离不超过 max_distance 的两个哈希最多有
+max_distance 段不同，必然至少有一段相同（抽屉原理），候选对不会漏掉。分段数不能整除 64 时各段宽度相差 1 位。
+
+每一段按 (段值, 哈希) 排序后，同一个桶的成员相邻；按偏移量 k = 1, 2, ... 分块比较相距 k 的成员，
+每块是一次大小不超过 图像数 x 块大小 的向量化运算，不会在 Python 中逐对循环。成员数不超过 full_compare_size 的桶内两两全部比较，
+候选对不会漏掉；更大的桶（如大量纯色图像）每个成员只与排序后相邻的 max_bucket_span 个成员比较，候选对的数量与图像数保持线性关系，
+此时可能漏掉候选对，被截断的成员数随结果返回。
+"""
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import DEDUP_HASH_BANDS, DEDUP_MAX_BUCKET_SPAN, DEDUP_FULL_COMPARE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 感知哈希的位数
+HASH_BITS = 64
+
+# 候选对汉明距离的上限：超过一半位数的两个哈希已经不相关，分段也会退化为 1 位、几乎全部成为候选对
+MAX_DISTANCE_LIMIT = HASH_BITS // 2
+
+# 桶内比较时每次向量化处理的偏移量个数
+_OFFSET_BLOCK = 32
+
+
+def hamming(a: int, b: int) -> int:
+    """ 两个哈希的汉明距离 """
+    return (a ^ b).bit_count()
+
+
+def band_layout(bands: int) -> List[Tuple[int, int]]:
+    """ 把哈希切成 bands 段，返回每段的 [(起始位, 位宽), ...]，位宽尽量均匀 """
+    width, extra = divmod(HASH_BITS, bands)
+    layout, shift = [], 0
+    for band in range(bands):
+        size = width + (band < extra)
+        layout.append((shift, size))
+        shift += size
+    return layout
+
+
+def band_keys(value: int, bands: int = DEDUP_HASH_BANDS) -> List[Tuple[int, int]]:
+    """ 把哈希切成 bands 段，返回 [(段号, 段值), ...] """
+    return [(band, (value >> shift) & ((1 << width) - 1)) for band, (shift, width) in enumerate(band_layout(bands))]
+
+
+def validate_bands(bands: int) -> int:
+    """ 分段数必须在 1 ~ 哈希位数之间 """
+    if not 0 < bands <= HASH_BITS:
+        raise ValueError(f"感知哈希的分段数必须在 1 ~ {HASH_BITS} 之间，当前为 {bands}")
+    return bands
+
+
+def effective_bands(max_distance: int, bands: int = DEDUP_HASH_BANDS) -> int:
+    """ 实际使用的分段数：不少于 max_distance + 1，保证距离不超过 max_distance 的图像对不会漏掉 """
+    if not 0 <= max_distance <= MAX_DISTANCE_LIMIT:
+        raise ValueError(f"max_distance 必须在 0 ~ {MAX_DISTANCE_LIMIT} 之间")
+    return max(validate_bands(bands), max_distance + 1)
+
+
+def candidate_pairs(hashes: Sequence[Optional[int]], max_distance: int, bands: int = DEDUP_HASH_BANDS,
+                    max_bucket_span: int = DEDUP_MAX_BUCKET_SPAN, full_compare_size: int = DEDUP_FULL_COMPARE_SIZE
+                    ) -> Tuple[List[Tuple[int, int]], int]:
+    """ 按哈希分段分桶，得到汉明距离不超过 max_distance 的候选对；哈希为 None 的图像跳过
+
+    :param full_compare_size: 成员数不超过该值的桶内两两全部比较，更大的桶只与相邻的 max_bucket_span 个成员比较
+    :return: (候选对 [(i, j), ...]，i < j，按下标排序；超大桶中比较被截断的成员数，按段累计，为 0 时候选对没有遗漏)
+    """
+    index = np.asarray([i for i, value in enumerate(hashes) if value is not None], dtype=np.int64)
+    if len(index) < 2:
+        return [], 0
+    values = np.asarray([hashes[i] for i in index], dtype=np.uint64)
+    layout = band_layout(effective_bands(max_distance, bands))
+    masks = [np.uint64(((1 << width) - 1) << shift) for shift, width in layout]
+
+    found, truncated = [], 0
+    for band in range(len(layout)):
+        order = np.lexsort((values, values & masks[band]))
+        sorted_keys = (values & masks[band])[order]
+        # 每个位置允许比较的最大偏移：不超过 full_compare_size 的桶为成员数减 1，更大的桶为 max_bucket_span
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        sizes = np.diff(np.r_[starts, len(sorted_keys)])
+        bucket_span = np.where(sizes <= full_compare_size, sizes - 1, min(max_bucket_span, full_compare_size))
+        # 超大桶中排序后第 span + 1 个相邻成员仍在桶内的成员，比较被截断
+        truncated += int(np.maximum(sizes - 1 - bucket_span, 0).sum())
+        span = np.repeat(bucket_span, sizes)
+        # active 为与后方第 k 个成员仍在同一个桶中的位置，k 增大时只会减少
+        active = np.flatnonzero(sorted_keys[1:] == sorted_keys[:-1])
+        k = 1
+        while len(active):
+            active = active[span[active] >= k]
+            # 一次比较 _OFFSET_BLOCK 个偏移量，矩阵大小不超过 图像数 x _OFFSET_BLOCK
+            offsets = np.arange(k, k + _OFFSET_BLOCK)
+            positions = active[:, np.newaxis] + offsets
+            same = (positions < len(sorted_keys)) & (offsets <= span[active][:, np.newaxis])
+            positions = np.minimum(positions, len(sorted_keys) - 1)
+            same &= sorted_keys[positions] == sorted_keys[active][:, np.newaxis]
+
+            left = order[np.broadcast_to(active[:, np.newaxis], positions.shape)[same]]
+            right = order[positions[same]]
+            diff = values[left] ^ values[right]
+            close = np.bitwise_count(diff) <= max_distance
+            left, right, diff = left[close], right[close], diff[close]
+            # 同一对只在第一个相同的段中产生
+            first = np.ones(len(diff), dtype=bool)
+            for mask in masks[:band]:
+                first &= (diff & mask) != 0
+            found.append(np.stack([np.minimum(left[first], right[first]),
+                                   np.maximum(left[first], right[first])], axis=1))
+
+            # 保留与后方第 k 个成员仍在同一个桶中的位置（桶内连续，偏移更小的成员一定也在桶中）
+            k += _OFFSET_BLOCK
+            ahead = np.minimum(active + k, len(sorted_keys) - 1)
+            active = active[(active + k < len(sorted_keys)) & (sorted_keys[ahead] == sorted_keys[active])]
+
+    if truncated:
+        logger.warning(f"感知哈希分桶：{truncated} 个成员所在的桶超过 {full_compare_size} 个成员，"
+                       f"只与相邻的 {max_bucket_span} 个成员比较，可能漏掉候选对")
+    pairs = np.concatenate(found) if found else np.empty((0, 2), dtype=np.int64)
+    pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    return [(i, j) for i, j in index[pairs].tolist()], truncated
+
+
+def group_pairs(size: int, pairs: Sequence[Tuple[int, int]]) -> List[List[int]]:
+    """ 按重复关系做并查集合并，返回包含两张及以上图像的分组，组内与组间都按下标排序 """
+    parent = list(range(size))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            # 以较小的下标为根，组内第一张图像作为代表
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i in range(size):
+        groups[find(i)].append(i)
+    return sorted((members for members in groups.values() if len(members) > 1), key=lambda members: members[0])
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 11:02
+@Author : YangFei
+@File   : embedding_cache.py
+@Desc   : 基于内容寻址的向量缓存，进程内 LRU + 可选的 sqlite 磁盘缓存
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from core.config import CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS, CACHE_DISK_PATH, CACHE_DISK_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+
+class _SqliteTier:
+    """ sqlite 磁盘缓存，WAL 模式下可被多个工作进程同时读写，进程重启后仍然有效
+
+    启动时以及每写入 _PRUNE_INTERVAL 条后清理一次：删除过期的条目，条目数超过 max_entries 时按写入时间删除最早的条目。
+    """
+
+    # 单条 SQL 中绑定参数的数量上限（sqlite 旧版本为 999）
+    _MAX_VARIABLES = 500
+    # 每写入多少条清理一次
+    _PRUNE_INTERVAL = 1000
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int = CACHE_DISK_MAX_ENTRIES):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._ttl = ttl_seconds
+        self._max_entries = max(0, max_entries)
+        # 上次清理之后写入的条目数
+        self._written = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+        self._conn.commit()
+        self.prune()
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """ 批量读取，不存在或已过期的返回 None """
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), self._MAX_VARIABLES):
+                chunk = keys[start:start + self._MAX_VARIABLES]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(self._conn.execute(
+                    f"SELECT key, vector, created_at FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+
+        now = time.time()
+        found = {
+            key: np.frombuffer(vector, dtype="<f4")
+            for key, vector, created_at in rows
+            if not self._ttl or now - created_at <= self._ttl
+        }
+        return [found.get(key) for key in keys]
+
+    def put_many(self, items: List[Tuple[str, np.ndarray]]):
+        """ 批量写入 """
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype="<f4").tobytes(), now) for key, vector in items]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            self._written += len(rows)
+            if self._written < self._PRUNE_INTERVAL:
+                return
+        self.prune()
+
+    def prune(self) -> int:
+        """ 删除过期的条目，以及超出 max_entries 的最早写入的条目，返回删除的条目数 """
+        deleted = 0
+        with self._lock:
+            self._written = 0
+            if self._ttl:
+                deleted += self._conn.execute("DELETE FROM embeddings WHERE created_at < ?",
+                                              (time.time() - self._ttl,)).rowcount
+            if self._max_entries:
+                excess = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self._max_entries
+                if excess > 0:
+                    deleted += self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY created_at LIMIT ?)", (excess,)).rowcount
+            self._conn.commit()
+        if deleted:
+            logger.info(f"向量磁盘缓存清理了 {deleted} 条过期或超出容量的条目")
+        return deleted
+
+    def close(self):
+        """ 关闭连接 """
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """ 向量缓存
+
+    缓存键由命名空间（模型类型与推理精度）和内容哈希组成：文本取标准化后的文本，图像取原始字节，
+    因此同一张图片无论文件名如何都能命中缓存。
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: int = CACHE_TTL_SECONDS,
+                 disk_path: str = CACHE_DISK_PATH, disk_max_entries: int = CACHE_DISK_MAX_ENTRIES):
+        """ 初始化缓存
+        :param max_entries: 进程内缓存的最大条目数，0 表示关闭进程内缓存
+        :param ttl_seconds: 缓存有效期（秒），0 表示永不过期
+        :param disk_path: sqlite 磁盘缓存路径，为空表示不启用
+        :param disk_max_entries: 磁盘缓存的最大条目数，0 表示不限制
+        """
+        self._max_entries = max(0, max_entries)
+        self._ttl = max(0, ttl_seconds)
+        # key -> (写入时间, 向量)，末尾为最近使用
+        self._memory: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._disk_max_entries = max(0, disk_max_entries)
+        self._disk: Optional[_SqliteTier] = None
+        if disk_path:
+            try:
+                self._disk = _SqliteTier(disk_path, self._ttl, disk_max_entries)
+                logger.info(f"向量磁盘缓存已启用: {os.path.abspath(disk_path)}")
+            except sqlite3.Error as e:
+                logger.error(f"向量磁盘缓存初始化失败，仅使用进程内缓存: {e}")
+
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        """ 是否启用了任意一层缓存 """
+        return self._max_entries > 0 or self._disk is not None
+
+    @staticmethod
+    def text_key(namespace: str, text: str) -> str:
+        """ 生成文本缓存键，文本做 Unicode 标准化并去除首尾空白 """
+        normalized = unicodedata.normalize("NFC", text).strip()
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{namespace}:text:{digest}"
+
+    @staticmethod
+    def image_key(namespace: str, image_data) -> str:
+        """ 生成图像缓存键，基于原始图像字节；已校验的上传文件（core.image_decode.ImageFile）直接使用校验时计算的摘要 """
+        digest = image_data.digest if hasattr(image_data, "digest") else hashlib.sha256(image_data).hexdigest()
+        return f"{namespace}:image:{digest}"
+
+    async def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """ 批量查询缓存，未命中的位置为 None """
+        if not self.enabled:
+            return [None] * len(keys)
+
+        now = time.time()
+        results: List[Optional[np.ndarray]] = []
+        for key in keys:
+            cached = self._memory.get(key)
+            if cached is not None and self._ttl and now - cached[0] > self._ttl:
+                del self._memory[key]
+                cached = None
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+            results.append(cached[1] if cached is not None else None)
+
+        missing = [i for i, vector in enumerate(results) if vector is None]
+        if missing and self._disk is not None:
+            try:
+                # 磁盘读取在线程中执行，避免阻塞事件循环
+                disk_results = await asyncio.to_thread(self._disk.get_many, [keys[i] for i in missing])
+            except sqlite3.Error as e:
+                logger.warning(f"读取向量磁盘缓存失败: {e}")
+                disk_results = [None] * len(missing)
+
+            for i, vector in zip(missing, disk_results):
+                if vector is not None:
+                    results[i] = vector
+                    self._disk_hits += 1
+                    self._put_memory(keys[i], vector, now)
+
+        self._misses += sum(1 for vector in results if vector is None)
+        return results
+
+    async def put_many(self, keys: List[str], vectors: np.ndarray):
+        """ 批量写入缓存 """
+        if not self.enabled or not keys:
+            return
+
+        now = time.time()
+        for key, vector in zip(keys, vectors):
+            self._put_memory(key, vector, now)
+
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.put_many, list(zip(keys, vectors)))
+            except sqlite3.Error as e:
+                logger.warning(f"写入向量磁盘缓存失败: {e}")
+
+    def _put_memory(self, key: str, vector: np.ndarray, now: float):
+        """ 写入进程内缓存，超出容量时淘汰最久未使用的条目 """
+        if not self._max_entries:
+            return
+
+        # 复制一份，避免持有整个批次矩阵的引用
+        self._memory[key] = (now, np.array(vector, dtype=np.float32))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        """ 获取缓存命中统计 """
+        hits = self._memory_hits + self._disk_hits
+        total = hits + self._misses
+        return {
+            "memory_entries": len(self._memory),
+            "max_entries": self._max_entries,
+            "ttl_seconds": self._ttl,
+            "disk_enabled": self._disk is not None,
+            "disk_max_entries": self._disk_max_entries,
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "misses": self._misses,
+            "hit_rate": round(hits / total, 4) if total else 0,
+        }
+
+    def close(self):
+        """ 关闭磁盘缓存 """
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+
+@lru_cache()
+def get_embedding_cache() -> EmbeddingCache:
+    """ 获取向量缓存（进程内单例） """
+    return EmbeddingCache()
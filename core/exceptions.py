@@ -7,7 +7,7 @@
 @Desc   : 应用程序异常定义
 """
 
-from typing import Any
+from typing import Any, Optional
 
 
 class AppException(RuntimeError):
@@ -37,6 +37,16 @@ class BasRequestException(AppException):
         super().__init__(msg=msg, code=400, status_code=400)
 
 
+class ForbiddenException(AppException):
+    """ 无权访问异常类，继承自 AppException """
+
+    def __init__(self, msg: str = '无权访问该资源.'):
+        """ 初始化无权访问异常实例
+        :param msg: 错误消息，默认 '无权访问该资源.'
+        """
+        super().__init__(msg=msg, code=403, status_code=403)
+
+
 class NotFoundException(AppException):
     """ 资源未找到异常类，继承自 AppException """
 
@@ -60,11 +70,27 @@ class ValidationException(AppException):
 class TooManyRequestsException(AppException):
     """ 请求过多异常类，继承自 AppException """
 
-    def __init__(self, msg: str = '请求过多，请稍后重试.'):
+    def __init__(self, msg: str = '请求过多，请稍后重试.', retry_after: Optional[float] = None):
         """ 初始化请求过多异常实例
         :param msg: 错误消息，默认 '请求过多，请稍后重试.'
+        :param retry_after: 建议的重试等待时间（秒），通过 Retry-After 响应头返回
+        """
+        super().__init__(msg=msg, code=429, status_code=429,
+                         data={"retry_after": round(retry_after, 3)} if retry_after is not None else None)
+        self.retry_after = retry_after
+
+
+class ServiceUnavailableException(AppException):
+    """ 服务不可用异常类，继承自 AppException """
+
+    def __init__(self, msg: str = '服务暂不可用，请稍后重试.', retry_after: Optional[float] = None):
+        """ 初始化服务不可用异常实例
+        :param msg: 错误消息，默认 '服务暂不可用，请稍后重试.'
+        :param retry_after: 建议的重试等待时间（秒），通过 Retry-After 响应头返回
         """
-        super().__init__(msg=msg, code=429, status_code=429)
+        super().__init__(msg=msg, code=503, status_code=503,
+                         data={"retry_after": round(retry_after, 3)} if retry_after is not None else None)
+        self.retry_after = retry_after
 
 
 class InternalServerException(AppException):
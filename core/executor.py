@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 10:05
+@Author : YangFei
+@File   : executor.py
+@Desc   : 有界线程池，把阻塞的解码与推理移出 asyncio 事件循环
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable
+
+from core.config import (
+    INFER_WORKERS, INFER_MAX_PENDING, PREPROCESS_WORKERS, PREPROCESS_MAX_PENDING, BULK_EXECUTOR_SHARE
+)
+from core.exceptions import TooManyRequestsException
+from core.metrics import EXECUTOR_WAIT_SECONDS
+from core.priority import PRIORITY_BULK, current_priority
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedExecutor:
+    """ 有界线程池
+
+    事件循环只负责等待 future，阻塞的计算全部在线程池中执行；
+    当排队任务数达到上限时直接抛出 TooManyRequestsException，避免请求无限堆积；
+    批量请求只能占用一部分排队名额，其余名额留给交互请求。
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, bulk_share: float = BULK_EXECUTOR_SHARE):
+        """ 初始化线程池
+        :param name: 线程池名称，用于线程命名与日志
+        :param max_workers: 工作线程数
+        :param max_pending: 允许同时提交（执行中 + 排队中）的最大任务数
+        :param bulk_share: 批量请求最多占用的排队名额比例
+        """
+        self._name = name
+        self._max_workers = max(1, max_workers)
+        self._max_pending = max(1, max_pending)
+        self._bulk_max_pending = max(1, int(self._max_pending * min(1.0, max(0.0, bulk_share))))
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=name)
+        # 仅在事件循环线程中修改，无需加锁
+        self._pending = 0
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """ 在线程池中执行函数，并等待结果 """
+        max_pending = self._bulk_max_pending if current_priority() == PRIORITY_BULK else self._max_pending
+        if self._pending >= max_pending:
+            logger.warning(f"{self._name} 线程池队列已满({self._pending}/{max_pending})，拒绝新任务")
+            raise TooManyRequestsException("服务繁忙，请稍后重试.", retry_after=1.0)
+
+        submitted = time.perf_counter()
+
+        def call():
+            # 记录任务从提交到开始执行的排队时间
+            EXECUTOR_WAIT_SECONDS.observe(time.perf_counter() - submitted, executor=self._name)
+            return fn(*args, **kwargs)
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        """ 获取线程池状态 """
+        return {
+            "name": self._name,
+            "max_workers": self._max_workers,
+            "max_pending": self._max_pending,
+            "bulk_max_pending": self._bulk_max_pending,
+            "pending": self._pending,
+        }
+
+    def shutdown(self):
+        """ 关闭线程池，等待正在执行的任务结束 """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        logger.info(f"{self._name} 线程池已关闭")
+
+
+@lru_cache()
+def get_inference_executor() -> BoundedExecutor:
+    """ 获取推理线程池（进程内单例） """
+    return BoundedExecutor("clip-infer", INFER_WORKERS, INFER_MAX_PENDING)
+
+
+@lru_cache()
+def get_preprocess_executor() -> BoundedExecutor:
+    """ 获取预处理线程池（进程内单例） """
+    return BoundedExecutor("clip-preprocess", PREPROCESS_WORKERS, PREPROCESS_MAX_PENDING)
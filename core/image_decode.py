@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 18:40
+@Author : YangFei
+@File   : image_decode.py
+@Desc   : 图像快速解码：上传文件校验、JPEG draft 缩小解码、像素数上限、解码内存预算与解码耗时统计
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import TYPE_CHECKING, BinaryIO, Dict, Optional, Tuple, Union
+
+from PIL import Image, UnidentifiedImageError
+
+from core.config import (
+    IMAGE_MAX_PIXELS, IMAGE_JPEG_DRAFT, IMAGE_MAX_UPLOAD_BYTES, IMAGE_DECODE_MEMORY_MB, IMAGE_MAX_CONCURRENT_DECODES,
+    IMAGE_DECODE_WAIT_SECONDS
+)
+from core.exceptions import TooManyRequestsException
+from core.metrics import STAGE_SECONDS
+
+if TYPE_CHECKING:
+    # 预处理器与张量只用于类型标注，导入本模块不会连带导入 torch
+    import torch
+    from torchvision.transforms import Compose
+
+# 解码耗时直方图的分桶上界（毫秒），超过最后一个桶的计入 "+Inf"
+DECODE_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# 预处理的 Resize 可以直接处理的模式，其他模式（P、CMYK、I;16 等）需要先转换为 RGB，否则缩放结果不正确
+_RESIZE_SAFE_MODES = ("RGB", "L")
+
+# 允许的图像格式，Image.open 只尝试这些格式的解析器
+IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF")
+
+# PIL 解码后每个像素最多占用的字节数（RGB 在内部也按 4 字节保存）
+_DECODED_BYTES_PER_PIXEL = 4
+
+# 计算上传文件摘要时每次读取的字节数
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# 感知哈希（dHash）：缩小到 (宽 9, 高 8) 的灰度图，比较每行相邻像素得到 64 位；JPEG 按 1/8 缩小解码即可
+_DHASH_SIZE = (9, 8)
+_DHASH_DRAFT_SIZE = 32
+
+
+class DecodeStats:
+    """ 图像解码统计，解码在多个线程中执行，读写需要加锁 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.images = 0
+        self.failures = 0
+        self.drafted = 0
+        self.decode_ms_total = 0.0
+        self.decode_ms_max = 0.0
+        self.preprocess_ms_total = 0.0
+        self.pixels_total = 0
+        self.decode_ms_histogram: Dict[str, int] = {str(b): 0 for b in DECODE_MS_BUCKETS}
+        self.decode_ms_histogram["+Inf"] = 0
+
+    def observe(self, decode_ms: float, preprocess_ms: float, pixels: int, drafted: bool):
+        """ 记录一张成功解码的图像 """
+        bucket = next((str(b) for b in DECODE_MS_BUCKETS if decode_ms <= b), "+Inf")
+        with self._lock:
+            self.images += 1
+            self.drafted += int(drafted)
+            self.decode_ms_total += decode_ms
+            self.decode_ms_max = max(self.decode_ms_max, decode_ms)
+            self.preprocess_ms_total += preprocess_ms
+            self.pixels_total += pixels
+            self.decode_ms_histogram[bucket] += 1
+
+    def observe_failure(self):
+        """ 记录一次解码失败 """
+        with self._lock:
+            self.failures += 1
+
+    def to_dict(self) -> dict:
+        """ 导出统计信息 """
+        with self._lock:
+            return {
+                "images": self.images,
+                "failures": self.failures,
+                "jpeg_drafted": self.drafted,
+                "avg_decode_ms": round(self.decode_ms_total / self.images, 3) if self.images else 0,
+                "max_decode_ms": round(self.decode_ms_max, 3),
+                "avg_preprocess_ms": round(self.preprocess_ms_total / self.images, 3) if self.images else 0,
+                "avg_decoded_pixels": int(self.pixels_total / self.images) if self.images else 0,
+                "decode_ms_histogram": dict(self.decode_ms_histogram),
+            }
+
+
+class ImageFile:
+    """ 已校验的上传图像：解码时直接从上传的临时文件读取，不再复制成字节串 """
+
+    def __init__(self, file: BinaryIO, size: int, image_format: str, width: int, height: int, digest: str):
+        self.file = file
+        self.size = size
+        self.format = image_format
+        self.width = width
+        self.height = height
+        # 文件内容的 sha256，用作向量缓存键
+        self.digest = digest
+
+    def open(self) -> BinaryIO:
+        """ 返回定位到文件开头的文件对象，同一个文件同一时间只能被一个线程读取 """
+        self.file.seek(0)
+        return self.file
+
+
+# 图像输入：字节串、文件路径或已校验的上传文件
+ImageSource = Union[bytes, str, ImageFile]
+
+
+def _check_pixels(width: int, height: int, max_pixels: int):
+    """ 像素数超过上限时拒绝，防止解压炸弹占满内存 """
+    if max_pixels and width * height > max_pixels:
+        raise ValueError(f"图像尺寸 {width}x{height} 超过 {max_pixels} 像素上限")
+
+
+def _open(source: ImageSource) -> Image.Image:
+    """ 打开图像，只读取文件头，不解码像素 """
+    if isinstance(source, ImageFile):
+        fp = source.open()
+    elif isinstance(source, bytes):
+        fp = io.BytesIO(source)
+    else:
+        fp = source
+    try:
+        return Image.open(fp, formats=IMAGE_FORMATS)
+    except UnidentifiedImageError:
+        raise ValueError(f"无法识别的图像格式，支持的格式: {list(IMAGE_FORMATS)}")
+
+
+def inspect_upload(file: BinaryIO, max_bytes: int = IMAGE_MAX_UPLOAD_BYTES,
+                   max_pixels: int = IMAGE_MAX_PIXELS) -> ImageFile:
+    """ 校验上传的图像文件，不做解码
+
+    - 文件大小超过上限时直接拒绝
+    - 从文件头读取格式与尺寸，不支持的格式与像素数超过上限的图像（解压炸弹）直接拒绝
+    - 顺序读取一遍文件计算摘要，供向量缓存使用，文件内容不会整体读入内存
+
+    :param file: 上传文件的临时文件对象（小文件在内存中，大文件已经落盘）
+    """
+    file.seek(0, os.SEEK_END)
+    size = file.tell()
+    if size == 0:
+        raise ValueError("上传的文件为空")
+    if max_bytes and size > max_bytes:
+        raise ValueError(f"文件大小 {size} 字节超过 {max_bytes} 字节上限")
+
+    file.seek(0)
+    with _open(file) as image:
+        image_format, (width, height) = image.format, image.size
+    _check_pixels(width, height, max_pixels)
+
+    file.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(_HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return ImageFile(file, size, image_format, width, height, digest.hexdigest())
+
+
+class DecodeBudget:
+    """ 单个工作进程的解码预算
+
+    同时解码的图像数与解码中的像素缓冲区总量都有上限，超出时等待其他图像解码完成，
+    等待超时返回 429；单张图像需要的内存超过总上限时直接拒绝。
+    """
+
+    def __init__(self, max_bytes: int = IMAGE_DECODE_MEMORY_MB * 1024 * 1024,
+                 max_concurrent: int = IMAGE_MAX_CONCURRENT_DECODES, timeout: float = IMAGE_DECODE_WAIT_SECONDS):
+        self._max_bytes = max(0, max_bytes)
+        self._max_concurrent = max(1, max_concurrent)
+        self._timeout = timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        self._reserved = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def _available(self, cost: int) -> bool:
+        return self._active < self._max_concurrent and (not self._max_bytes or self._reserved + cost <= self._max_bytes)
+
+    @contextmanager
+    def reserve(self, cost: int):
+        """ 占用 cost 字节的解码内存与一个并发名额，退出时释放 """
+        if self._max_bytes and cost > self._max_bytes:
+            raise ValueError(f"图像解码需要约 {cost // 2 ** 20} MB 内存，超过 {self._max_bytes // 2 ** 20} MB 的解码内存上限")
+
+        with self._condition:
+            if not self._available(cost):
+                self.waited += 1
+                if not self._condition.wait_for(lambda: self._available(cost), timeout=self._timeout):
+                    self.rejected += 1
+                    raise TooManyRequestsException("图像解码繁忙，请稍后重试", retry_after=1.0)
+            self._active += 1
+            self._reserved += cost
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._reserved -= cost
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        """ 导出预算使用情况 """
+        with self._condition:
+            return {
+                "active": self._active,
+                "max_concurrent": self._max_concurrent,
+                "reserved_mb": round(self._reserved / 2 ** 20, 2),
+                "max_mb": round(self._max_bytes / 2 ** 20, 2),
+                "waited": self.waited,
+                "rejected": self.rejected,
+            }
+
+
+def open_image(source: ImageSource, size: int, max_pixels: int = IMAGE_MAX_PIXELS,
+               draft: bool = IMAGE_JPEG_DRAFT) -> Tuple[Image.Image, Tuple[int, int]]:
+    """ 打开图像并完成解码前的检查，返回尚未解码的图像与原始尺寸
+
+    - 读取文件头中的尺寸，像素数超过上限时直接拒绝，不做解码
+    - JPEG 使用 draft 模式，由解码器按 1/2、1/4、1/8 缩小解码，结果不小于 size x size
+
+    :param source: 图像字节、文件路径或已校验的上传文件
+    :param size: 模型的输入分辨率
+    """
+    image = _open(source)
+    original_size = image.size
+    try:
+        _check_pixels(*original_size, max_pixels)
+    except ValueError:
+        image.close()
+        raise
+
+    if draft and image.format == "JPEG":
+        image.draft("RGB", (size, size))
+    return image, original_size
+
+
+def decode_memory(image: Image.Image) -> int:
+    """ 估算解码需要的内存（字节）：draft 之后的像素缓冲区，需要转换模式时再加一份 RGB 副本 """
+    pixels = image.size[0] * image.size[1]
+    copies = 1 if image.mode in _RESIZE_SAFE_MODES else 2
+    return pixels * _DECODED_BYTES_PER_PIXEL * copies
+
+
+def _load(image: Image.Image, original_size: Tuple[int, int]) -> Tuple[Image.Image, bool]:
+    """ 解码像素；预处理在 Resize 之后才转换为 RGB，RGB、L 模式的图像不再在原始尺寸上做一次转换 """
+    image.load()
+    drafted = image.size != original_size
+    if image.mode not in _RESIZE_SAFE_MODES:
+        image = image.convert("RGB")
+    return image, drafted
+
+
+def decode_image(source: ImageSource, size: int, max_pixels: int = IMAGE_MAX_PIXELS,
+                 draft: bool = IMAGE_JPEG_DRAFT) -> Tuple[Image.Image, bool]:
+    """ 解码图像，返回可直接交给预处理的 PIL 图像，以及是否做了 draft 缩小解码 """
+    image, original_size = open_image(source, size, max_pixels, draft)
+    return _load(image, original_size)
+
+
+def load_image(source: ImageSource, preprocess: "Compose", size: int, model_type: str = "") -> "torch.Tensor":
+    """ 解码并预处理单张图像，记录解码与预处理耗时；PIL 解码期间释放 GIL，可在线程池中并行执行
+
+    解码与预处理期间占用解码预算，预处理完成后原始尺寸的像素缓冲区即被释放。
+    :param model_type: 监控指标中的模型类型标签
+    """
+    return _load_image(source, preprocess, size, model_type, False)[0]
+
+
+def load_image_with_hash(source: ImageSource, preprocess: "Compose", size: int, model_type: str = ""
+                         ) -> Tuple["torch.Tensor", int]:
+    """ 同 load_image，并用同一次解码的图像计算感知哈希，需要推理的图像不必为哈希再解码一次 """
+    return _load_image(source, preprocess, size, model_type, True)
+
+
+def _load_image(source: ImageSource, preprocess: "Compose", size: int, model_type: str,
+                with_hash: bool) -> Tuple["torch.Tensor", Optional[int]]:
+    """ 解码并预处理单张图像，with_hash 为 True 时在释放解码缓冲区之前计算感知哈希 """
+    stats = get_decode_stats()
+    try:
+        image, original_size = open_image(source, size)
+    except Exception:
+        stats.observe_failure()
+        raise
+
+    try:
+        with get_decode_budget().reserve(decode_memory(image)):
+            start = time.perf_counter()
+            try:
+                decoded_image, drafted = _load(image, original_size)
+            except Exception:
+                stats.observe_failure()
+                raise
+            decoded = time.perf_counter()
+
+            tensor = preprocess(decoded_image)
+            finished = time.perf_counter()
+
+            value = dhash(decoded_image) if with_hash else None
+            hashed = time.perf_counter()
+    finally:
+        image.close()
+
+    pixels = decoded_image.size[0] * decoded_image.size[1]
+    stats.observe((decoded - start) * 1000, (finished - decoded) * 1000, pixels, drafted)
+    STAGE_SECONDS.observe(decoded - start, stage="decode", model_type=model_type, modality="image", batch_size="1")
+    STAGE_SECONDS.observe(finished - decoded, stage="preprocess", model_type=model_type, modality="image",
+                          batch_size="1")
+    if with_hash:
+        STAGE_SECONDS.observe(hashed - finished, stage="phash", model_type=model_type, modality="image",
+                              batch_size="1")
+    return tensor, value
+
+
+def dhash(image: Image.Image) -> int:
+    """ 差值哈希：缩小后每行比较相邻像素的亮度，左侧更亮记为 1，对压缩、缩放与轻微调色不敏感 """
+    small = image.convert("L").resize(_DHASH_SIZE, Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    width, height = _DHASH_SIZE
+    value = 0
+    for row in range(height):
+        offset = row * width
+        for col in range(width - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def perceptual_hash(source: ImageSource, model_type: str = "") -> int:
+    """ 计算图像的 64 位感知哈希，沿用解码的尺寸检查与解码预算；JPEG 以最小的 draft 比例解码，代价远低于完整解码
+
+    用于还不确定是否需要推理的图像（如近重复检测的批量模式先按哈希筛选候选图像）；确定要推理的图像使用
+    load_image_with_hash，在推理的解码中一并计算。两者的 draft 比例不同，同一张 JPEG 的哈希可能相差少量位。
+    :param model_type: 监控指标中的模型类型标签
+    """
+    image, original_size = open_image(source, _DHASH_DRAFT_SIZE)
+    try:
+        with get_decode_budget().reserve(decode_memory(image)):
+            start = time.perf_counter()
+            decoded_image, _ = _load(image, original_size)
+            value = dhash(decoded_image)
+    finally:
+        image.close()
+
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage="phash", model_type=model_type, modality="image",
+                          batch_size="1")
+    return value
+
+
+@lru_cache()
+def get_decode_stats() -> DecodeStats:
+    """ 获取图像解码统计（进程内单例） """
+    return DecodeStats()
+
+
+@lru_cache()
+def get_decode_budget() -> DecodeBudget:
+    """ 获取解码预算（进程内单例） """
+    return DecodeBudget()
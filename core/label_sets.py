@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 16:10
+@Author : YangFei
+@File   : label_sets.py
+@Desc   : 零样本分类的标签集，按缓存命名空间保存标签向量矩阵，全部工作进程共享
+"""
+import glob
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import CLASSIFY_MAX_LABELS, CLASSIFY_INLINE_CACHE_SIZE, LABEL_SET_DIR
+from core.exceptions import NotFoundException, ValidationException
+
+logger = logging.getLogger(__name__)
+
+# 默认提示词模板，{} 替换为标签
+DEFAULT_TEMPLATE = "{}"
+
+
+def build_prompts(labels: List[str], template: Optional[str] = None) -> List[str]:
+    """ 校验标签并按模板生成提示词 """
+    template = template or DEFAULT_TEMPLATE
+    if "{}" not in template:
+        raise ValidationException("提示词模板必须包含 {} 占位符")
+    if not labels:
+        raise ValidationException("标签列表不能为空")
+    if len(labels) > CLASSIFY_MAX_LABELS:
+        raise ValidationException(f"单个标签集最多 {CLASSIFY_MAX_LABELS} 个标签")
+    if len(set(labels)) != len(labels):
+        raise ValidationException("标签列表中存在重复的标签")
+    return [template.replace("{}", label) for label in labels]
+
+
+class LabelSet:
+    """ 命名标签集，标签向量矩阵按缓存命名空间（模型@精度#权重标识）分别保存为 .npz，供全部工作进程共享 """
+
+    def __init__(self, name: str, labels: List[str], template: Optional[str] = None,
+                 created_at: Optional[float] = None, stem: str = ""):
+        self.name = name
+        self.labels = list(labels)
+        self.template = template or DEFAULT_TEMPLATE
+        self.prompts = build_prompts(self.labels, self.template)
+        self.created_at = created_at or time.time()
+        # 标签集文件的路径前缀
+        self._stem = stem
+        # {命名空间: (文件修改时间, 向量矩阵)}
+        self._embeddings: Dict[str, Tuple[int, np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _embeddings_path(self, namespace: str) -> str:
+        return f"{self._stem}.{_digest(namespace)}.npz"
+
+    def get_embeddings(self, namespace: str) -> Optional[np.ndarray]:
+        """ 获取已计算的标签向量矩阵，文件被其他进程更新后重新读取 """
+        path = self._embeddings_path(namespace)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self._embeddings.get(namespace)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                matrix = data["matrix"]
+        except (OSError, ValueError, KeyError):
+            return None
+        # 标签集被替换之前计算的矩阵不再使用
+        if meta.get("created_at") != self.created_at:
+            return None
+        with self._lock:
+            self._embeddings[namespace] = (mtime, matrix)
+        return matrix
+
+    def set_embeddings(self, namespace: str, matrix: np.ndarray):
+        """ 保存标签向量矩阵 """
+        path = self._embeddings_path(namespace)
+        meta = {"name": self.name, "namespace": namespace, "created_at": self.created_at}
+        _write_npz(path, matrix=matrix, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        with self._lock:
+            self._embeddings[namespace] = (os.stat(path).st_mtime_ns, matrix)
+
+    def computed(self) -> List[str]:
+        """ 已计算向量矩阵的命名空间 """
+        namespaces = []
+        for path in glob.glob(f"{glob.escape(self._stem)}.*.npz"):
+            try:
+                with np.load(path, allow_pickle=False) as data:
+                    meta = json.loads(str(data["meta"]))
+            except (OSError, ValueError, KeyError):
+                continue
+            if meta.get("created_at") == self.created_at:
+                namespaces.append(meta["namespace"])
+        return sorted(namespaces)
+
+    def to_dict(self) -> dict:
+        """ 导出标签集信息 """
+        return {
+            "name": self.name,
+            "template": self.template,
+            "count": len(self.labels),
+            "labels": self.labels,
+            "computed": self.computed(),
+            "created_at": self.created_at,
+        }
+
+
+def _digest(value: str) -> str:
+    """ 文件名使用名称的哈希，名称可能包含任意字符 """
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _write_npz(path: str, **arrays):
+    """ 保存为 .npz，先写临时文件再替换，其他进程不会读到写了一半的文件 """
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+class LabelSetStore:
+    """ 标签集注册表
+
+    命名标签集的定义（<名称哈希>.json）与各命名空间的向量矩阵（<名称哈希>.<命名空间哈希>.npz）保存在磁盘目录中，
+    全部工作进程共享，文件被其他进程更新或删除后同步；工作进程回收或重启后不需要重新注册。
+    请求中内联的标签按 (命名空间, 提示词内容哈希) 在进程内缓存，LRU 淘汰。
+    """
+
+    def __init__(self, directory: str = LABEL_SET_DIR, inline_cache_size: int = CLASSIFY_INLINE_CACHE_SIZE):
+        self._directory = directory
+        # {名称: (定义文件修改时间, 标签集)}
+        self._label_sets: Dict[str, Tuple[int, LabelSet]] = {}
+        self._lock = threading.Lock()
+        self._inline: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._inline_cache_size = max(0, inline_cache_size)
+
+    def _stem(self, name: str) -> str:
+        return os.path.join(self._directory, _digest(name))
+
+    def put(self, name: str, labels: List[str], template: Optional[str] = None) -> LabelSet:
+        """ 创建或替换标签集，替换后已计算的向量矩阵失效 """
+        stem = self._stem(name)
+        label_set = LabelSet(name, labels, template, stem=stem)
+        replaced = os.path.exists(f"{stem}.json")
+        os.makedirs(self._directory, exist_ok=True)
+        # 先删除旧的向量矩阵，再写入新的定义
+        self._remove_embeddings(stem)
+        tmp_path = f"{stem}.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"name": name, "labels": label_set.labels, "template": label_set.template,
+                       "created_at": label_set.created_at}, f, ensure_ascii=False)
+        os.replace(tmp_path, f"{stem}.json")
+        with self._lock:
+            self._label_sets[name] = (os.stat(f"{stem}.json").st_mtime_ns, label_set)
+        logger.info(f"{'替换' if replaced else '创建'}标签集 {name}，共 {len(label_set.labels)} 个标签")
+        return label_set
+
+    def get(self, name: str) -> LabelSet:
+        """ 获取标签集，不存在时抛出 NotFoundException；定义文件被其他进程更新后重新加载 """
+        path = f"{self._stem(name)}.json"
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            with self._lock:
+                self._label_sets.pop(name, None)
+            raise NotFoundException(f"标签集 {name} 不存在")
+
+        with self._lock:
+            cached = self._label_sets.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            raise NotFoundException(f"标签集 {name} 不存在")
+        label_set = LabelSet(data["name"], data["labels"], data["template"], data["created_at"], stem=self._stem(name))
+        with self._lock:
+            self._label_sets[name] = (mtime, label_set)
+        return label_set
+
+    def drop(self, name: str):
+        """ 删除标签集 """
+        stem = self._stem(name)
+        try:
+            os.remove(f"{stem}.json")
+        except FileNotFoundError:
+            raise NotFoundException(f"标签集 {name} 不存在")
+        self._remove_embeddings(stem)
+        with self._lock:
+            self._label_sets.pop(name, None)
+        logger.info(f"删除标签集 {name}")
+
+    @staticmethod
+    def _remove_embeddings(stem: str):
+        for path in glob.glob(f"{glob.escape(stem)}.*.npz"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def list(self) -> List[dict]:
+        """ 列出全部标签集 """
+        label_sets = []
+        for path in sorted(glob.glob(os.path.join(glob.escape(self._directory), "*.json"))):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    name = json.load(f)["name"]
+                label_sets.append(self.get(name).to_dict())
+            except (OSError, ValueError, KeyError, NotFoundException):
+                # 列出期间被其他进程删除
+                continue
+        return label_sets
+
+    @staticmethod
+    def _inline_key(namespace: str, prompts: List[str]) -> Tuple[str, str]:
+        """ 内联标签的缓存键 """
+        digest = hashlib.sha256("\n".join(prompts).encode("utf-8")).hexdigest()
+        return namespace, digest
+
+    def get_inline(self, namespace: str, prompts: List[str]) -> Optional[np.ndarray]:
+        """ 获取内联标签的向量矩阵 """
+        key = self._inline_key(namespace, prompts)
+        matrix = self._inline.get(key)
+        if matrix is not None:
+            self._inline.move_to_end(key)
+        return matrix
+
+    def put_inline(self, namespace: str, prompts: List[str], matrix: np.ndarray):
+        """ 保存内联标签的向量矩阵 """
+        if not self._inline_cache_size:
+            return
+        self._inline[self._inline_key(namespace, prompts)] = matrix
+        while len(self._inline) > self._inline_cache_size:
+            self._inline.popitem(last=False)
+
+
+@lru_cache()
+def get_label_store() -> LabelSetStore:
+    """ 获取标签集注册表（进程内单例） """
+    return LabelSetStore()
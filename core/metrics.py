@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 19:45
+@Author : YangFei
+@File   : metrics.py
+@Desc   : Prometheus 文本格式的监控指标：计数器、仪表盘、直方图与多进程汇总
+
+不依赖 prometheus_client。gunicorn 多进程部署时，各工作进程定期把指标快照写入 CLIP_METRICS_DIR，
+抓取 /metrics 的进程汇总全部快照：计数器与直方图累加（包括已退出的进程），仪表盘只统计存活的进程。
+"""
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from core.batching import BATCH_SIZE_BUCKETS
+from core.config import METRICS_DIR
+
+logger = logging.getLogger(__name__)
+
+# 耗时直方图的分桶上界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Prometheus 文本格式的响应类型
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 已退出进程的计数器与直方图合并到这个文件中
+_ARCHIVE_FILE = "archive.json"
+_LOCK_FILE = ".lock"
+
+
+def batch_size_label(batch_size: int) -> str:
+    """ 批大小标签：取不小于批大小的分桶上界，控制标签基数 """
+    return next((str(b) for b in BATCH_SIZE_BUCKETS if batch_size <= b), "+Inf")
+
+
+class _Metric:
+    """ 指标基类，按标签值分别保存样本 """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        # 指标在事件循环与线程池中都会更新
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[list]:
+        """ 导出全部样本：[标签值列表, 值] """
+        with self._lock:
+            return [[list(key), value if not isinstance(value, list) else list(value)]
+                    for key, value in self._values.items()]
+
+    def describe(self) -> dict:
+        return {"kind": self.kind, "doc": self.documentation, "labels": list(self.label_names),
+                "samples": self.samples()}
+
+
+class Counter(_Metric):
+    """ 只增不减的计数器 """
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """ 直接设置累计值，用于在采集时同步其他组件自己维护的计数 """
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    """ 可增可减的瞬时值 """
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def clear(self):
+        """ 清空全部样本，采集时重新设置，已经消失的标签组合不再输出 """
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(_Metric):
+    """ 直方图，每组标签保存 [各桶计数..., +Inf 桶计数, 总和, 次数]，桶计数不累积 """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                sample = self._values[key] = [0] * (len(self.buckets) + 3)
+            sample[index] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """ 记录代码块的耗时（秒） """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def describe(self) -> dict:
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+
+class MetricsRegistry:
+    """ 指标注册表：注册指标与采集回调，输出 Prometheus 文本格式 """
+
+    def __init__(self, directory: str = METRICS_DIR):
+        """ 初始化注册表
+        :param directory: 多进程汇总目录，为空时只输出当前进程的指标
+        """
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._directory = os.path.abspath(directory) if directory else ""
+        self._pid = os.getpid()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """ 注册采集回调，输出指标前调用，用于同步队列深度、缓存命中等由其他组件维护的状态 """
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, dict]:
+        """ 执行采集回调并导出当前进程的全部指标 """
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"指标采集回调 {getattr(collector, '__name__', collector)} 执行失败: {e}")
+        return {name: metric.describe() for name, metric in self._metrics.items()}
+
+    def flush(self, snapshot: Optional[Dict[str, dict]] = None):
+        """ 把当前进程的指标快照写入汇总目录
+        :param snapshot: 已经导出的快照，为空时当场导出
+        """
+        if not self._directory:
+            return
+        # fork 出的工作进程继承了注册表，以实际的进程号命名快照文件
+        self._pid = os.getpid()
+        os.makedirs(self._directory, exist_ok=True)
+        path = os.path.join(self._directory, f"{self._pid}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot if snapshot is not None else self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    async def run_flusher(self, interval: float):
+        """ 后台任务：定期写入指标快照；采集回调读取的状态属于事件循环，在事件循环中导出，文件读写放到线程中 """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush, self.snapshot())
+            except Exception as e:
+                logger.warning(f"写入指标快照失败: {e}")
+
+    def render(self, local: Optional[Dict[str, dict]] = None) -> str:
+        """ 输出 Prometheus 文本格式，配置了汇总目录时包含全部工作进程
+        :param local: 当前进程已经导出的快照，为空时当场导出
+        """
+        local = local if local is not None else self.snapshot()
+        if not self._directory:
+            return _render(local)
+
+        try:
+            with self._locked():
+                others = self._collect_others()
+        except OSError as e:
+            logger.warning(f"读取其他进程的指标失败，只输出当前进程: {e}")
+            return _render(local)
+        return _render(_merge([(local, True)] + others))
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """ 汇总目录的文件锁，多个进程同时抓取时只有一个进程整理已退出进程的快照 """
+        os.makedirs(self._directory, exist_ok=True)
+        with open(os.path.join(self._directory, _LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _collect_others(self) -> List[Tuple[Dict[str, dict], bool]]:
+        """ 读取其他进程的快照，已退出进程的快照合并到归档文件后删除
+
+        :return: [(快照, 进程是否存活)]
+        """
+        archive_path = os.path.join(self._directory, _ARCHIVE_FILE)
+        archive = _read_snapshot(archive_path)
+        live, dead_paths = [], []
+
+        for file_name in os.listdir(self._directory):
+            pid_text, ext = os.path.splitext(file_name)
+            if ext != ".json" or not pid_text.isdigit() or int(pid_text) == os.getpid():
+                continue
+            path = os.path.join(self._directory, file_name)
+            snapshot = _read_snapshot(path)
+            if snapshot is None:
+                continue
+            if _pid_alive(int(pid_text)):
+                live.append((snapshot, True))
+            else:
+                archive = _merge(([(archive, False)] if archive else []) + [(snapshot, False)])
+                dead_paths.append(path)
+
+        if dead_paths:
+            tmp_path = f"{archive_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(archive, f)
+            os.replace(tmp_path, archive_path)
+            for path in dead_paths:
+                os.remove(path)
+
+        return live + ([(archive, False)] if archive else [])
+
+
+def _read_snapshot(path: str) -> Optional[Dict[str, dict]]:
+    """ 读取快照文件，不存在或内容不完整时返回 None """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    """ 进程是否存活 """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(snapshots: List[Tuple[Dict[str, dict], bool]]) -> Dict[str, dict]:
+    """ 合并多个进程的快照：计数器与直方图累加，仪表盘只累加存活进程的值 """
+    merged: Dict[str, dict] = {}
+    for snapshot, alive in snapshots:
+        for name, metric in snapshot.items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": []})
+            values = {tuple(labels): value for labels, value in target["samples"]}
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                current = values.get(key)
+                if current is None:
+                    values[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    values[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    values[key] = current + value
+            target["samples"] = [[list(key), value] for key, value in values.items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: List[str], values: List[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [(n, v) for n, v in zip(names, values)] + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _render(snapshot: Dict[str, dict]) -> str:
+    """ 把快照输出为 Prometheus 文本格式 """
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append(f"# HELP {name} {metric['doc']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        label_names = metric["labels"]
+        for label_values, value in sorted(metric["samples"], key=lambda s: s[0]):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_value(value)}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-2]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                lines.append(f"{name}_bucket{_format_labels(label_names, label_values, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_names, label_values)} {_format_value(float(value[-2]))}")
+            lines.append(f"{name}_count{_format_labels(label_names, label_values)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """ ASGI 中间件：按路由模板、请求方法与状态码记录请求耗时
+
+    流式响应在最后一块数据发出后才结束计时；未匹配到路由的请求统一记为 unmatched，避免标签基数失控。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(time.perf_counter() - start,
+                                    endpoint=getattr(route, "path", "unmatched"),
+                                    method=scope.get("method", ""), status=status["code"])
+
+
+@lru_cache()
+def get_registry() -> MetricsRegistry:
+    """ 获取指标注册表（进程内单例） """
+    return MetricsRegistry()
+
+
+_registry = get_registry()
+
+# 请求耗时，按路由模板区分接口
+REQUEST_SECONDS = _registry.histogram(
+    "clip_http_request_duration_seconds", "HTTP 请求耗时（秒）", ("endpoint", "method", "status"))
+
+# 向量化各阶段耗时：upload_read、decode、preprocess、tokenize、forward、normalize
+STAGE_SECONDS = _registry.histogram(
+    "clip_stage_duration_seconds", "向量化各阶段耗时（秒）", ("stage", "model_type", "modality", "batch_size"))
+
+# 响应序列化耗时，按响应格式区分
+SERIALIZE_SECONDS = _registry.histogram(
+    "clip_serialize_duration_seconds", "向量响应序列化耗时（秒）", ("format",))
+
+# 实际执行的推理批大小
+BATCH_SIZE = _registry.histogram(
+    "clip_batch_size", "单次推理的批大小", ("model_type", "modality"), buckets=BATCH_SIZE_BUCKETS)
+
+# 任务在线程池中排队等待的时间
+EXECUTOR_WAIT_SECONDS = _registry.histogram(
+    "clip_executor_wait_seconds", "任务在线程池中排队等待的时间（秒）", ("executor",))
+
+MODEL_SWITCHES = _registry.counter("clip_model_switches_total", "默认模型切换次数", ("model_type",))
+MODEL_LOADS = _registry.counter("clip_model_loads_total", "模型加载次数", ("model_type",))
+MODEL_EVICTIONS = _registry.counter("clip_model_evictions_total", "模型因内存预算被淘汰的次数", ("model_type",))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 13:10
+@Author : YangFei
+@File   : precision.py
+@Desc   : 推理精度模式：fp32、bf16 自动混合精度、int8 动态量化，以及与 fp32 的偏差评估
+"""
+import logging
+from contextlib import nullcontext
+from typing import ContextManager, Dict
+
+import torch
+from torch import nn
+
+from cn_clip.clip import tokenize
+
+from core.exceptions import BasRequestException
+
+logger = logging.getLogger(__name__)
+
+PRECISION_FP32 = "fp32"
+PRECISION_BF16 = "bf16"
+PRECISION_INT8 = "int8"
+
+SUPPORTED_PRECISIONS = (PRECISION_FP32, PRECISION_BF16, PRECISION_INT8)
+
+# 偏差评估使用的参考文本
+REFERENCE_TEXTS = [
+    "一只在草地上奔跑的小狗",
+    "夜晚灯火通明的城市街道",
+    "白色背景上的红色运动鞋",
+    "桌上放着一杯热咖啡",
+    "雪山下的湖泊",
+    "促销",
+    "儿童益智积木玩具套装",
+    "穿着汉服的女孩在古镇拍照",
+]
+
+# 偏差评估使用的合成图像数量
+REFERENCE_IMAGE_COUNT = 8
+
+
+def parse_precision_config(value: str) -> Dict[str, str]:
+    """ 解析精度配置，如 "fp32,large=int8,huge=int8"
+
+    不带模型类型的一项作为默认精度，保存在键 "*" 下。
+    """
+    result = {"*": PRECISION_FP32}
+    for part in value.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        model_key, _, precision = part.rpartition("=")
+        precision = precision.strip()
+        if precision not in SUPPORTED_PRECISIONS:
+            raise ValueError(f"不支持的推理精度 {precision}，可选项: {list(SUPPORTED_PRECISIONS)}")
+        result[model_key.strip() or "*"] = precision
+    return result
+
+
+def validate_precision(precision: str) -> str:
+    """ 校验并标准化请求中指定的推理精度 """
+    value = precision.strip().lower()
+    if value not in SUPPORTED_PRECISIONS:
+        raise BasRequestException(f"不支持的推理精度 {precision}，可选项: {list(SUPPORTED_PRECISIONS)}")
+    return value
+
+
+def bf16_supported(device: str) -> bool:
+    """ 判断当前设备是否支持 bf16 计算 """
+    if device == "cuda":
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def resolve_precision(precision: str, device: str) -> str:
+    """ 根据设备能力确定实际可用的精度，不支持时回退到 fp32 """
+    if precision == PRECISION_BF16 and not bf16_supported(device):
+        logger.warning("当前设备不支持 bf16，回退到 fp32")
+        return PRECISION_FP32
+    if precision == PRECISION_INT8 and device != "cpu":
+        logger.warning("int8 动态量化仅支持 CPU，回退到 fp32")
+        return PRECISION_FP32
+    return precision
+
+
+def apply_precision(model: nn.Module, precision: str) -> nn.Module:
+    """ 按精度模式转换模型
+
+    int8 对文本与视觉 Transformer 中的全部 Linear 层做动态量化，权重以 int8 存储、激活在运行时量化；
+    bf16 不修改权重，推理时通过 autocast 执行。
+    """
+    if precision == PRECISION_INT8:
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def inference_context(precision: str, device: str) -> ContextManager:
+    """ 获取推理时的精度上下文 """
+    if precision == PRECISION_BF16:
+        return torch.autocast(device_type=device, dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def module_bytes(model: nn.Module) -> int:
+    """ 统计模型权重占用的字节数，包含量化后打包的权重 """
+    total = 0
+    for value in model.state_dict().values():
+        tensors = value if isinstance(value, (tuple, list)) else (value,)
+        for tensor in tensors:
+            if isinstance(tensor, torch.Tensor):
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def reference_inputs(input_resolution: int, device: str):
+    """ 构造固定的参考输入：参考文本的 token 与确定性的合成图像 """
+    generator = torch.Generator().manual_seed(20251111)
+    images = torch.randn(REFERENCE_IMAGE_COUNT, 3, input_resolution, input_resolution, generator=generator)
+    return tokenize(REFERENCE_TEXTS).to(device), images.to(device)
+
+
+@torch.no_grad()
+def encode_reference(model: nn.Module, precision: str, device: str, inputs) -> Dict[str, torch.Tensor]:
+    """ 用指定精度编码参考输入，返回归一化后的 fp32 向量 """
+    text_tokens, images = inputs
+    with inference_context(precision, device):
+        text_features = model.encode_text(text_tokens).float()
+        image_features = model.encode_image(images).float()
+    return {
+        "text": text_features / text_features.norm(dim=1, keepdim=True),
+        "image": image_features / image_features.norm(dim=1, keepdim=True),
+    }
+
+
+def deviation_report(reference: Dict[str, torch.Tensor], current: Dict[str, torch.Tensor]) -> dict:
+    """ 计算当前精度与 fp32 参考向量的余弦偏差 """
+    report = {}
+    for modality in ("text", "image"):
+        cosine = (reference[modality] * current[modality]).sum(dim=1)
+        report[modality] = {
+            "mean_cosine": round(cosine.mean().item(), 6),
+            "min_cosine": round(cosine.min().item(), 6),
+            "max_deviation": round((1 - cosine).max().item(), 6),
+        }
+    return report
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 22:05
+@Author : YangFei
+@File   : priority.py
+@Desc   : 请求优先级：交互请求（单条检索等）与批量请求（回填、流式批量）分道排队
+
+优先级与排队时限保存在 ContextVar 中，由路由依赖在请求开始时设置，
+同一请求内创建的任务会继承，向量服务提交推理与线程池任务时读取，不需要逐层传参。
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+from core.config import BULK_DEADLINE_MS, INTERACTIVE_DEADLINE_MS
+from core.exceptions import ValidationException
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# 各优先级默认的排队时限（毫秒），0 表示不限制
+_DEFAULT_DEADLINE_MS = {
+    PRIORITY_INTERACTIVE: INTERACTIVE_DEADLINE_MS,
+    PRIORITY_BULK: BULK_DEADLINE_MS,
+}
+
+_current_priority: ContextVar[str] = ContextVar("clip_priority", default=PRIORITY_INTERACTIVE)
+_current_deadline_ms: ContextVar[float] = ContextVar("clip_deadline_ms", default=INTERACTIVE_DEADLINE_MS)
+
+
+def parse_priority(value: str) -> str:
+    """ 标准化并校验优先级 """
+    priority = value.strip().lower()
+    if priority not in PRIORITIES:
+        raise ValidationException(f"不支持的优先级 {value}，可选项: {list(PRIORITIES)}")
+    return priority
+
+
+def set_request_priority(priority: str, deadline_ms: Optional[float] = None):
+    """ 设置当前请求的优先级与排队时限
+    :param priority: 优先级
+    :param deadline_ms: 每次提交推理时允许的排队时间（毫秒），为空时使用优先级的默认值；
+                        不能超过默认值，客户端只能收紧时限
+    """
+    default = _DEFAULT_DEADLINE_MS[priority]
+    if deadline_ms is not None and deadline_ms > 0:
+        deadline_ms = min(deadline_ms, default) if default else deadline_ms
+    else:
+        deadline_ms = default
+    _current_priority.set(priority)
+    _current_deadline_ms.set(deadline_ms)
+
+
+def current_priority() -> str:
+    """ 当前请求的优先级，未设置时为交互优先级 """
+    return _current_priority.get()
+
+
+def current_deadline_ms() -> float:
+    """ 当前请求每次提交推理时允许的排队时间（毫秒），0 表示不限制 """
+    return _current_deadline_ms.get()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 22:40
+@Author : YangFei
+@File   : projection.py
+@Desc   : 向量降维：按模型类型从校准语料学习 PCA（或随机正交）投影矩阵，把向量投影到低维后重新 L2 归一化
+
+文本与图像向量位于同一个对齐空间，同一个模型的两种模态共用一个投影矩阵。
+投影矩阵按列保存前 max_dim 个主成分，任意 output_dim <= max_dim 都取前 output_dim 列，不需要重新拟合。
+拟合结果保存到 CLIP_PROJECTION_DIR，其他工作进程在文件更新后自动重新加载。
+"""
+import io
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.config import PROJECTION_DIR, PROJECTION_EVAL_MAX_SIZE
+from core.exceptions import NotFoundException, ValidationException
+from core.vector_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+METHOD_PCA = "pca"
+METHOD_RANDOM = "random"
+
+SUPPORTED_METHODS = (METHOD_PCA, METHOD_RANDOM)
+
+# 评估召回率时默认使用的维度
+DEFAULT_EVAL_DIMS = (64, 128, 256)
+
+
+def fit_pca(vectors: np.ndarray, max_dim: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ 对协方差矩阵做特征分解，内存占用只与维度 D 有关，与语料条数无关
+    :return: (均值 (D,), 投影矩阵 (D, max_dim), 各主成分的方差占比 (max_dim,))
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    mean = vectors.mean(axis=0)
+    centered = vectors - mean
+    covariance = centered.T @ centered / max(1, len(vectors) - 1)
+    # eigh 按特征值升序返回，翻转为降序
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    eigenvalues, eigenvectors = np.clip(eigenvalues[::-1], 0, None), eigenvectors[:, ::-1]
+    total = eigenvalues.sum()
+    ratio = eigenvalues / total if total > 0 else eigenvalues
+    return mean.astype(np.float32), eigenvectors[:, :max_dim].astype(np.float32), ratio[:max_dim].astype(np.float32)
+
+
+def random_orthogonal(dimension: int, max_dim: int, seed: int = 0) -> np.ndarray:
+    """ 随机正交投影矩阵 (D, max_dim)：高斯矩阵做 QR 分解，列向量两两正交 """
+    rng = np.random.default_rng(seed)
+    q, r = np.linalg.qr(rng.standard_normal((dimension, max_dim)))
+    # 按 R 对角线的符号修正，使分布在正交矩阵上均匀
+    return (q * np.sign(np.diag(r))).astype(np.float32)
+
+
+class Projection:
+    """ 单个模型类型的投影矩阵 """
+
+    def __init__(self, model_type: str, method: str, mean: np.ndarray, components: np.ndarray,
+                 explained_variance: Optional[np.ndarray] = None, corpus_size: int = 0,
+                 recall: Optional[dict] = None, created_at: Optional[float] = None):
+        self.model_type = model_type
+        self.method = method
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.explained_variance = explained_variance
+        self.corpus_size = corpus_size
+        self.recall = recall or {}
+        self.created_at = created_at or time.time()
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[0]
+
+    @property
+    def max_dim(self) -> int:
+        return self.components.shape[1]
+
+    def project(self, vectors: np.ndarray, output_dim: int) -> np.ndarray:
+        """ 投影到前 output_dim 维并重新 L2 归一化，输入为 (N, D) 或 (D,) """
+        if not 0 < output_dim <= self.max_dim:
+            raise ValidationException(f"output_dim 必须在 1 ~ {self.max_dim} 之间")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape[-1] != self.input_dim:
+            raise ValidationException(f"向量维度 {vectors.shape[-1]} 与投影矩阵的输入维度 {self.input_dim} 不一致")
+
+        reduced = (vectors - self.mean) @ self.components[:, :output_dim]
+        norms = np.linalg.norm(reduced, axis=-1, keepdims=True)
+        return reduced / np.maximum(norms, 1e-12)
+
+    def to_dict(self) -> dict:
+        """ 导出投影信息 """
+        cumulative = None
+        if self.explained_variance is not None:
+            cumulative = {str(dim): round(float(self.explained_variance[:dim].sum()), 4)
+                          for dim in DEFAULT_EVAL_DIMS if dim <= self.max_dim}
+        return {
+            "model_type": self.model_type,
+            "method": self.method,
+            "input_dim": self.input_dim,
+            "max_dim": self.max_dim,
+            "corpus_size": self.corpus_size,
+            "explained_variance": cumulative,
+            "recall": self.recall,
+            "created_at": self.created_at,
+        }
+
+    def save(self, path: str):
+        """ 保存为 .npz，先写临时文件再替换，其他进程不会读到写了一半的文件 """
+        meta = {"model_type": self.model_type, "method": self.method, "corpus_size": self.corpus_size,
+                "recall": self.recall, "created_at": self.created_at}
+        arrays = {"mean": self.mean, "components": self.components,
+                  "meta": np.array(json.dumps(meta, ensure_ascii=False))}
+        if self.explained_variance is not None:
+            arrays["explained_variance"] = self.explained_variance
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        """ 从 .npz 文件加载 """
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            explained = data["explained_variance"] if "explained_variance" in data.files else None
+            return cls(meta["model_type"], meta["method"], data["mean"], data["components"], explained,
+                       meta.get("corpus_size", 0), meta.get("recall"), meta.get("created_at"))
+
+
+def evaluate_recall(projection: Projection, holdout: np.ndarray, dims: List[int], top_k: int) -> Dict[str, float]:
+    """ 在留出集上评估降维后的近邻召回率
+
+    留出集中的每个向量依次作为查询，在其余向量中检索 top_k 近邻，
+    以原始维度的结果为基准，统计各维度下的 recall@top_k。
+    """
+    top_k = min(top_k, len(holdout) - 1)
+    if top_k <= 0:
+        return {}
+
+    def neighbours(vectors: np.ndarray) -> np.ndarray:
+        scores = vectors @ vectors.T
+        np.fill_diagonal(scores, -np.inf)
+        return top_k_indices(scores, top_k)
+
+    expected = neighbours(holdout)
+    recall = {}
+    for dim in dims:
+        actual = neighbours(projection.project(holdout, dim))
+        hits = sum(len(np.intersect1d(e, a, assume_unique=True)) for e, a in zip(expected, actual))
+        recall[str(dim)] = round(hits / (len(holdout) * top_k), 4)
+    return recall
+
+
+class ProjectionStore:
+    """ 投影矩阵注册表，按模型类型保存，写入磁盘目录供全部工作进程共享 """
+
+    def __init__(self, directory: str = PROJECTION_DIR):
+        self._directory = directory
+        self._projections: Dict[str, Tuple[float, Projection]] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, model_type: str) -> str:
+        return os.path.join(self._directory, f"{model_type}.npz")
+
+    def fit(self, model_type: str, vectors: np.ndarray, method: str = METHOD_PCA, max_dim: int = 256,
+            holdout_ratio: float = 0.2, eval_dims: Optional[List[int]] = None, top_k: int = 10,
+            seed: int = 0) -> Projection:
+        """ 拟合投影矩阵并保存
+
+        :param vectors: 校准语料的原始向量 (N, D)，按 holdout_ratio 划出留出集评估召回率，其余用于拟合
+        :param max_dim: 保存的最大输出维度
+        """
+        if method not in SUPPORTED_METHODS:
+            raise ValidationException(f"不支持的降维方法 {method}，可选项: {list(SUPPORTED_METHODS)}")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValidationException("校准向量格式不正确")
+        dimension = vectors.shape[1]
+        if not 0 < max_dim <= dimension:
+            raise ValidationException(f"max_dim 必须在 1 ~ {dimension} 之间")
+        if not 0 <= holdout_ratio < 1:
+            raise ValidationException("holdout_ratio 必须在 [0, 1) 之间")
+
+        rng = np.random.default_rng(seed)
+        order = rng.permutation(len(vectors))
+        holdout_size = min(int(len(vectors) * holdout_ratio), PROJECTION_EVAL_MAX_SIZE)
+        holdout, train = vectors[order[:holdout_size]], vectors[order[holdout_size:]]
+
+        if method == METHOD_PCA:
+            if len(train) < max_dim:
+                raise ValidationException(f"PCA 至少需要 {max_dim} 条拟合语料（不含留出集），当前 {len(train)} 条")
+            mean, components, explained = fit_pca(train, max_dim)
+        else:
+            mean, explained = np.zeros(dimension, dtype=np.float32), None
+            components = random_orthogonal(dimension, max_dim, seed)
+
+        projection = Projection(model_type, method, mean, components, explained, corpus_size=len(train))
+        dims = sorted({dim for dim in (eval_dims or DEFAULT_EVAL_DIMS) if 0 < dim <= max_dim} | {max_dim})
+        projection.recall = {"top_k": top_k, "holdout_size": len(holdout),
+                             f"recall@{top_k}": evaluate_recall(projection, holdout, dims, top_k)}
+
+        os.makedirs(self._directory, exist_ok=True)
+        path = self._path(model_type)
+        projection.save(path)
+        with self._lock:
+            self._projections[model_type] = (os.stat(path).st_mtime, projection)
+        logger.info(f"📐 模型 {model_type} 的 {method} 投影已保存到 {path}，最大维度 {max_dim}，"
+                    f"召回率 {projection.recall[f'recall@{top_k}']}")
+        return projection
+
+    def get(self, model_type: str) -> Optional[Projection]:
+        """ 获取投影矩阵，文件被其他进程更新或删除后同步 """
+        path = self._path(model_type)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            with self._lock:
+                self._projections.pop(model_type, None)
+            return None
+
+        with self._lock:
+            cached = self._projections.get(model_type)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        projection = Projection.load(path)
+        with self._lock:
+            self._projections[model_type] = (mtime, projection)
+        return projection
+
+    def require(self, model_type: str, output_dim: int) -> Projection:
+        """ 获取可以输出 output_dim 维的投影矩阵，不存在或维度不足时抛出 ValidationException """
+        projection = self.get(model_type)
+        if projection is None:
+            raise ValidationException(f"模型 {model_type} 没有可用的投影矩阵，请先使用校准语料拟合")
+        if output_dim > projection.max_dim:
+            raise ValidationException(f"模型 {model_type} 的投影矩阵最多输出 {projection.max_dim} 维")
+        return projection
+
+    def drop(self, model_type: str):
+        """ 删除投影矩阵 """
+        try:
+            os.remove(self._path(model_type))
+        except FileNotFoundError:
+            raise NotFoundException(f"模型 {model_type} 没有投影矩阵")
+        with self._lock:
+            self._projections.pop(model_type, None)
+        logger.info(f"删除模型 {model_type} 的投影矩阵")
+
+    def list(self) -> List[dict]:
+        """ 列出全部投影矩阵 """
+        if not os.path.isdir(self._directory):
+            return []
+        names = sorted(name[:-len(".npz")] for name in os.listdir(self._directory) if name.endswith(".npz"))
+        projections = [self.get(name) for name in names]
+        return [projection.to_dict() for projection in projections if projection is not None]
+
+
+@lru_cache()
+def get_projection_store() -> ProjectionStore:
+    """ 获取投影矩阵注册表（进程内单例） """
+    return ProjectionStore()
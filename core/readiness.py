@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 23:55
+@Author : YangFei
+@File   : readiness.py
+@Desc   : 启动状态：推理依赖的导入与各模型的加载、预热进度，供存活与就绪探针使用
+
+应用模块导入时不再导入 torch、torchvision 与 cn_clip，工作进程启动后立即接受连接，
+推理依赖的导入、默认模型的加载与预热在后台任务中完成，完成之前业务接口返回 503。
+本模块不依赖推理相关的包。
+"""
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 推理引擎模块，导入时连带导入 torch、torchvision 与 cn_clip
+ENGINE_MODULE = "core.cn_clip"
+
+# 启动阶段
+PHASE_STARTING = "starting"
+PHASE_IMPORTING = "importing"
+PHASE_LOADING = "loading"
+PHASE_WARMING = "warming"
+PHASE_READY = "ready"
+PHASE_FAILED = "failed"
+
+# 单个模型的状态
+MODEL_LOADING = "loading"
+MODEL_LOADED = "loaded"
+MODEL_WARMING = "warming"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"
+
+# 启动完成之前，业务接口建议客户端的重试等待时间（秒）
+STARTUP_RETRY_AFTER = 5.0
+
+
+class StartupState:
+    """ 工作进程的启动状态 """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engine_loaded = False
+        self._engine_seconds: Optional[float] = None
+        self._models: Dict[str, dict] = {}
+        self.phase = PHASE_STARTING
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+
+    @property
+    def engine_loaded(self) -> bool:
+        """ 推理依赖是否已经导入完成 """
+        return self._engine_loaded
+
+    @property
+    def ready(self) -> bool:
+        """ 默认模型是否已经加载并预热完成 """
+        return self.phase == PHASE_READY
+
+    @property
+    def failed(self) -> bool:
+        return self.phase == PHASE_FAILED
+
+    def begin(self):
+        """ 工作进程开始启动；gunicorn 主进程预先导入的推理依赖随 fork 继承，不需要重新导入 """
+        with self._lock:
+            self._models.clear()
+            self.phase = PHASE_STARTING
+            self.error = None
+            self.started_at = time.time()
+
+    def set_phase(self, phase: str, error: Optional[str] = None):
+        self.phase = phase
+        self.error = error
+
+    def import_engine(self):
+        """ 导入推理依赖（阻塞），在线程或 gunicorn 主进程中执行 """
+        if self._engine_loaded:
+            return
+        start = time.perf_counter()
+        importlib.import_module(ENGINE_MODULE)
+        self._engine_seconds = round(time.perf_counter() - start, 3)
+        self._engine_loaded = True
+        logger.info(f"📦 推理依赖导入完成，耗时 {self._engine_seconds:.1f}s")
+
+    def update_model(self, model_type: str, state: str, **fields):
+        """ 更新模型的加载状态，fields 为附加信息，如耗时、设备、错误原因 """
+        with self._lock:
+            record = self._models.setdefault(model_type, {"model_type": model_type})
+            if state == MODEL_LOADING:
+                # 重新加载时清除上一次的记录
+                record.clear()
+                record.update(model_type=model_type, started_at=time.time())
+            record.update(state=state, updated_at=time.time(), **fields)
+
+    def to_dict(self) -> dict:
+        """ 导出启动状态 """
+        with self._lock:
+            models = [dict(record) for record in self._models.values()]
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "error": self.error,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "engine_loaded": self._engine_loaded,
+            "engine_import_seconds": self._engine_seconds,
+            "models": models,
+        }
+
+    async def run(self, model_type: str, warmup: bool = True):
+        """ 启动任务：导入推理依赖，加载并预热默认模型；失败时记录原因，不向外抛出 """
+        try:
+            if not self._engine_loaded:
+                self.set_phase(PHASE_IMPORTING)
+                await asyncio.to_thread(self.import_engine)
+
+            from core.cn_clip import get_clip
+
+            self.set_phase(PHASE_LOADING)
+            await get_clip().init(model_type=model_type)
+            if warmup:
+                self.set_phase(PHASE_WARMING)
+                await get_clip().warmup()
+            self.set_phase(PHASE_READY)
+            logger.info(f"✅ 服务就绪，启动耗时 {time.time() - self.started_at:.1f}s")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ 服务启动失败: {e}", exc_info=True)
+            self.set_phase(PHASE_FAILED, error=str(e))
+
+
+@lru_cache()
+def get_startup_state() -> StartupState:
+    """ 获取启动状态（进程内单例） """
+    return StartupState()
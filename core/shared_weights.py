@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 19:10
+@Author : YangFei
+@File   : shared_weights.py
+@Desc   : 多个工作进程共享模型权重：导出 fp32 权重文件，加载时以 mmap 只读映射
+
+用法（在 gunicorn 启动前或镜像构建时预先导出）:
+    python -m core.shared_weights mini base
+"""
+import os
+import re
+import sys
+import time
+import logging
+
+import torch
+from torch import nn
+from cn_clip.clip import load_from_name
+from cn_clip.clip.utils import _MODEL_INFO, _MODELS, create_model
+
+logger = logging.getLogger(__name__)
+
+
+def source_path(model_name: str, model_dir: str) -> str:
+    """ 预训练权重文件的路径（cn_clip 下载到 model_dir 下的文件） """
+    _, filename = _MODELS[model_name]
+    return os.path.join(os.path.abspath(model_dir), filename)
+
+
+def weights_identity(path: str) -> str:
+    """ 权重文件的标识（大小与修改时间），文件更新后随之变化；文件不存在时为空 """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def weights_path(weights_dir: str, model_key: str, identity: str) -> str:
+    """ 导出的权重文件路径，按预训练权重的标识与 torch 版本区分 """
+    return os.path.join(os.path.abspath(weights_dir), f"{model_key}-{identity}-fp32-torch{torch.__version__}.pt")
+
+
+def export_weights(model_name: str, model_key: str, model_dir: str, weights_dir: str) -> str:
+    """ 从预训练权重加载 fp32 模型，并把 state_dict 导出为可 mmap 的文件
+
+    导出文件按预训练权重的标识命名，预训练权重更新后会重新导出，而不是继续使用旧的导出文件；
+    同一个模型旧标识的导出文件随后删除（已经映射的进程不受影响）。
+    :return: 导出文件的路径，已存在时直接返回
+    """
+    source = source_path(model_name, model_dir)
+    identity = weights_identity(source)
+    if identity and os.path.exists(weights_path(weights_dir, model_key, identity)):
+        return weights_path(weights_dir, model_key, identity)
+
+    start = time.perf_counter()
+    # 预训练权重不存在时由 cn_clip 下载，标识在加载之后重新读取
+    model, _ = load_from_name(name=model_name, device="cpu", download_root=os.path.abspath(model_dir))
+    model.float()
+    path = weights_path(weights_dir, model_key, weights_identity(source))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 先写临时文件再重命名，多个工作进程同时导出时不会读到不完整的文件
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+    logger.info(f"📦 已导出共享权重 {path}，耗时 {time.perf_counter() - start:.1f}s")
+
+    pattern = re.compile(re.escape(os.path.basename(weights_path(weights_dir, model_key, "@")))
+                         .replace("@", "[0-9a-f]+-[0-9a-f]+") + "$")
+    for name in os.listdir(os.path.dirname(path)):
+        stale = os.path.join(os.path.dirname(path), name)
+        if pattern.match(name) and stale != path:
+            os.remove(stale)
+            logger.info(f"🗑️ 已删除旧的共享权重 {stale}")
+    return path
+
+
+def load_mapped(model_name: str, path: str) -> nn.Module:
+    """ 构建模型结构，并把参数直接替换为 mmap 映射的张量
+
+    映射使用 MAP_PRIVATE，推理只读不写，各进程的权重页都来自同一份页缓存，物理内存只占一份；
+    构建结构时临时分配的随机权重在替换后释放。
+    """
+    model = create_model(_MODEL_INFO[model_name]["struct"])
+    state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    model.load_state_dict(state_dict, assign=True)
+    return model.float().eval()
+
+
+def main(argv=None):
+    """ 预先导出指定模型类型的共享权重 """
+    from core.cn_clip import get_clip
+    from core.log_config import setup_logging
+
+    setup_logging(log_level=logging.INFO)
+    for model_type in (argv if argv is not None else sys.argv[1:]) or ["mini"]:
+        get_clip().export_shared_weights(model_type)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 03:20
+@Author : YangFei
+@File   : swap_requests.py
+@Desc   : 模型热切换请求：写入共享目录，由全部工作进程轮询执行
+
+管理接口只会落到某一个工作进程上。接口把切换请求写入 CLIP_SWAP_DIR 下的 request.json，每个工作进程的后台任务
+按 CLIP_SWAP_POLL_INTERVAL 轮询文件的修改时间，发现新的请求 id 后在本进程执行热切换，并把进度写入 worker-<pid>.json。
+新启动的工作进程（max_requests 回收或 HUP 重启）在加载默认模型之前读取最近的请求，直接按请求的模型与精度启动。
+本模块不依赖推理相关的包。
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from functools import lru_cache
+from typing import List, Optional
+
+from core.config import SWAP_DIR, SWAP_POLL_INTERVAL
+from core.metrics import _pid_alive
+from core.readiness import get_startup_state
+
+logger = logging.getLogger(__name__)
+
+# 最近一次切换请求的文件名
+_REQUEST_FILE = "request.json"
+
+# 工作进程执行状态的文件名前缀
+_WORKER_PREFIX = "worker-"
+
+
+def _write_json(path: str, data: dict):
+    """ 先写临时文件再替换，其他进程不会读到写了一半的文件 """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    """ 读取 JSON 文件，不存在或内容不完整时返回 None """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class SwapRequests:
+    """ 热切换请求与各工作进程的执行状态 """
+
+    def __init__(self, directory: str = SWAP_DIR):
+        self._directory = directory
+        # 已读取的请求文件的修改时间与内容
+        self._mtime: Optional[int] = None
+        self._request: Optional[dict] = None
+
+    @property
+    def _request_path(self) -> str:
+        return os.path.join(self._directory, _REQUEST_FILE)
+
+    def publish(self, model_type: str, precision: Optional[str], make_default: bool, warmup: bool) -> dict:
+        """ 写入新的切换请求，覆盖之前的请求，返回请求内容 """
+        request = {
+            "id": uuid.uuid4().hex,
+            "model_type": model_type,
+            "precision": precision,
+            "make_default": make_default,
+            "warmup": warmup,
+            "requested_at": time.time(),
+            "requested_by": os.getpid(),
+        }
+        os.makedirs(self._directory, exist_ok=True)
+        _write_json(self._request_path, request)
+        logger.info(f"📨 已发布模型热切换请求 {request['id']}: {model_type}（{precision or '当前精度'}）")
+        return request
+
+    def latest(self) -> Optional[dict]:
+        """ 最近的切换请求，文件未变化时不重新读取 """
+        try:
+            mtime = os.stat(self._request_path).st_mtime_ns
+        except OSError:
+            self._mtime, self._request = None, None
+            return None
+        if mtime != self._mtime:
+            self._mtime, self._request = mtime, _read_json(self._request_path)
+        return self._request
+
+    def write_status(self, request_id: str, report: dict):
+        """ 记录本进程执行切换请求的进度 """
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            _write_json(os.path.join(self._directory, f"{_WORKER_PREFIX}{os.getpid()}.json"),
+                        dict(report, request_id=request_id, pid=os.getpid(), updated_at=time.time()))
+        except OSError as e:
+            logger.warning(f"写入热切换状态失败: {e}")
+
+    def statuses(self) -> List[dict]:
+        """ 存活的工作进程的执行状态，已退出进程的状态文件删除 """
+        try:
+            file_names = os.listdir(self._directory)
+        except OSError:
+            return []
+
+        statuses = []
+        for file_name in sorted(file_names):
+            pid_text, ext = os.path.splitext(file_name[len(_WORKER_PREFIX):])
+            if not file_name.startswith(_WORKER_PREFIX) or ext != ".json" or not pid_text.isdigit():
+                continue
+            path = os.path.join(self._directory, file_name)
+            if not _pid_alive(int(pid_text)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            status = _read_json(path)
+            if status is not None:
+                statuses.append(status)
+        return statuses
+
+    async def run_watcher(self, interval: float = SWAP_POLL_INTERVAL):
+        """ 后台任务：服务就绪后轮询切换请求，交给本进程的模型实例执行（同一个请求只执行一次） """
+        startup = get_startup_state()
+        while True:
+            await asyncio.sleep(interval)
+            if not startup.ready:
+                continue
+            try:
+                request = await asyncio.to_thread(self.latest)
+                if request is None:
+                    continue
+                from core.cn_clip import get_clip
+                await get_clip().apply_swap_request(request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"执行模型热切换请求失败: {e}")
+
+
+@lru_cache()
+def get_swap_requests() -> SwapRequests:
+    """ 获取热切换请求（进程内单例） """
+    return SwapRequests()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 17:05
+@Author : YangFei
+@File   : text_tokens.py
+@Desc   : 文本 token id 缓存与按长度分桶，短文本不再补齐到完整的上下文长度
+"""
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Tuple
+
+from core.config import TOKEN_CACHE_SIZE, TEXT_LENGTH_BUCKET_STEP
+
+# cn_clip 全部预训练模型的上下文长度
+CONTEXT_LENGTH = 52
+# [PAD] 的 token id，编码时据此生成注意力掩码
+PAD_TOKEN_ID = 0
+
+if TYPE_CHECKING:
+    import torch
+
+
+class TokenCache:
+    """ 文本 token id 的 LRU 缓存
+
+    缓存的是去掉补齐部分的 token id（含 [CLS] 与 [SEP]），补齐长度在组批时再确定。
+    分词在推理线程中执行，读写需要加锁。
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE):
+        self._max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[str, Tuple[int, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, texts: List[str]) -> List[Tuple[int, ...]]:
+        """ 获取文本的 token id，未命中的文本一次性分词 """
+        results: List[Tuple[int, ...]] = [()] * len(texts)
+        missing = []
+        with self._lock:
+            for i, text in enumerate(texts):
+                tokens = self._entries.get(text)
+                if tokens is None:
+                    missing.append(i)
+                else:
+                    self._entries.move_to_end(text)
+                    results[i] = tokens
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if not missing:
+            return results
+
+        # 推理依赖在后台启动时导入，这里延迟导入，导入本模块不会连带导入 torch
+        from cn_clip.clip import tokenize
+
+        padded = tokenize([texts[i] for i in missing], context_length=CONTEXT_LENGTH)
+        lengths = padded.ne(PAD_TOKEN_ID).sum(dim=1).tolist()
+        with self._lock:
+            for row, i in enumerate(missing):
+                tokens = tuple(padded[row, :lengths[row]].tolist())
+                results[i] = tokens
+                if self._max_entries:
+                    self._entries[texts[i]] = tokens
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+        return results
+
+    def stats(self) -> dict:
+        """ 缓存统计 """
+        return {"entries": len(self._entries), "max_entries": self._max_entries, "hits": self.hits,
+                "misses": self.misses}
+
+
+def padded_length(length: int, step: int = TEXT_LENGTH_BUCKET_STEP) -> int:
+    """ 补齐长度：向上取整到 step 的倍数，不超过上下文长度 """
+    step = max(1, step)
+    return min(CONTEXT_LENGTH, -(-length // step) * step)
+
+
+def length_buckets(token_ids: List[Tuple[int, ...]], max_batch_size: int, full_length: bool = False
+                   ) -> List[Tuple[List[int], "torch.Tensor"]]:
+    """ 按 token 数排序并分桶，每个桶补齐到桶内的最小长度
+
+    :param token_ids: 各文本的 token id
+    :param max_batch_size: 单个桶的最大条目数
+    :param full_length: 为 True 时全部补齐到上下文长度（追踪后的编码器只接受固定形状）
+    :return: [(原始下标列表, 补齐后的 token 张量), ...]
+    """
+    import torch
+
+    order = sorted(range(len(token_ids)), key=lambda i: len(token_ids[i]))
+
+    groups: List[List[int]] = []
+    group_length = -1
+    for i in order:
+        length = CONTEXT_LENGTH if full_length else padded_length(len(token_ids[i]))
+        if not groups or length != group_length or len(groups[-1]) >= max_batch_size:
+            groups.append([])
+            group_length = length
+        groups[-1].append(i)
+
+    buckets = []
+    for indexes in groups:
+        length = CONTEXT_LENGTH if full_length else padded_length(max(len(token_ids[i]) for i in indexes))
+        tensor = torch.full((len(indexes), length), PAD_TOKEN_ID, dtype=torch.long)
+        for row, i in enumerate(indexes):
+            tensor[row, :len(token_ids[i])] = torch.tensor(token_ids[i], dtype=torch.long)
+        buckets.append((indexes, tensor))
+    return buckets
+
+
+@lru_cache()
+def get_token_cache() -> TokenCache:
+    """ 获取 token id 缓存（进程内单例） """
+    return TokenCache()
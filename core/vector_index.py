@@ -0,0 +1,699 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/16 14:45
+@Author : YangFei
+@File   : vector_index.py
+@Desc   : 命名向量集合，支持暴力检索与 IVF 近似检索（内积）
+
+配置了 CLIP_COLLECTION_DIR 时，集合以快照加操作日志的形式保存在磁盘上，全部工作进程共享：
+写入时在文件锁内追加操作日志，其他工作进程在读取集合时重放新增的日志，工作进程回收或重启后从磁盘重新加载。
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config import COLLECTION_DIR, IVF_MIN_TRAIN_SIZE, IVF_DEFAULT_NPROBE
+from core.exceptions import BasRequestException, NotFoundException, ValidationException
+
+logger = logging.getLogger(__name__)
+
+INDEX_FLAT = "flat"
+INDEX_IVF = "ivf"
+
+SUPPORTED_INDEX_TYPES = (INDEX_FLAT, INDEX_IVF)
+
+# 训练 IVF 聚类中心时最多使用的样本数
+_IVF_TRAIN_SAMPLE = 100000
+# 训练 IVF 聚类中心的迭代次数
+_IVF_TRAIN_ITERATIONS = 10
+# 训练与聚类归属分块计算的行数，避免一次生成完整的 N x nlist 分数矩阵
+_IVF_CHUNK_SIZE = 16384
+
+# 操作日志的记录头：操作类型、条目数、向量维度、id 列表（JSON）的字节数，之后是 id 列表与 float32 向量
+_RECORD_HEADER = struct.Struct("<BIII")
+_OP_UPSERT = 1
+_OP_DELETE = 2
+# 操作日志超过该大小且超过快照大小后合并为新的快照
+_COMPACT_MIN_BYTES = 64 * 1024 * 1024
+# 集合目录的文件锁
+_LOCK_FILE = ".lock"
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """ 对每一行取分数最高的 top_k 个下标，按分数从高到低排列 """
+    top_k = min(top_k, scores.shape[1])
+    if top_k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if top_k < scores.shape[1]:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class _IVFIndex:
+    """ 倒排文件（IVF）近似索引
+
+    用球面 k-means 把向量划分到 nlist 个聚类，检索时只计算与查询最接近的 nprobe 个聚类中的向量。
+    每个聚类维护一个倒排表（行号集合），探查时只读取被探查聚类中的行，增删向量时同步更新倒排表，无需重建索引。
+    """
+
+    def __init__(self, nlist: int, nprobe: int):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        # 聚类 -> 行号
+        self.lists: List[Set[int]] = []
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, sample: np.ndarray, size: int):
+        """ 用样本训练聚类中心，size 为训练时集合的条目数；样本分块计算，不生成完整的 N x nlist 分数矩阵 """
+        start = time.perf_counter()
+        rng = np.random.default_rng(0)
+        nlist = min(self.nlist, len(sample))
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(_IVF_TRAIN_ITERATIONS):
+            sums = np.zeros_like(centroids)
+            counts = np.zeros(nlist, dtype=np.int64)
+            for begin in range(0, len(sample), _IVF_CHUNK_SIZE):
+                chunk = sample[begin:begin + _IVF_CHUNK_SIZE]
+                labels = np.argmax(chunk @ centroids.T, axis=1)
+                np.add.at(sums, labels, chunk)
+                counts += np.bincount(labels, minlength=nlist)
+            # 空聚类保留原来的中心
+            filled = counts > 0
+            norms = np.linalg.norm(sums[filled], axis=1, keepdims=True)
+            centroids[filled] = sums[filled] / np.maximum(norms, 1e-12)
+
+        self.centroids = centroids.astype(np.float32)
+        self.nlist = nlist
+        self.trained_size = size
+        logger.info(f"IVF 索引训练完成：{nlist} 个聚类，样本 {len(sample)}，耗时 {time.perf_counter() - start:.2f}s")
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        """ 分块计算向量所属的聚类 """
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for begin in range(0, len(vectors), _IVF_CHUNK_SIZE):
+            chunk = vectors[begin:begin + _IVF_CHUNK_SIZE]
+            assignments[begin:begin + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return assignments
+
+    def build_lists(self, assignments: np.ndarray):
+        """ 由每行的聚类归属构建倒排表 """
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(self.nlist + 1))
+        self.lists = [set(order[bounds[c]:bounds[c + 1]].tolist()) for c in range(self.nlist)]
+
+    def move(self, row: int, old: int, new: int):
+        """ 行的聚类归属变化，old / new 为 -1 表示不在任何聚类中 """
+        if old >= 0:
+            self.lists[old].discard(row)
+        if new >= 0:
+            self.lists[new].add(row)
+
+    def probe(self, queries: np.ndarray, nprobe: int) -> np.ndarray:
+        """ 返回每个查询需要探查的聚类 """
+        return top_k_indices(queries @ self.centroids.T, nprobe)
+
+    def candidates(self, clusters: np.ndarray) -> np.ndarray:
+        """ 探查聚类中的全部行号，只读取这些聚类的倒排表 """
+        lists = [self.lists[c] for c in clusters]
+        return np.fromiter(chain.from_iterable(lists), dtype=np.int64, count=sum(len(rows) for rows in lists))
+
+
+@contextmanager
+def _file_lock(directory: str, exclusive: bool) -> Iterator[None]:
+    """ 集合目录的文件锁：写入持有排他锁，重放日志持有共享锁 """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, _LOCK_FILE), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class _Journal:
+    """ 集合在磁盘上的快照与操作日志
+
+    每个集合对应 <名称哈希>.json（元数据与当前代数）、<名称哈希>.<代数>.npz（快照）与 <名称哈希>.<代数>.log（操作日志）。
+    写入时持有排他锁：先重放其他进程追加的日志，再在内存中执行并追加到日志；读取集合时持有共享锁重放新增的日志。
+    日志超过快照大小后由写入的进程合并为新一代快照，其他进程发现代数变化后重新加载。
+    """
+
+    def __init__(self, directory: str, name: str):
+        self._directory = directory
+        self._stem = self.stem(directory, name)
+        # 已加载的代数与已重放的日志字节数
+        self.generation = -1
+        self.offset = 0
+        # 已读取的元数据文件的修改时间
+        self._meta_mtime: Optional[int] = None
+
+    @staticmethod
+    def stem(directory: str, name: str) -> str:
+        """ 集合文件的路径前缀，集合名称可能包含任意字符，文件名使用名称的哈希 """
+        return os.path.join(directory, hashlib.sha1(name.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def read_meta(path: str) -> Optional[dict]:
+        """ 读取元数据，不存在或内容不完整时返回 None """
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self._stem}.json"
+
+    def _snapshot_path(self, generation: int) -> str:
+        return f"{self._stem}.{generation}.npz"
+
+    def _log_path(self, generation: int) -> str:
+        return f"{self._stem}.{generation}.log"
+
+    def _write_meta(self, meta: dict):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+        self._meta_mtime = os.stat(self.meta_path).st_mtime_ns
+
+    def create(self, meta: dict):
+        """ 新建集合的元数据与空日志（调用方持有排他锁） """
+        open(self._log_path(0), "wb").close()
+        self._write_meta(dict(meta, generation=0))
+        self.generation, self.offset = 0, 0
+
+    def remove(self):
+        """ 删除集合的全部文件（调用方持有排他锁） """
+        meta = self.read_meta(self.meta_path)
+        os.remove(self.meta_path)
+        if meta is not None:
+            for path in (self._snapshot_path(meta["generation"]), self._log_path(meta["generation"])):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def changed(self) -> bool:
+        """ 磁盘上的集合是否有尚未重放的变化（不加锁，只比较元数据的修改时间与日志大小） """
+        try:
+            if os.stat(self.meta_path).st_mtime_ns != self._meta_mtime:
+                return True
+            return os.stat(self._log_path(self.generation)).st_size != self.offset
+        except OSError:
+            return True
+
+    def catch_up(self, collection: "VectorCollection", truncate: bool = False):
+        """ 重放其他进程写入的变化，代数变化时从快照重新加载（调用方持有文件锁）
+
+        :param truncate: 写入前截断日志末尾不完整的记录（写入进程崩溃时留下），需要持有排他锁
+        """
+        meta = self.read_meta(self.meta_path)
+        if meta is None or meta["created_at"] != collection.created_at:
+            raise NotFoundException(f"集合 {collection.name} 不存在")
+        self._meta_mtime = os.stat(self.meta_path).st_mtime_ns
+
+        if meta["generation"] != self.generation:
+            collection._reset()
+            snapshot_path = self._snapshot_path(meta["generation"])
+            if os.path.exists(snapshot_path):
+                with np.load(snapshot_path) as snapshot:
+                    if len(snapshot["ids"]):
+                        collection._apply_upsert(snapshot["ids"].tolist(), snapshot["vectors"], True)
+            self.generation, self.offset = meta["generation"], 0
+
+        log_path = self._log_path(self.generation)
+        with open(log_path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        position = 0
+        while position + _RECORD_HEADER.size <= len(data):
+            op, count, dimension, ids_size = _RECORD_HEADER.unpack_from(data, position)
+            begin = position + _RECORD_HEADER.size
+            end = begin + ids_size + (count * dimension * 4 if op == _OP_UPSERT else 0)
+            if end > len(data):
+                break
+            ids = json.loads(data[begin:begin + ids_size])
+            if op == _OP_UPSERT:
+                vectors = np.frombuffer(data, dtype="<f4", count=count * dimension, offset=begin + ids_size)
+                collection._apply_upsert(ids, vectors.reshape(count, dimension), True)
+            else:
+                collection._apply_delete(ids)
+            position = end
+        self.offset += position
+        if truncate and position < len(data):
+            logger.warning(f"集合 {collection.name} 的操作日志末尾有不完整的记录，已截断")
+            os.truncate(log_path, self.offset)
+
+    @contextmanager
+    def writing(self, collection: "VectorCollection") -> Iterator[None]:
+        """ 写入集合：持有排他锁并重放其他进程的变化，保证各进程按日志顺序执行写入 """
+        with _file_lock(self._directory, exclusive=True):
+            self.catch_up(collection, truncate=True)
+            yield
+
+    def append(self, collection: "VectorCollection", op: int, ids: List[str], vectors: Optional[np.ndarray] = None):
+        """ 追加一条操作记录（调用方持有排他锁），日志过大时合并为新的快照 """
+        ids_bytes = json.dumps(ids, ensure_ascii=False).encode("utf-8")
+        count, dimension = (vectors.shape if vectors is not None else (len(ids), 0))
+        record = _RECORD_HEADER.pack(op, count, dimension, len(ids_bytes)) + ids_bytes
+        if vectors is not None:
+            record += np.ascontiguousarray(vectors, dtype="<f4").tobytes()
+        with open(self._log_path(self.generation), "ab") as f:
+            f.write(record)
+        self.offset += len(record)
+
+        snapshot_path = self._snapshot_path(self.generation)
+        snapshot_size = os.path.getsize(snapshot_path) if os.path.exists(snapshot_path) else 0
+        if self.offset > max(_COMPACT_MIN_BYTES, snapshot_size):
+            self._compact(collection)
+
+    def _compact(self, collection: "VectorCollection"):
+        """ 把当前内容写成新一代快照，清空日志（调用方持有排他锁） """
+        generation = self.generation + 1
+        with collection._lock:
+            ids = np.asarray(collection._ids, dtype=str)
+            vectors = collection._vectors[:len(collection._ids)]
+            tmp_path = f"{self._snapshot_path(generation)}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, ids=ids, vectors=vectors)
+        os.replace(tmp_path, self._snapshot_path(generation))
+        open(self._log_path(generation), "wb").close()
+
+        meta = self.read_meta(self.meta_path)
+        self._write_meta(dict(meta, generation=generation))
+        for path in (self._snapshot_path(self.generation), self._log_path(self.generation)):
+            if os.path.exists(path):
+                os.remove(path)
+        logger.info(f"集合 {collection.name} 的操作日志已合并为第 {generation} 代快照（{len(ids)} 条）")
+        self.generation, self.offset = generation, 0
+
+
+class VectorCollection:
+    """ 命名向量集合
+
+    向量保存在按容量倍增的连续矩阵中，删除时用最后一行填补空位，保证检索始终是一次连续的矩阵乘法。
+    向量已经过 L2 归一化，检索使用内积。
+    IVF 索引在后台线程中训练，训练期间检索使用暴力检索或上一版索引，训练完成后在锁内原子替换。
+    保存在磁盘上的集合，写入在内存中执行的同时追加到操作日志。
+    """
+
+    def __init__(self, name: str, model_type: str, index_type: str = INDEX_FLAT,
+                 nlist: Optional[int] = None, nprobe: int = IVF_DEFAULT_NPROBE, created_at: Optional[float] = None):
+        self.name = name
+        self.model_type = model_type
+        self.index_type = index_type
+        self.dimension = 0
+        self.created_at = created_at or time.time()
+
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.empty((0, 0), dtype=np.float32)
+        # 每行所属的 IVF 聚类，未训练时为 -1
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._nlist = nlist
+        self._ivf = _IVFIndex(nlist or 0, nprobe) if index_type == INDEX_IVF else None
+        # 后台训练期间内容发生变化的行，替换索引时需要重新计算聚类归属
+        self._stale: Optional[np.ndarray] = None
+        self._training = False
+        # 写入与检索可能在不同线程中执行
+        self._lock = threading.RLock()
+        # 磁盘上的快照与操作日志，集合只保存在内存中时为 None
+        self._journal: Optional[_Journal] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _ensure_capacity(self, size: int):
+        """ 按需扩容，容量倍增 """
+        if size <= self._vectors.shape[0]:
+            return
+        capacity = max(size, self._vectors.shape[0] * 2, 1024)
+        vectors = np.empty((capacity, self.dimension), dtype=np.float32)
+        vectors[:len(self._ids)] = self._vectors[:len(self._ids)]
+        assignments = np.full(capacity, -1, dtype=np.int32)
+        assignments[:len(self._ids)] = self._assignments[:len(self._ids)]
+        self._vectors, self._assignments = vectors, assignments
+        if self._stale is not None:
+            stale = np.ones(capacity, dtype=bool)
+            stale[:len(self._stale)] = self._stale
+            self._stale = stale
+
+    def _reset(self):
+        """ 清空内容，从新一代快照重新加载之前调用 """
+        with self._lock:
+            self.dimension = 0
+            self._ids, self._rows = [], {}
+            self._vectors = np.empty((0, 0), dtype=np.float32)
+            self._assignments = np.empty(0, dtype=np.int32)
+            if self._ivf is not None:
+                self._ivf = _IVFIndex(self._nlist or 0, self._ivf.nprobe)
+            # 训练中的索引替换时全部行重新计算归属
+            self._stale = np.ones(0, dtype=bool) if self._training else None
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, overwrite: bool = True) -> Tuple[int, int]:
+        """ 写入向量，已存在的 id 覆盖
+        :return: (新增数量, 更新数量)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(ids) != vectors.shape[0]:
+            raise ValidationException("id 数量与向量数量不一致")
+        if len(set(ids)) != len(ids):
+            raise ValidationException("同一批写入中存在重复的 id")
+
+        if self._journal is None:
+            return self._apply_upsert(ids, vectors, overwrite)
+        with self._journal.writing(self):
+            result = self._apply_upsert(ids, vectors, overwrite)
+            self._journal.append(self, _OP_UPSERT, ids, vectors)
+        return result
+
+    def _apply_upsert(self, ids: List[str], vectors: np.ndarray, overwrite: bool) -> Tuple[int, int]:
+        """ 在内存中写入向量 """
+        with self._lock:
+            if not self.dimension:
+                self.dimension = vectors.shape[1]
+                self._vectors = np.empty((0, self.dimension), dtype=np.float32)
+            if vectors.shape[1] != self.dimension:
+                raise ValidationException(f"向量维度 {vectors.shape[1]} 与集合维度 {self.dimension} 不一致")
+            if not overwrite:
+                existing = [i for i in ids if i in self._rows]
+                if existing:
+                    raise ValidationException(f"id 已存在: {existing[:10]}")
+
+            self._ensure_capacity(len(self._ids) + len(ids))
+
+            rows, inserted = [], 0
+            for item_id in ids:
+                row = self._rows.get(item_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._rows[item_id] = row
+                    self._ids.append(item_id)
+                    inserted += 1
+                rows.append(row)
+
+            rows = np.asarray(rows)
+            self._vectors[rows] = vectors
+            if self._stale is not None:
+                self._stale[rows] = True
+            if self._ivf is not None and self._ivf.trained:
+                for row, cluster in zip(rows.tolist(), self._ivf.assign(vectors).tolist()):
+                    self._ivf.move(row, int(self._assignments[row]), cluster)
+                    self._assignments[row] = cluster
+
+            self._maybe_train()
+            return inserted, len(ids) - inserted
+
+    def delete(self, ids: List[str]) -> int:
+        """ 删除向量，返回实际删除的数量 """
+        if self._journal is None:
+            return self._apply_delete(ids)
+        with self._journal.writing(self):
+            deleted = self._apply_delete(ids)
+            if deleted:
+                self._journal.append(self, _OP_DELETE, ids)
+        return deleted
+
+    def _apply_delete(self, ids: List[str]) -> int:
+        """ 在内存中删除向量 """
+        deleted = 0
+        with self._lock:
+            for item_id in ids:
+                row = self._rows.pop(item_id, None)
+                if row is None:
+                    continue
+                last = len(self._ids) - 1
+                trained = self._ivf is not None and self._ivf.trained
+                if trained:
+                    self._ivf.move(row, int(self._assignments[row]), -1)
+                if row != last:
+                    # 用最后一行填补空位
+                    moved_id = self._ids[last]
+                    self._ids[row] = moved_id
+                    self._rows[moved_id] = row
+                    self._vectors[row] = self._vectors[last]
+                    self._assignments[row] = self._assignments[last]
+                    if trained:
+                        self._ivf.move(last, int(self._assignments[last]), -1)
+                        self._ivf.move(row, -1, int(self._assignments[row]))
+                    if self._stale is not None:
+                        self._stale[row] = True
+                self._assignments[last] = -1
+                self._ids.pop()
+                deleted += 1
+        return deleted
+
+    def get(self, ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """ 读取向量，返回 (存在的 id, 向量矩阵) """
+        with self._lock:
+            found = [item_id for item_id in ids if item_id in self._rows]
+            rows = [self._rows[item_id] for item_id in found]
+            return found, self._vectors[rows].copy()
+
+    def matrix(self) -> np.ndarray:
+        """ 读取全部向量的副本 """
+        with self._lock:
+            return self._vectors[:len(self._ids)].copy()
+
+    def _maybe_train(self):
+        """ IVF 索引：达到训练阈值或数据量翻倍后，在后台线程中重新训练（调用方持有锁） """
+        size = len(self._ids)
+        if self._ivf is None or self._training or size < IVF_MIN_TRAIN_SIZE:
+            return
+        if self._ivf.trained and size < self._ivf.trained_size * 2:
+            return
+
+        self._training = True
+        threading.Thread(target=self.train_index, name=f"ivf-train-{self.name}", daemon=True).start()
+
+    def train_index(self):
+        """ 训练 IVF 索引并原子替换
+
+        只在读取样本、分块读取向量与最终替换时短暂持有锁，聚类训练与归属计算都在锁外进行，
+        训练期间的写入与检索不被阻塞。训练期间内容发生变化的行记录在 _stale 中，替换时在锁内重新计算归属。
+        """
+        with self._lock:
+            size = len(self._ids)
+            if self._ivf is None or not size:
+                self._training = False
+                return
+            self._training = True
+            self._stale = np.zeros(self._vectors.shape[0], dtype=bool)
+            rng = np.random.default_rng(0)
+            rows = rng.choice(size, _IVF_TRAIN_SAMPLE, replace=False) if size > _IVF_TRAIN_SAMPLE else slice(0, size)
+            sample = self._vectors[rows].copy()
+            # 默认聚类数取 4 * sqrt(N)
+            index = _IVFIndex(self._nlist or int(4 * np.sqrt(size)), self._ivf.nprobe)
+
+        try:
+            index.train(sample, size)
+            del sample
+            assignments = np.full(size, -1, dtype=np.int32)
+            for begin in range(0, size, _IVF_CHUNK_SIZE):
+                with self._lock:
+                    chunk = self._vectors[begin:min(begin + _IVF_CHUNK_SIZE, size, len(self._ids))].copy()
+                assignments[begin:begin + len(chunk)] = index.assign(chunk)
+
+            with self._lock:
+                size = len(self._ids)
+                current = np.full(self._vectors.shape[0], -1, dtype=np.int32)
+                keep = min(size, len(assignments))
+                current[:keep] = assignments[:keep]
+                # 训练期间新增、覆盖或被移动过的行重新计算归属
+                redo = np.flatnonzero((current[:size] < 0) | self._stale[:size])
+                if len(redo):
+                    current[redo] = index.assign(self._vectors[redo])
+                index.build_lists(current[:size])
+                self._ivf, self._assignments = index, current
+        except Exception as e:
+            logger.error(f"集合 {self.name} 的 IVF 索引训练失败: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._stale = None
+                self._training = False
+
+    def search(self, queries: np.ndarray, top_k: int, nprobe: Optional[int] = None
+               ) -> List[List[Tuple[str, float]]]:
+        """ 内积检索，返回每个查询的 [(id, score), ...]，按分数从高到低排列 """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            size = len(self._ids)
+            if not size:
+                return [[] for _ in range(len(queries))]
+            if queries.shape[1] != self.dimension:
+                raise ValidationException(f"查询向量维度 {queries.shape[1]} 与集合维度 {self.dimension} 不一致")
+
+            if self._ivf is not None and self._ivf.trained:
+                return self._search_ivf(queries, top_k, nprobe or self._ivf.nprobe)
+
+            scores = queries @ self._vectors[:size].T
+            indices = top_k_indices(scores, top_k)
+            return [
+                [(self._ids[i], float(scores[q, i])) for i in indices[q]]
+                for q in range(len(queries))
+            ]
+
+    def _search_ivf(self, queries: np.ndarray, top_k: int, nprobe: int) -> List[List[Tuple[str, float]]]:
+        """ IVF 近似检索：只计算探查聚类倒排表中的向量 """
+        probes = self._ivf.probe(queries, nprobe)
+        results = []
+        for q, query in enumerate(queries):
+            candidates = self._ivf.candidates(probes[q])
+            if not len(candidates):
+                results.append([])
+                continue
+            scores = self._vectors[candidates] @ query
+            best = top_k_indices(scores[np.newaxis, :], top_k)[0]
+            results.append([(self._ids[candidates[i]], float(scores[i])) for i in best])
+        return results
+
+    def stats(self) -> dict:
+        """ 集合信息 """
+        with self._lock:
+            return {
+                "name": self.name,
+                "model_type": self.model_type,
+                "index_type": self.index_type,
+                "dimension": self.dimension,
+                "count": len(self._ids),
+                "ivf_trained": bool(self._ivf is not None and self._ivf.trained),
+                "ivf_nlist": self._ivf.nlist if self._ivf is not None and self._ivf.trained else None,
+                "ivf_training": self._training,
+                "created_at": self.created_at,
+            }
+
+
+class VectorStore:
+    """ 命名向量集合的注册表
+
+    配置了保存目录时，集合的创建、写入与删除都保存到磁盘，获取集合时重放其他工作进程的变化；
+    目录为空时集合只保存在当前进程的内存中。
+    """
+
+    def __init__(self, directory: str = COLLECTION_DIR):
+        self._directory = directory
+        self._collections: Dict[str, VectorCollection] = {}
+        self._lock = threading.Lock()
+
+    def create(self, name: str, model_type: str, index_type: str = INDEX_FLAT,
+               nlist: Optional[int] = None, nprobe: int = IVF_DEFAULT_NPROBE) -> VectorCollection:
+        """ 创建集合 """
+        if index_type not in SUPPORTED_INDEX_TYPES:
+            raise BasRequestException(f"不支持的索引类型 {index_type}，可选项: {list(SUPPORTED_INDEX_TYPES)}")
+
+        collection = VectorCollection(name, model_type, index_type, nlist, nprobe)
+        with self._lock:
+            if not self._directory:
+                if name in self._collections:
+                    raise BasRequestException(f"集合 {name} 已存在")
+            else:
+                journal = _Journal(self._directory, name)
+                with _file_lock(self._directory, exclusive=True):
+                    if os.path.exists(journal.meta_path):
+                        raise BasRequestException(f"集合 {name} 已存在")
+                    journal.create({"name": name, "model_type": model_type, "index_type": index_type,
+                                    "nlist": nlist, "nprobe": nprobe, "created_at": collection.created_at})
+                collection._journal = journal
+            self._collections[name] = collection
+        logger.info(f"创建向量集合 {name}（模型 {model_type}，索引 {index_type}）")
+        return collection
+
+    def get(self, name: str) -> VectorCollection:
+        """ 获取集合，不存在时抛出 NotFoundException；保存在磁盘上的集合先重放其他进程的变化 """
+        with self._lock:
+            collection = self._collections.get(name)
+            if not self._directory:
+                if collection is None:
+                    raise NotFoundException(f"集合 {name} 不存在")
+                return collection
+            if collection is not None and not collection._journal.changed():
+                return collection
+
+            with _file_lock(self._directory, exclusive=False):
+                meta = _Journal.read_meta(f"{_Journal.stem(self._directory, name)}.json")
+                if meta is None:
+                    self._collections.pop(name, None)
+                    raise NotFoundException(f"集合 {name} 不存在")
+                if collection is None or collection.created_at != meta["created_at"]:
+                    # 首次在本进程中使用，或者集合被删除后重新创建
+                    collection = VectorCollection(name, meta["model_type"], meta["index_type"], meta["nlist"],
+                                                  meta["nprobe"], created_at=meta["created_at"])
+                    collection._journal = _Journal(self._directory, name)
+                collection._journal.catch_up(collection)
+            self._collections[name] = collection
+            return collection
+
+    def drop(self, name: str):
+        """ 删除集合 """
+        with self._lock:
+            if not self._directory:
+                if self._collections.pop(name, None) is None:
+                    raise NotFoundException(f"集合 {name} 不存在")
+            else:
+                journal = _Journal(self._directory, name)
+                with _file_lock(self._directory, exclusive=True):
+                    if not os.path.exists(journal.meta_path):
+                        raise NotFoundException(f"集合 {name} 不存在")
+                    journal.remove()
+                self._collections.pop(name, None)
+        logger.info(f"删除向量集合 {name}")
+
+    def names(self) -> List[str]:
+        """ 全部集合的名称 """
+        if not self._directory:
+            with self._lock:
+                return list(self._collections)
+        try:
+            file_names = sorted(os.listdir(self._directory))
+        except OSError:
+            return []
+        metas = [_Journal.read_meta(os.path.join(self._directory, file_name))
+                 for file_name in file_names if file_name.endswith(".json")]
+        return [meta["name"] for meta in metas if meta is not None]
+
+    def list(self) -> List[dict]:
+        """ 列出全部集合 """
+        stats = []
+        for name in self.names():
+            try:
+                stats.append(self.get(name).stats())
+            except NotFoundException:
+                # 列出期间被其他进程删除
+                continue
+        return stats
+
+    def preload(self):
+        """ 加载磁盘上的全部集合（阻塞），工作进程启动时在线程中执行，避免首个请求在事件循环中重放 """
+        try:
+            count = len(self.list())
+        except Exception as e:
+            logger.warning(f"加载向量集合失败: {e}", exc_info=True)
+            return
+        if count:
+            logger.info(f"已从 {self._directory} 加载 {count} 个向量集合")
+
+
+@lru_cache()
+def get_vector_store() -> VectorStore:
+    """ 获取向量集合注册表（进程内单例） """
+    return VectorStore()
@@ -6,14 +6,31 @@
 @File   : gunicorn.conf.py
 @Desc   : 
 """
-import multiprocessing
+import os
+import sys
+import shutil
+import subprocess
+
+# 多个工作进程的监控指标快照目录，/metrics 汇总全部进程；需要在导入 core.config 之前设置
+os.environ.setdefault("CLIP_METRICS_DIR", "/dev/shm/neon_chinese_clip_metrics")
+
+# 配置文件与项目代码在同一目录，导入项目模块
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.autotune import load_tuned  # noqa: E402
+from core.config import AUTOTUNE, DEFAULT_MODEL_TYPE, SHARED_WEIGHTS, THREADS_PER_WORKER  # noqa: E402
+from core.cpu_topology import configure_worker, physical_cores  # noqa: E402
+from core.readiness import get_startup_state  # noqa: E402
 
 # 服务器绑定地址
 bind = "0.0.0.0:7001"
 
-# Chinese-CLIP 内存占用大，建议减少工作进程数
-# 默认使用 1-2 个工作进程，避免内存不足
-workers = min(multiprocessing.cpu_count(), 2)  # 限制为2个进程
+# 共享权重时各工作进程映射同一份权重文件，工作进程数按物理核数扩展，每个进程分到若干个物理核；
+# 否则每个进程持有一份私有权重，限制为 2 个进程，避免内存不足。开启 CLIP_AUTOTUNE 时由实测结果决定
+_physical_cores = len(physical_cores())
+workers = int(os.getenv("CLIP_WORKERS", "0")) or (
+    max(1, _physical_cores // 2) if SHARED_WEIGHTS else min(_physical_cores, 2)
+)
 
 # 工作进程类
 worker_class = "uvicorn.workers.UvicornWorker"
@@ -26,7 +43,8 @@ graceful_timeout = 60
 max_requests = 500
 max_requests_jitter = 50
 
-# 预加载应用，避免每个进程都加载模型
+# 预加载应用代码，工作进程 fork 后共享已导入的模块；模型在各工作进程启动后的后台任务中加载，
+# 权重文件以 mmap 映射，物理内存只占一份。应用代码不再连带导入推理依赖，由 when_ready 在主进程中单独导入
 preload_app = True
 
 # 保持连接时间（秒）
@@ -43,8 +61,55 @@ worker_tmp_dir = "/dev/shm"  # 使用内存文件系统
 # 进程名
 proc_name = "neon_chinese_clip"
 
-# 环境变量
-raw_env = [
-    "OMP_NUM_THREADS=1",  # 限制 OpenMP 线程数
-    "MKL_NUM_THREADS=1",  # 限制 MKL 线程数
-]
\ No newline at end of file
+# 推理线程数不再通过 OMP_NUM_THREADS 固定为 1，由 post_fork 按分到的物理核数为每个工作进程单独设置
+
+
+def on_starting(server):
+    """ 主进程启动时清理上次运行残留的指标快照，并预先导出默认模型的共享权重，避免多个工作进程同时导出
+
+    导出在独立的子进程中执行，主进程不做任何张量计算，fork 出的工作进程不会继承 OpenMP 线程状态。
+    """
+    shutil.rmtree(os.environ["CLIP_METRICS_DIR"], ignore_errors=True)
+    if SHARED_WEIGHTS:
+        server.log.info(f"导出 {DEFAULT_MODEL_TYPE} 模型的共享权重...")
+        subprocess.run([sys.executable, "-m", "core.shared_weights", DEFAULT_MODEL_TYPE], check=True)
+
+    # 每个工作进程的推理线程数，0 表示按分到的物理核数
+    server.cpu_threads = THREADS_PER_WORKER
+    if not AUTOTUNE:
+        return
+
+    tuned = load_tuned(DEFAULT_MODEL_TYPE)
+    if tuned is None:
+        server.log.info(f"在 {DEFAULT_MODEL_TYPE} 模型上自动调优工作进程数与线程数...")
+        # 调优失败不影响启动，使用默认配置
+        result = subprocess.run([sys.executable, "-m", "core.autotune", DEFAULT_MODEL_TYPE])
+        if result.returncode:
+            server.log.warning(f"自动调优失败（退出码 {result.returncode}）")
+        tuned = load_tuned(DEFAULT_MODEL_TYPE)
+    if tuned is None:
+        server.log.warning("没有可用的自动调优结果，使用默认配置")
+        return
+    server.num_workers = tuned["workers"]
+    server.cpu_threads = tuned["threads"]
+    server.log.info(f"自动调优结果: {tuned['workers']} 个工作进程 x {tuned['threads']} 个线程")
+
+
+def when_ready(server):
+    """ 监听端口后、创建工作进程前，在主进程中导入推理依赖（torch、torchvision、cn_clip）
+
+    只导入模块，不做任何张量计算；工作进程 fork 后直接继承，重启的工作进程也不需要重新导入。
+    """
+    server.log.info("导入推理依赖...")
+    get_startup_state().import_engine()
+
+
+def pre_fork(server, worker):
+    """ 为新的工作进程分配编号：取最小的空闲编号，重启的工作进程沿用退出进程的物理核 """
+    used = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(used) + 1) if slot not in used)
+
+
+def post_fork(server, worker):
+    """ 工作进程 fork 后、加载模型前，按编号分配物理核并设置推理线程数 """
+    server.log.info(configure_worker(worker.cpu_slot, server.num_workers, getattr(server, "cpu_threads", 0)))
@@ -0,0 +1,8 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:10
+@Author : YangFei
+@File   : __init__.py
+@Desc   : 行为测试：只依赖 numpy 的模块直接测试，依赖 torch / cn_clip 的测试在缺少依赖时跳过
+"""
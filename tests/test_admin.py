@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 03:05
+@Author : YangFei
+@File   : test_admin.py
+@Desc   : 管理接口的访问校验：未配置令牌时不启用，令牌不一致时拒绝
+"""
+import asyncio
+
+import pytest
+
+from app import service_dependencies
+from core.exceptions import ForbiddenException, NotFoundException
+
+
+def test_admin_is_disabled_without_token(monkeypatch):
+    """ 未配置 CLIP_ADMIN_TOKEN 时，不论是否携带令牌都返回 404 """
+    monkeypatch.setattr(service_dependencies, "ADMIN_TOKEN", "")
+    for token in (None, "", "anything"):
+        with pytest.raises(NotFoundException):
+            asyncio.run(service_dependencies.require_admin(token))
+
+
+def test_admin_requires_matching_token(monkeypatch):
+    """ 配置了令牌时，缺少或不一致的令牌返回 403，一致时通过 """
+    monkeypatch.setattr(service_dependencies, "ADMIN_TOKEN", "secret")
+    for token in (None, "", "wrong"):
+        with pytest.raises(ForbiddenException):
+            asyncio.run(service_dependencies.require_admin(token))
+    asyncio.run(service_dependencies.require_admin("secret"))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:12
+@Author : YangFei
+@File   : test_batching.py
+@Desc   : 微批调度器：大批量提交的切片、优先级插队与结果合并
+"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from core.batching import MicroBatchScheduler
+from core.priority import PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+class _Recorder:
+    """ 记录每个批次的执行函数，返回每个条目的编号作为向量 """
+
+    def __init__(self, delay: float = 0.005):
+        self.batches = []
+        self._delay = delay
+
+    async def __call__(self, model_type, modality, items):
+        self.batches.append(list(items))
+        await asyncio.sleep(self._delay)
+        return np.array([[value] for _, value in items], dtype=np.float32)
+
+
+def test_bulk_submission_is_sliced_and_merged_in_order():
+    """ 超过单批上限的提交切成多个批次，结果按原始顺序合并 """
+    recorder = _Recorder()
+
+    async def run():
+        scheduler = MicroBatchScheduler(recorder, max_batch_size=16, max_wait_ms=1)
+        try:
+            return await scheduler.submit("mini", "image", [("bulk", i) for i in range(100)],
+                                          priority=PRIORITY_BULK, deadline_ms=0)
+        finally:
+            await scheduler.shutdown()
+
+    outputs = asyncio.run(run())
+    assert outputs[:, 0].tolist() == list(range(100))
+    assert all(len(batch) <= 16 for batch in recorder.batches)
+    assert sum(len(batch) for batch in recorder.batches) == 100
+
+
+def test_interactive_request_runs_between_bulk_slices():
+    """ 大批量提交排队时，交互请求不需要等全部批量条目推理完成 """
+    recorder = _Recorder()
+
+    async def run():
+        scheduler = MicroBatchScheduler(recorder, max_batch_size=16, max_wait_ms=1, bulk_share=0.5)
+        try:
+            bulk = asyncio.create_task(scheduler.submit("mini", "image", [("bulk", i) for i in range(256)],
+                                                        priority=PRIORITY_BULK, deadline_ms=0))
+            await asyncio.sleep(0)
+            await scheduler.submit("mini", "image", [("interactive", 0)], priority=PRIORITY_INTERACTIVE,
+                                   deadline_ms=0)
+            await bulk
+        finally:
+            await scheduler.shutdown()
+
+    asyncio.run(run())
+    position = next(i for i, batch in enumerate(recorder.batches) if batch[0][0] == "interactive")
+    bulk_before = sum(len(batch) for batch in recorder.batches[:position])
+    assert bulk_before <= 16
+    assert all(kind == "bulk" for batch in recorder.batches if batch[0][0] == "bulk" for kind, _ in batch)
+
+
+def test_merged_batches_do_not_exceed_max_batch_size():
+    """ 并发的小请求合并成批次时，批次大小不超过上限 """
+    recorder = _Recorder()
+
+    async def run():
+        scheduler = MicroBatchScheduler(recorder, max_batch_size=8, max_wait_ms=20)
+        try:
+            await asyncio.gather(*[scheduler.submit("mini", "text", [("text", i)] * 3, deadline_ms=0)
+                                   for i in range(10)])
+        finally:
+            await scheduler.shutdown()
+
+    asyncio.run(run())
+    assert all(len(batch) <= 8 for batch in recorder.batches)
+
+
+def test_failed_slice_fails_the_whole_submission():
+    """ 任一切片推理失败时整个提交以该异常结束 """
+
+    async def runner(model_type, modality, items):
+        if any(value == 20 for value in items):
+            raise RuntimeError("推理失败")
+        return np.zeros((len(items), 1), dtype=np.float32)
+
+    async def run():
+        scheduler = MicroBatchScheduler(runner, max_batch_size=16, max_wait_ms=1)
+        try:
+            await scheduler.submit("mini", "image", list(range(64)), priority=PRIORITY_BULK, deadline_ms=0)
+        finally:
+            await scheduler.shutdown()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
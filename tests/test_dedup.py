@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:25
+@Author : YangFei
+@File   : test_dedup.py
+@Desc   : 近重复检测：感知哈希分桶的候选对召回、超大桶的限制、分组合并与推理解码中的哈希计算
+"""
+import io
+import itertools
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from core.dedup import HASH_BITS, MAX_DISTANCE_LIMIT, candidate_pairs, effective_bands, group_pairs, hamming
+from core.image_decode import load_image, load_image_with_hash, perceptual_hash
+
+
+def _flip(value: int, bits) -> int:
+    for bit in bits:
+        value ^= 1 << int(bit)
+    return value
+
+
+def _hashes_with_neighbours(distances, count: int = 150, seed: int = 0):
+    """ 随机哈希，以及与之距离为 distances 中各值的变体 """
+    rng = np.random.default_rng(seed)
+    hashes = []
+    for base in rng.integers(0, 2 ** 63, count, dtype=np.int64).tolist():
+        hashes.append(base)
+        for distance in distances:
+            hashes.append(_flip(base, rng.choice(HASH_BITS, distance, replace=False)))
+    return hashes
+
+
+def _brute_force(hashes, max_distance):
+    return sorted((i, j) for i, j in itertools.combinations(range(len(hashes)), 2)
+                  if hashes[i] is not None and hashes[j] is not None and hamming(hashes[i], hashes[j]) <= max_distance)
+
+
+@pytest.mark.parametrize("max_distance", [0, 3, 4, 8, 12, 16])
+def test_candidate_pairs_has_full_recall(max_distance):
+    """ 距离不超过 max_distance 的图像对全部进入候选对，且不包含距离更大的对 """
+    hashes = _hashes_with_neighbours([max(0, max_distance - 1), max_distance, max_distance + 1])
+    assert candidate_pairs(hashes, max_distance, bands=4) == (_brute_force(hashes, max_distance), 0)
+
+
+def test_bands_cover_max_distance():
+    """ 实际分段数不少于 max_distance + 1 """
+    assert effective_bands(12, 4) == 13
+    assert effective_bands(2, 4) == 4
+    with pytest.raises(ValueError):
+        effective_bands(MAX_DISTANCE_LIMIT + 1, 4)
+
+
+def test_candidate_pairs_skips_missing_hashes():
+    """ 哈希为 None 的图像不参与分桶 """
+    hashes = [5, None, 5, None, 7]
+    assert candidate_pairs(hashes, 1) == ([(0, 2), (0, 4), (2, 4)], 0)
+    assert candidate_pairs([None, 3], 4) == ([], 0)
+
+
+def test_moderate_bucket_is_compared_in_full():
+    """ 成员数不超过 full_compare_size 的桶内两两比较，即使超过 max_bucket_span 也不会漏掉候选对 """
+    hashes = [_flip(0, [bit]) for bit in range(40)] + _hashes_with_neighbours([2], count=20, seed=1)
+    pairs, truncated = candidate_pairs(hashes, 2, bands=4, max_bucket_span=4, full_compare_size=64)
+    assert truncated == 0
+    assert pairs == _brute_force(hashes, 2)
+
+
+def test_oversized_bucket_is_capped():
+    """ 超大桶中每个成员只与有限个相邻成员比较，候选对数与图像数成线性关系，截断的成员数随结果返回 """
+    pairs, truncated = candidate_pairs([0] * 2000, 4, max_bucket_span=16, full_compare_size=1000)
+    assert len(pairs) <= 2000 * 16
+    # 5 个段中各有 2000 - 1 - 16 个成员在第 16 个相邻成员之后仍有同桶成员
+    assert truncated == 5 * (2000 - 1 - 16)
+    assert len(set(pairs)) == len(pairs)
+    assert all(i < j for i, j in pairs)
+    # 截断之后仍然连通，并查集合并为同一组
+    assert group_pairs(2000, pairs) == [list(range(2000))]
+
+
+def test_group_pairs_uses_smallest_index_as_root():
+    """ 并查集分组：组内与组间都按下标排序，单独的图像不成组 """
+    assert group_pairs(6, [(4, 5), (1, 3), (3, 5), (0, 2)]) == [[0, 2], [1, 3, 4, 5]]
+    assert group_pairs(3, []) == []
+
+
+def test_hash_computed_during_embedding_decode():
+    """ 推理的解码中一并计算的哈希与单独计算的一致（PNG 没有 draft 缩小解码），预处理结果不变 """
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (64, 96, 3), dtype=np.uint8)).save(buffer, format="PNG")
+    data = buffer.getvalue()
+
+    tensor, value = load_image_with_hash(data, lambda image: image.size, 32)
+    assert tensor == load_image(data, lambda image: image.size, 32) == (96, 64)
+    assert value == perceptual_hash(data)
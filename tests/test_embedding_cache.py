@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:38
+@Author : YangFei
+@File   : test_embedding_cache.py
+@Desc   : 向量磁盘缓存：过期条目的删除与条目数上限
+"""
+import sqlite3
+import time
+
+import numpy as np
+
+from core.embedding_cache import _SqliteTier
+
+
+def _count(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+def test_disk_tier_is_bounded(tmp_path, monkeypatch):
+    """ 写入超过上限后按写入时间删除最早的条目 """
+    monkeypatch.setattr(_SqliteTier, "_PRUNE_INTERVAL", 10)
+    path = str(tmp_path / "cache.db")
+    tier = _SqliteTier(path, ttl_seconds=0, max_entries=25)
+    for batch in range(10):
+        tier.put_many([(f"k{batch}-{i}", np.full(4, batch, dtype=np.float32)) for i in range(10)])
+    tier.close()
+
+    assert _count(path) <= 25 + 10
+    tier = _SqliteTier(path, ttl_seconds=0, max_entries=25)
+    assert _count(path) == 25
+    # 保留的是最近写入的条目
+    assert tier.get_many(["k0-0"]) == [None]
+    assert np.allclose(tier.get_many(["k9-9"])[0], 9)
+    tier.close()
+
+
+def test_disk_tier_deletes_expired_rows(tmp_path):
+    """ 启动时删除过期的条目，而不是只在读取时忽略 """
+    path = str(tmp_path / "cache.db")
+    tier = _SqliteTier(path, ttl_seconds=60, max_entries=0)
+    tier.put_many([("old", np.ones(4, dtype=np.float32)), ("new", np.ones(4, dtype=np.float32))])
+    tier.close()
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE embeddings SET created_at = ? WHERE key = 'old'", (time.time() - 3600,))
+
+    tier = _SqliteTier(path, ttl_seconds=60, max_entries=0)
+    assert _count(path) == 1
+    assert tier.get_many(["old", "new"])[0] is None
+    tier.close()
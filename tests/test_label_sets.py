@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 04:10
+@Author : YangFei
+@File   : test_label_sets.py
+@Desc   : 零样本分类标签集：保存在共享目录中，按缓存命名空间保存向量矩阵，替换后旧矩阵失效
+"""
+import numpy as np
+import pytest
+
+from core.exceptions import NotFoundException, ValidationException
+from core.label_sets import LabelSetStore
+
+
+def test_label_sets_are_shared_between_workers(tmp_path):
+    """ 一个工作进程注册的标签集与计算的向量矩阵，另一个工作进程（或重启后的进程）可以直接使用 """
+    worker_a, worker_b = LabelSetStore(str(tmp_path)), LabelSetStore(str(tmp_path))
+    label_set = worker_a.put("animals", ["猫", "狗"], "一张{}的照片")
+    matrix = np.eye(2, 4, dtype=np.float32)
+    label_set.set_embeddings("base@fp32#1-2", matrix)
+
+    shared = worker_b.get("animals")
+    assert shared.prompts == ["一张猫的照片", "一张狗的照片"]
+    assert np.array_equal(shared.get_embeddings("base@fp32#1-2"), matrix)
+    assert shared.get_embeddings("base@int8#1-2") is None
+    assert LabelSetStore(str(tmp_path)).get("animals").to_dict()["computed"] == ["base@fp32#1-2"]
+    assert [item["name"] for item in worker_b.list()] == ["animals"]
+
+
+def test_replaced_label_set_drops_old_embeddings(tmp_path):
+    """ 替换标签集后，其他进程读取到新的标签，旧的向量矩阵不再使用 """
+    worker_a, worker_b = LabelSetStore(str(tmp_path)), LabelSetStore(str(tmp_path))
+    worker_a.put("animals", ["猫", "狗"]).set_embeddings("base@fp32#1-2", np.ones((2, 4), dtype=np.float32))
+    old = worker_b.get("animals")
+    assert old.get_embeddings("base@fp32#1-2") is not None
+
+    worker_a.put("animals", ["猫", "狗", "鸟"])
+    # 替换前取得的标签集写入的矩阵不会被新的标签集使用
+    old.set_embeddings("base@fp32#1-2", np.ones((2, 4), dtype=np.float32))
+    replaced = worker_b.get("animals")
+    assert replaced.labels == ["猫", "狗", "鸟"]
+    assert replaced.get_embeddings("base@fp32#1-2") is None
+
+
+def test_dropped_label_set_is_gone_everywhere(tmp_path):
+    """ 删除后其他进程也返回 404 """
+    worker_a, worker_b = LabelSetStore(str(tmp_path)), LabelSetStore(str(tmp_path))
+    worker_a.put("animals", ["猫"])
+    worker_b.get("animals")
+    worker_a.drop("animals")
+    with pytest.raises(NotFoundException):
+        worker_b.get("animals")
+    with pytest.raises(NotFoundException):
+        worker_b.drop("animals")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_labels_are_validated(tmp_path):
+    """ 重复标签或模板缺少占位符时拒绝 """
+    store = LabelSetStore(str(tmp_path))
+    with pytest.raises(ValidationException):
+        store.put("animals", ["猫", "猫"])
+    with pytest.raises(ValidationException):
+        store.put("animals", ["猫"], "一张照片")
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:34
+@Author : YangFei
+@File   : test_projection.py
+@Desc   : 向量降维：PCA 投影的方向、输出维度校验、归一化与保存加载
+"""
+import numpy as np
+import pytest
+
+from core.exceptions import ValidationException
+from core.projection import METHOD_PCA, METHOD_RANDOM, Projection, fit_pca, random_orthogonal
+
+
+def _anisotropic_vectors(count: int = 2000, dimension: int = 16, seed: int = 0) -> np.ndarray:
+    """ 各维方差依次递减的向量，主成分即坐标轴 """
+    rng = np.random.default_rng(seed)
+    scales = np.linspace(10, 1, dimension)
+    return (rng.standard_normal((count, dimension)) * scales).astype(np.float32)
+
+
+def test_fit_pca_orders_components_by_variance():
+    """ 主成分按方差从大到小排列，方差占比单调递减 """
+    mean, components, ratio = fit_pca(_anisotropic_vectors(), 4)
+    assert components.shape == (16, 4)
+    assert np.all(np.diff(ratio) <= 0)
+    for k in range(4):
+        assert abs(components[k, k]) > 0.95
+
+
+def test_project_reduces_and_normalizes():
+    """ 投影到前 output_dim 维后重新 L2 归一化，单个向量与矩阵输入都支持 """
+    vectors = _anisotropic_vectors()
+    mean, components, ratio = fit_pca(vectors, 8)
+    projection = Projection("mini", METHOD_PCA, mean, components, ratio, corpus_size=len(vectors))
+
+    reduced = projection.project(vectors[:10], 4)
+    assert reduced.shape == (10, 4)
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-5)
+    assert projection.project(vectors[0], 4).shape == (4,)
+    # 前几维的结果与更高维结果的前几维方向一致
+    higher = projection.project(vectors[:10], 8)[:, :4]
+    assert np.allclose(reduced, higher / np.linalg.norm(higher, axis=1, keepdims=True), atol=1e-5)
+
+
+def test_project_validates_dimensions():
+    """ output_dim 超出范围或输入维度不一致时抛出 ValidationException """
+    projection = Projection("mini", METHOD_RANDOM, np.zeros(16), random_orthogonal(16, 8))
+    with pytest.raises(ValidationException):
+        projection.project(np.ones((2, 16)), 9)
+    with pytest.raises(ValidationException):
+        projection.project(np.ones((2, 16)), 0)
+    with pytest.raises(ValidationException):
+        projection.project(np.ones((2, 12)), 4)
+
+
+def test_random_orthogonal_columns_are_orthonormal():
+    """ 随机正交投影的列向量两两正交且为单位长度 """
+    matrix = random_orthogonal(32, 8, seed=3)
+    assert np.allclose(matrix.T @ matrix, np.eye(8), atol=1e-5)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    """ 保存再加载后投影结果不变 """
+    vectors = _anisotropic_vectors()
+    mean, components, ratio = fit_pca(vectors, 8)
+    projection = Projection("mini", METHOD_PCA, mean, components, ratio, corpus_size=len(vectors),
+                            recall={"64": 0.9})
+    path = str(tmp_path / "mini.npz")
+    projection.save(path)
+
+    loaded = Projection.load(path)
+    assert loaded.model_type == "mini" and loaded.recall == {"64": 0.9}
+    assert np.allclose(loaded.project(vectors[:5], 8), projection.project(vectors[:5], 8))
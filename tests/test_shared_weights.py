@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:42
+@Author : YangFei
+@File   : test_shared_weights.py
+@Desc   : 权重文件标识：预训练权重更新后，导出文件与缓存命名空间随之变化
+"""
+import os
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("cn_clip")
+
+from cn_clip.clip.utils import _MODELS  # noqa: E402
+
+from core.shared_weights import source_path, weights_identity, weights_path  # noqa: E402
+
+
+def test_source_path_uses_checkpoint_file_name(tmp_path):
+    """ 路径为 cn_clip 下载的文件名 """
+    name = next(iter(_MODELS))
+    _, filename = _MODELS[name]
+    assert source_path(name, str(tmp_path)) == os.path.join(str(tmp_path), filename)
+
+
+def test_identity_changes_with_file(tmp_path):
+    """ 文件内容或修改时间变化后标识变化，导出路径随之变化；文件不存在时标识为空 """
+    path = tmp_path / "model.pt"
+    assert weights_identity(str(path)) == ""
+
+    path.write_bytes(b"a" * 16)
+    first = weights_identity(str(path))
+    path.write_bytes(b"b" * 32)
+    os.utime(path, ns=(1, 1))
+    second = weights_identity(str(path))
+    assert first and second and first != second
+    assert weights_path(str(tmp_path), "base", first) != weights_path(str(tmp_path), "base", second)
+    assert second in weights_path(str(tmp_path), "base", second)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 03:40
+@Author : YangFei
+@File   : test_swap_requests.py
+@Desc   : 模型热切换请求：发布与读取、各工作进程的执行状态，同一个请求在每个进程只执行一次
+"""
+import asyncio
+import json
+import os
+
+import pytest
+
+from core import swap_requests
+from core.swap_requests import SwapRequests
+
+
+def test_publish_and_latest(tmp_path):
+    """ 新的请求覆盖之前的请求，每次发布的 id 不同 """
+    requests = SwapRequests(str(tmp_path))
+    assert requests.latest() is None
+
+    first = requests.publish("base", None, True, True)
+    assert requests.latest() == first
+    second = requests.publish("large", "int8", False, False)
+    assert second["id"] != first["id"]
+    assert SwapRequests(str(tmp_path)).latest() == second
+
+
+def test_statuses_drop_exited_workers(tmp_path, monkeypatch):
+    """ 只返回存活进程的状态，已退出进程的状态文件删除 """
+    requests = SwapRequests(str(tmp_path))
+    requests.write_status("abc", {"model_type": "base", "status": "done"})
+    dead = tmp_path / "worker-999999.json"
+    dead.write_text(json.dumps({"request_id": "abc", "pid": 999999, "status": "loading"}))
+    monkeypatch.setattr(swap_requests, "_pid_alive", lambda pid: pid == os.getpid())
+
+    statuses = requests.statuses()
+    assert [status["pid"] for status in statuses] == [os.getpid()]
+    assert statuses[0]["request_id"] == "abc" and statuses[0]["status"] == "done"
+    assert not dead.exists()
+
+
+@pytest.fixture
+def clip(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("cn_clip")
+    from core import cn_clip
+
+    requests = SwapRequests(str(tmp_path))
+    monkeypatch.setattr(cn_clip, "get_swap_requests", lambda: requests)
+    return cn_clip.ChineseCLIP(shared_weights=False), requests
+
+
+def test_swap_request_is_applied_once_per_worker(clip):
+    """ 轮询到同一个请求时只执行一次，执行结果写入本进程的状态文件 """
+    clip, requests = clip
+    calls = []
+
+    async def hot_swap(model_type, precision=None, make_default=True, warmup=True, report=None):
+        calls.append((model_type, precision, make_default, warmup))
+        report.update(status="done")
+        return report
+
+    clip.hot_swap = hot_swap
+    request = clip.request_hot_swap("base", "fp32", make_default=False, warmup=False)
+
+    async def run():
+        return await clip.apply_swap_request(request), await clip.apply_swap_request(request)
+
+    first, second = asyncio.run(run())
+    assert calls == [("base", "fp32", False, False)]
+    assert first["request_id"] == request["id"] and second is None
+    assert [status["status"] for status in requests.statuses()] == ["done"]
+
+
+def test_new_worker_starts_with_the_latest_request(clip):
+    """ 新启动的工作进程按最近的请求设置精度与默认模型，不再重复执行该请求 """
+    clip, _ = clip
+    request = clip.request_hot_swap("large", "bf16", make_default=True)
+    assert clip._startup_swap_settings(request, "mini") == "large"
+    assert clip.get_precision("large") == "bf16"
+    assert asyncio.run(clip.apply_swap_request(request)) is None
+
+    request = clip.request_hot_swap("base", None, make_default=False)
+    assert clip._startup_swap_settings(request, "mini") == "mini"
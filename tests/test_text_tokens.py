@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:30
+@Author : YangFei
+@File   : test_text_tokens.py
+@Desc   : 文本分桶：按 token 数排序分桶、补齐长度与原始下标的对应关系
+"""
+import pytest
+
+from core.text_tokens import CONTEXT_LENGTH, PAD_TOKEN_ID, length_buckets, padded_length
+
+torch = pytest.importorskip("torch")
+
+
+def _tokens(length: int, fill: int):
+    return tuple([101] + [fill] * (length - 2) + [102])
+
+
+def test_padded_length_rounds_up_to_step():
+    """ 补齐长度向上取整到步长，不超过上下文长度 """
+    assert padded_length(3, 8) == 8
+    assert padded_length(8, 8) == 8
+    assert padded_length(9, 8) == 16
+    assert padded_length(60, 8) == CONTEXT_LENGTH
+
+
+def test_length_buckets_are_ordered_by_length():
+    """ 桶按 token 数从短到长排列，每个桶补齐到桶内最长文本的补齐长度 """
+    lengths = [30, 4, 12, 5, 50, 9, 4]
+    token_ids = [_tokens(length, i + 1) for i, length in enumerate(lengths)]
+    buckets = length_buckets(token_ids, max_batch_size=2)
+
+    order = [i for indexes, _ in buckets for i in indexes]
+    assert sorted(order) == list(range(len(lengths)))
+    assert [lengths[i] for i in order] == sorted(lengths)
+
+    widths = [tensor.shape[1] for _, tensor in buckets]
+    assert widths == sorted(widths)
+    for indexes, tensor in buckets:
+        assert len(indexes) <= 2
+        assert tensor.shape[1] == padded_length(max(lengths[i] for i in indexes))
+        for row, i in enumerate(indexes):
+            assert tuple(tensor[row, :lengths[i]].tolist()) == token_ids[i]
+            assert (tensor[row, lengths[i]:] == PAD_TOKEN_ID).all()
+
+
+def test_length_buckets_full_length():
+    """ full_length 时全部补齐到上下文长度 """
+    token_ids = [_tokens(length, 7) for length in (3, 20, 40)]
+    buckets = length_buckets(token_ids, max_batch_size=8, full_length=True)
+    assert len(buckets) == 1
+    indexes, tensor = buckets[0]
+    assert indexes == [0, 1, 2]
+    assert tensor.shape == (3, CONTEXT_LENGTH)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 04:30
+@Author : YangFei
+@File   : test_uploads.py
+@Desc   : 上传大小限制：multipart 中单个文件超过上限时在接收过程中中止，不会继续读取请求体
+"""
+import asyncio
+from typing import List
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.exceptions import HTTPException
+
+from app.endpoints.uploads import UploadLimitMiddleware, _PartSizeLimit
+from app.errors import register_exception_handlers
+
+
+def _client(max_bytes: int, max_file_bytes: int) -> TestClient:
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(files: List[UploadFile] = File(...)):
+        return {"sizes": [len(await file.read()) for file in files]}
+
+    app.add_middleware(UploadLimitMiddleware, max_bytes=max_bytes, max_file_bytes=max_file_bytes)
+    register_exception_handlers(app)
+    return TestClient(app)
+
+
+def test_part_size_limit_finds_delimiters_across_chunks():
+    """ 分隔符被拆到两个数据块中时也能识别，每个部分单独计数 """
+    limit = _PartSizeLimit(b"xyz", 16)
+    assert limit.feed(b"--xyz\r\nabcdefg\r")
+    assert limit.feed(b"\n--x")
+    assert limit.feed(b"yz" + b"0" * 16)
+    assert not limit.feed(b"A")
+    # 同一个数据块中包含多个部分时逐个检查
+    assert not _PartSizeLimit(b"xyz", 10).feed(b"--xyz" + b"a" * 11 + b"\r\n--xyz" + b"b" * 3)
+    assert _PartSizeLimit(b"xyz", 10).feed(b"--xyz" + b"a" * 10 + b"\r\n--xyz" + b"b" * 10)
+
+
+def test_oversized_file_is_rejected():
+    """ 任一文件超过单个文件上限时返回 413，其他文件正常 """
+    client = _client(max_bytes=0, max_file_bytes=1000)
+    ok = client.post("/upload", files=[("files", ("a.jpg", b"a" * 900, "image/jpeg")),
+                                       ("files", ("b.jpg", b"b" * 900, "image/jpeg"))])
+    assert ok.status_code == 200 and ok.json() == {"sizes": [900, 900]}
+
+    too_big = client.post("/upload", files=[("files", ("a.jpg", b"a" * 900, "image/jpeg")),
+                                            ("files", ("b.jpg", b"b" * 50_000, "image/jpeg"))])
+    assert too_big.status_code == 413
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 4096])
+def test_reading_stops_at_the_oversized_part(chunk_size):
+    """ 超过上限后不再读取后续的数据块 """
+    boundary = b"----boundary"
+    body = (b"--" + boundary + b'\r\nContent-Disposition: form-data; name="files"; filename="a.jpg"\r\n'
+            b"Content-Type: image/jpeg\r\n\r\n" + b"a" * 200_000 + b"\r\n--" + boundary + b"--\r\n")
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    consumed = 0
+
+    async def receive():
+        nonlocal consumed
+        consumed += 1
+        return {"type": "http.request", "body": chunks[consumed - 1], "more_body": consumed < len(chunks)}
+
+    async def app(scope, receive, send):
+        while (await receive())["more_body"]:
+            pass
+
+    middleware = UploadLimitMiddleware(app, max_bytes=0, max_file_bytes=1000)
+    scope = {"type": "http", "headers": [(b"content-type", b"multipart/form-data; boundary=" + boundary)]}
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(middleware(scope, receive, None))
+    assert error.value.status_code == 413
+    assert consumed * chunk_size <= 1000 + 16 * 1024 + 2 * chunk_size
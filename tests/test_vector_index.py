@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@Time   : 2026/10/17 02:18
+@Author : YangFei
+@File   : test_vector_index.py
+@Desc   : 向量集合：IVF 检索与暴力检索的一致性、后台训练与倒排表的维护，以及多个工作进程共享的磁盘存储
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import core.vector_index as vector_index
+from core.exceptions import BasRequestException, NotFoundException, ValidationException
+from core.vector_index import INDEX_FLAT, INDEX_IVF, VectorCollection, VectorStore
+
+
+def _unit_vectors(count: int, dimension: int = 32, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _ids(count: int, prefix: str = "") -> list:
+    return [f"{prefix}{i}" for i in range(count)]
+
+
+def _wait_trained(collection: VectorCollection, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while collection.stats()["ivf_training"] or not collection.stats()["ivf_trained"]:
+        assert time.monotonic() < deadline, "IVF 索引训练超时"
+        time.sleep(0.01)
+
+
+def _brute_force(collection: VectorCollection, queries: np.ndarray, top_k: int):
+    flat = VectorCollection("flat", collection.model_type, INDEX_FLAT)
+    ids = [collection._ids[i] for i in range(len(collection))]
+    flat.upsert(ids, collection.matrix())
+    return flat.search(queries, top_k)
+
+
+def _assert_lists_consistent(collection: VectorCollection):
+    """ 倒排表与每行的聚类归属一致，并且覆盖全部行 """
+    size = len(collection)
+    index = collection._ivf
+    assert sum(len(rows) for rows in index.lists) == size
+    for cluster, rows in enumerate(index.lists):
+        for row in rows:
+            assert row < size and collection._assignments[row] == cluster
+    assert np.array_equal(collection._assignments[:size], index.assign(collection._vectors[:size]))
+
+
+@pytest.fixture
+def small_train_size(monkeypatch):
+    monkeypatch.setattr(vector_index, "IVF_MIN_TRAIN_SIZE", 2000)
+
+
+def test_ivf_probing_all_clusters_matches_brute_force(small_train_size):
+    """ 探查全部聚类时 IVF 检索的结果与暴力检索完全一致 """
+    vectors = _unit_vectors(3000)
+    collection = VectorCollection("ivf", "mini", INDEX_IVF, nlist=16, nprobe=16)
+    collection.upsert(_ids(3000), vectors)
+    _wait_trained(collection)
+
+    queries = _unit_vectors(20, seed=1)
+    for got, expected in zip(collection.search(queries, 10), _brute_force(collection, queries, 10)):
+        assert [item_id for item_id, _ in got] == [item_id for item_id, _ in expected]
+        assert np.allclose([score for _, score in got], [score for _, score in expected], atol=1e-5)
+
+
+def test_ivf_recall_with_partial_probing(small_train_size):
+    """ 只探查部分聚类时召回率仍然较高 """
+    vectors = _unit_vectors(4000)
+    collection = VectorCollection("ivf", "mini", INDEX_IVF, nlist=32, nprobe=8)
+    collection.upsert(_ids(4000), vectors)
+    _wait_trained(collection)
+
+    # 查询取集合中向量的近邻扰动，top-1 应当是原向量
+    queries = vectors[:200] + 0.05 * _unit_vectors(200, seed=2)
+    results = collection.search(queries, 1)
+    hits = sum(result[0][0] == str(i) for i, result in enumerate(results))
+    assert hits / 200 >= 0.95
+
+
+def test_ivf_probe_only_reads_probed_clusters(small_train_size):
+    """ nprobe=1 时返回的结果全部来自查询最近的聚类 """
+    collection = VectorCollection("ivf", "mini", INDEX_IVF, nlist=16, nprobe=1)
+    collection.upsert(_ids(3000), _unit_vectors(3000))
+    _wait_trained(collection)
+
+    queries = _unit_vectors(10, seed=3)
+    probes = collection._ivf.probe(queries, 1)
+    for q, result in enumerate(collection.search(queries, 50)):
+        rows = {collection._rows[item_id] for item_id, _ in result}
+        assert rows <= collection._ivf.lists[probes[q][0]]
+
+
+def test_search_does_not_train_under_the_lock(small_train_size, monkeypatch):
+    """ 训练在后台线程中进行，训练期间检索与写入不被阻塞 """
+    release = threading.Event()
+    original = vector_index._IVFIndex.train
+
+    def slow_train(self, sample, size):
+        release.wait(10)
+        original(self, sample, size)
+
+    monkeypatch.setattr(vector_index._IVFIndex, "train", slow_train)
+    collection = VectorCollection("ivf", "mini", INDEX_IVF, nlist=8, nprobe=8)
+    collection.upsert(_ids(2500), _unit_vectors(2500))
+    assert collection.stats()["ivf_training"]
+
+    start = time.perf_counter()
+    assert len(collection.search(_unit_vectors(1, seed=4), 5)[0]) == 5
+    collection.upsert(["extra"], _unit_vectors(1, seed=5))
+    assert time.perf_counter() - start < 1.0
+
+    release.set()
+    _wait_trained(collection)
+    _assert_lists_consistent(collection)
+
+
+def test_inverted_lists_follow_writes_during_and_after_training(small_train_size):
+    """ 训练期间与训练之后的写入、覆盖、删除都同步到倒排表 """
+    vectors = _unit_vectors(6000)
+    collection = VectorCollection("ivf", "mini", INDEX_IVF, nlist=16, nprobe=16)
+    collection.upsert(_ids(2500), vectors[:2500])
+    rng = np.random.default_rng(6)
+    start = 2500
+    while collection.stats()["ivf_training"] and start < 5000:
+        collection.delete([str(i) for i in rng.integers(0, start, 20)])
+        collection.upsert(_ids(50, "new") if start == 2500 else [str(i) for i in range(start, start + 50)],
+                          vectors[start:start + 50])
+        start += 50
+    _wait_trained(collection)
+    _assert_lists_consistent(collection)
+
+    collection.delete([str(i) for i in range(0, 2500, 3)])
+    collection.upsert(_ids(100), vectors[5000:5100])
+    _assert_lists_consistent(collection)
+
+    queries = _unit_vectors(5, seed=7)
+    for got, expected in zip(collection.search(queries, 10), _brute_force(collection, queries, 10)):
+        assert [item_id for item_id, _ in got] == [item_id for item_id, _ in expected]
+
+
+def _contents(collection):
+    found, vectors = collection.get(sorted(collection._rows))
+    return dict(zip(found, vectors.tolist()))
+
+
+def test_collections_are_shared_between_workers(tmp_path):
+    """ 两个注册表共享同一个目录（相当于两个工作进程）：一边的写入、删除与删除集合另一边都能读到 """
+    worker_a, worker_b = VectorStore(str(tmp_path)), VectorStore(str(tmp_path))
+    worker_a.create("goods", "mini")
+    vectors = _unit_vectors(10, 8)
+    worker_a.get("goods").upsert([f"id{i}" for i in range(10)], vectors)
+
+    collection = worker_b.get("goods")
+    assert len(collection) == 10
+    assert collection.search(vectors[3], 1)[0][0][0] == "id3"
+
+    worker_b.get("goods").delete(["id3"])
+    worker_b.get("goods").upsert(["id0"], _unit_vectors(1, 8, 1))
+    assert _contents(worker_a.get("goods")) == _contents(worker_b.get("goods"))
+    assert "id3" not in _contents(worker_a.get("goods"))
+
+    with pytest.raises(ValidationException):
+        worker_b.get("goods").upsert(["id1"], _unit_vectors(1, 8), overwrite=False)
+    with pytest.raises(BasRequestException):
+        worker_b.create("goods", "mini")
+    assert [stats["name"] for stats in worker_b.list()] == ["goods"]
+
+    worker_b.drop("goods")
+    with pytest.raises(NotFoundException):
+        worker_a.get("goods")
+
+
+def test_collections_survive_restart_and_compaction(tmp_path, monkeypatch):
+    """ 日志合并为快照后，其他进程与重新启动的进程加载到相同的内容 """
+    monkeypatch.setattr(vector_index, "_COMPACT_MIN_BYTES", 1024)
+    worker_a, worker_b = VectorStore(str(tmp_path)), VectorStore(str(tmp_path))
+    worker_a.create("goods", "mini", INDEX_IVF)
+    worker_b.get("goods")
+    for batch in range(20):
+        store = worker_a if batch % 2 else worker_b
+        store.get("goods").upsert([f"id{batch}-{i}" for i in range(5)], _unit_vectors(5, 8, batch))
+        store.get("goods").delete([f"id{batch - 1}-0"])
+
+    assert worker_a.get("goods")._journal.generation > 0
+    expected = _contents(worker_a.get("goods"))
+    assert len(expected) == 20 * 5 - 19
+    assert _contents(worker_b.get("goods")) == expected
+    assert _contents(VectorStore(str(tmp_path)).get("goods")) == expected
+    # 旧的快照与日志已经删除
+    assert len(list(tmp_path.glob("*.npz"))) == 1 and len(list(tmp_path.glob("*.log"))) == 1
+
+
+def test_incomplete_log_record_is_ignored(tmp_path):
+    """ 写入进程崩溃留下的不完整记录不会被重放，下一次写入前截断 """
+    store = VectorStore(str(tmp_path))
+    store.create("goods", "mini")
+    store.get("goods").upsert(["a", "b"], _unit_vectors(2, 8))
+    log_path = next(tmp_path.glob("*.log"))
+    with open(log_path, "ab") as f:
+        f.write(b"\x01\x02\x00")
+
+    restarted = VectorStore(str(tmp_path))
+    assert sorted(_contents(restarted.get("goods"))) == ["a", "b"]
+    restarted.get("goods").upsert(["c"], _unit_vectors(1, 8))
+    assert sorted(_contents(VectorStore(str(tmp_path)).get("goods"))) == ["a", "b", "c"]